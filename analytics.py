@@ -0,0 +1,120 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from models import FeedDailyStats, RSSFeed, db
+from feed_deletion import active_feeds_filter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Longest window the analytics API accepts, in days
+MAX_DAYS = 731
+
+def window(days, end=None):
+    """First and last day of the `days` days ending with `end`, today by default"""
+    end = end or datetime.utcnow().date()
+    return end - timedelta(days=days - 1), end
+
+def daily_counts(start, end, feed_ids=None):
+    """Articles per feed and day from `start` to `end`, read from the rollups.
+
+    Returns (feed ids, counts) with one row of counts per feed, one column
+    per day; feeds without articles in the window get a row of zeros. The
+    rows are a numpy array when numpy is installed, lists otherwise.
+    """
+    feeds = select(RSSFeed.id).where(active_feeds_filter).order_by(RSSFeed.id)
+    stats = select(FeedDailyStats.feed_id, FeedDailyStats.day, FeedDailyStats.articles) \
+        .join(RSSFeed, RSSFeed.id == FeedDailyStats.feed_id) \
+        .where(active_feeds_filter, FeedDailyStats.day >= start, FeedDailyStats.day <= end)
+    if feed_ids is not None:
+        feeds = feeds.where(RSSFeed.id.in_(feed_ids))
+        stats = stats.where(FeedDailyStats.feed_id.in_(feed_ids))
+    ids = db.session.scalars(feeds).all()
+    rows = db.session.execute(stats).all()
+    days = (end - start).days + 1
+
+    if np is not None:
+        counts = np.zeros((len(ids), days), dtype=np.int64)
+        if rows:
+            feed_column, day_column, article_column = zip(*rows)
+            # Rollup rows are unique per (feed, day), so a plain scatter fills the matrix
+            counts[np.searchsorted(np.asarray(ids), feed_column),
+                   [(day - start).days for day in day_column]] = article_column
+        return ids, counts
+
+    index = {feed_id: i for i, feed_id in enumerate(ids)}
+    counts = [[0] * days for _ in ids]
+    for feed_id, day, articles in rows:
+        counts[index[feed_id]][(day - start).days] = articles
+    return ids, counts
+
+def sparklines(days):
+    """Daily article counts of every feed over the last `days` days"""
+    start, end = window(days)
+    ids, counts = daily_counts(start, end)
+    rows = counts.tolist() if np is not None else counts
+    return {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'feeds': {str(feed_id): row for feed_id, row in zip(ids, rows)}
+    }
+
+def _trend_columns(counts, days):
+    """Totals of the current and previous window and the daily slope of the current one"""
+    # Least-squares slope against the day number, centred so the intercept drops out
+    x = [day - (days - 1) / 2 for day in range(days)]
+    x_squares = sum(value * value for value in x) or 1
+    if np is not None:
+        previous = counts[:, :days].sum(axis=1)
+        current = counts[:, days:].sum(axis=1)
+        slope = counts[:, days:] @ np.asarray(x) / x_squares
+        return current.tolist(), previous.tolist(), slope.tolist()
+    previous = [sum(row[:days]) for row in counts]
+    current = [sum(row[days:]) for row in counts]
+    slope = [sum(count * weight for count, weight in zip(row[days:], x)) / x_squares for row in counts]
+    return current, previous, slope
+
+def trends(days, order='slowing', limit=50):
+    """Feeds whose output changed most between the last `days` days and the `days` before.
+
+    'slowing' lists the largest drops first, 'growing' the largest rises.
+    """
+    start, end = window(2 * days)
+    ids, counts = daily_counts(start, end)
+    current, previous, slope = _trend_columns(counts, days)
+    feeds = dict(db.session.execute(
+        select(RSSFeed.id, RSSFeed.title).where(RSSFeed.id.in_(ids))
+    ).all()) if ids else {}
+
+    rows = []
+    for feed_id, now, before, per_day in zip(ids, current, previous, slope):
+        rows.append({
+            'id': feed_id,
+            'title': feeds.get(feed_id),
+            'current': now,
+            'previous': before,
+            'change': now - before,
+            'change_percent': round(100 * (now - before) / before, 1) if before else None,
+            'daily_slope': round(per_day, 4)
+        })
+    rows.sort(key=lambda row: (row['change'], row['id']), reverse=order == 'growing')
+    return {
+        'current_start': (end - timedelta(days=days - 1)).isoformat(),
+        'previous_start': start.isoformat(),
+        'end': end.isoformat(),
+        'feeds': rows[:limit]
+    }
+
+def feed_history(feed_id, days):
+    """Daily article counts of one feed over the last `days` days"""
+    start, end = window(days)
+    _, counts = daily_counts(start, end, feed_ids=[feed_id])
+    row = (counts.tolist() if np is not None else counts)[0] if len(counts) else [0] * days
+    return {
+        'id': feed_id,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'counts': row,
+        'total': sum(row)
+    }
@@ -0,0 +1,48 @@
+import gzip
+import json
+from flask import Response, request
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Response formats, negotiated with the Accept header. Plain JSON keeps the
+# original row-per-object shape; the compact formats send one array per column.
+JSON = 'application/json'
+COLUMNAR_JSON = 'application/vnd.rss-feed-manager.columnar+json'
+MSGPACK = 'application/x-msgpack'
+
+# Smaller bodies are sent uncompressed
+GZIP_MIN_BYTES = 1024
+GZIP_LEVEL = 6
+
+def negotiate_format():
+    """Pick the response format from the Accept header, defaulting to plain JSON"""
+    offered = [JSON, COLUMNAR_JSON]
+    if msgpack is not None:
+        offered.append(MSGPACK)
+    return request.accept_mimetypes.best_match(offered, default=JSON)
+
+def is_columnar(response_format):
+    return response_format in (COLUMNAR_JSON, MSGPACK)
+
+def columnar(rows, columns):
+    """Turn a list of dicts into {'count': n, 'columns': {name: [values]}}"""
+    return {
+        'count': len(rows),
+        'columns': {column: [row[column] for row in rows] for column in columns}
+    }
+
+def encode_response(payload, response_format, status=200):
+    """Serialize `payload` in the negotiated format, gzipped if the client accepts it"""
+    if response_format == MSGPACK:
+        body = msgpack.packb(payload, use_bin_type=True)
+    else:
+        body = json.dumps(payload, separators=(',', ':')).encode('utf-8')
+
+    headers = {'Vary': 'Accept, Accept-Encoding'}
+    if len(body) >= GZIP_MIN_BYTES and 'gzip' in request.accept_encodings:
+        body = gzip.compress(body, compresslevel=GZIP_LEVEL)
+        headers['Content-Encoding'] = 'gzip'
+    return Response(body, status=status, mimetype=response_format, headers=headers)
@@ -1,9 +1,12 @@
 import os
+import sqlite3
 from datetime import datetime
 from flask import Flask
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_migrate import Migrate
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 from sqlalchemy.orm import DeclarativeBase
 import logging
 
@@ -14,6 +17,12 @@ db = SQLAlchemy(model_class=Base)
 login_manager = LoginManager()
 migrate = Migrate()
 
+@event.listens_for(Engine, "connect")
+def _sqlite_wal(dbapi_connection, connection_record):
+    # WAL lets readers (exports, online backups) run without blocking the scanner's commits
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute('PRAGMA journal_mode=WAL')
+
 def create_app():
     # Create app
     app = Flask(__name__)
@@ -22,8 +31,11 @@ def create_app():
     os.makedirs(app.instance_path, exist_ok=True)
 
     app.secret_key = os.environ.get("FLASK_SECRET_KEY") or "venture_weekly_secret"
-    # Configure SQLite database in instance folder
-    app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(app.instance_path, 'rss_feeds.db')}"
+    # Configure SQLite database in instance folder unless DATABASE_URL points elsewhere
+    app.config["SQLALCHEMY_DATABASE_URI"] = (
+        os.environ.get("DATABASE_URL")
+        or f"sqlite:///{os.path.join(app.instance_path, 'rss_feeds.db')}"
+    )
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
         "pool_pre_ping": True,
@@ -44,9 +56,15 @@ def create_app():
     # Import routes after app initialization to avoid circular imports
     from auth import auth_bp
     from feed_manager import feed_bp
+    from metrics import metrics_bp, instrument_blueprint
+    from profiling import profiling_bp, init_profiling
 
+    instrument_blueprint(feed_bp)
+    init_profiling(app)
     app.register_blueprint(auth_bp)
     app.register_blueprint(feed_bp)
+    app.register_blueprint(metrics_bp)
+    app.register_blueprint(profiling_bp)
 
     @app.template_filter('relative_time')
     def relative_time(date):
@@ -0,0 +1,242 @@
+"""Online backups of the SQLite database.
+
+Usage:
+    python backup.py create             take a backup now
+    python backup.py list               list the backups, newest first
+    python backup.py verify <file>      check the integrity of a backup
+    python backup.py restore <file>     replace the database with a backup (stop the service first)
+"""
+import argparse
+import fcntl
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+from sqlalchemy.engine import make_url
+import metrics
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'backups')
+LOCK_FILE = os.path.join(BACKUP_DIR, 'backup.lock')
+
+# Scheduled backups are off when set to 0
+BACKUP_INTERVAL_HOURS = float(os.environ.get('BACKUP_INTERVAL_HOURS', 24))
+# Newest backups kept, older ones are deleted after each backup
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 7))
+
+COMPRESS_LEVEL = 6
+COPY_CHUNK_SIZE = 1024 * 1024
+SQLITE_TIMEOUT = 30
+
+class BackupError(Exception):
+    pass
+
+def database_path(uri):
+    """Path of the SQLite database behind `uri`, or None for other databases"""
+    url = make_url(uri)
+    if not url.drivername.startswith('sqlite') or url.database in (None, '', ':memory:'):
+        return None
+    return url.database
+
+def _backup_name(now):
+    return f"rss_feeds-{now.strftime('%Y%m%dT%H%M%SZ')}.db.gz"
+
+def list_backups():
+    """Backup files, newest first"""
+    try:
+        names = [name for name in os.listdir(BACKUP_DIR) if name.startswith('rss_feeds-') and name.endswith('.db.gz')]
+    except FileNotFoundError:
+        return []
+    return [os.path.join(BACKUP_DIR, name) for name in sorted(names, reverse=True)]
+
+def _copy_online(source_path, target_path):
+    """Copy the live database from one read transaction. Returns the pages copied.
+
+    The database must be in WAL mode, where that reader does not hold off the
+    scanner's commits. In rollback-journal mode it would, so no backup is taken.
+    """
+    source = sqlite3.connect(f'file:{source_path}?mode=ro', uri=True, timeout=SQLITE_TIMEOUT)
+    target = sqlite3.connect(target_path)
+    try:
+        journal_mode = source.execute('PRAGMA journal_mode').fetchone()[0]
+        if journal_mode != 'wal':
+            raise BackupError(f"Database is in {journal_mode} journal mode, a backup would block writers; "
+                              f"start the application once to switch it to WAL")
+        # One step: a step-wise copy restarts on every write by another connection
+        source.backup(target)
+        # A standalone file, readable without -wal and -shm files next to it
+        target.execute('PRAGMA journal_mode=DELETE')
+        return target.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+
+def integrity_check(path):
+    """Problems SQLite finds in the database at `path`, an empty list when it is sound"""
+    connection = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        problems = [row[0] for row in connection.execute('PRAGMA integrity_check')]
+    except sqlite3.DatabaseError as e:
+        return [str(e)]
+    finally:
+        connection.close()
+    return [] if problems == ['ok'] else problems
+
+def _compress(source_path, target_path):
+    with open(source_path, 'rb') as source, gzip.open(target_path, 'wb', compresslevel=COMPRESS_LEVEL) as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+
+def _decompress(source_path, target_path):
+    with gzip.open(source_path, 'rb') as source, open(target_path, 'wb') as target:
+        shutil.copyfileobj(source, target, COPY_CHUNK_SIZE)
+
+def _rotate(keep):
+    for path in list_backups()[keep:]:
+        os.remove(path)
+        logging.info(f"Deleted old database backup {path}")
+
+def create_backup(database, keep=BACKUP_KEEP):
+    """Back up the database at path `database` into BACKUP_DIR.
+
+    The copy is checked with PRAGMA integrity_check before it is compressed
+    and kept. Returns a summary of the backup.
+    """
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    path = os.path.join(BACKUP_DIR, _backup_name(now))
+    with tempfile.TemporaryDirectory(dir=BACKUP_DIR) as scratch:
+        copy = os.path.join(scratch, 'copy.db')
+        pages = _copy_online(database, copy)
+        copied = time.perf_counter()
+        problems = integrity_check(copy)
+        if problems:
+            raise BackupError(f"Backup copy failed the integrity check: {'; '.join(problems[:5])}")
+        database_bytes = os.path.getsize(copy)
+        compressed = os.path.join(scratch, 'copy.db.gz')
+        _compress(copy, compressed)
+        os.replace(compressed, path)
+    _rotate(keep)
+
+    duration = time.perf_counter() - started
+    backup_bytes = os.path.getsize(path)
+    metrics.BACKUP_DURATION_SECONDS.set(duration)
+    metrics.BACKUP_BYTES.set(backup_bytes)
+    metrics.BACKUP_LAST_SUCCESS.set(time.time())
+    summary = {
+        'path': path,
+        'pages': pages,
+        'database_bytes': database_bytes,
+        'backup_bytes': backup_bytes,
+        'copy_seconds': round(copied - started, 3),
+        'duration': round(duration, 3),
+        'throughput_mb_s': round(database_bytes / 1e6 / duration, 2) if duration else None
+    }
+    logging.info(f"Database backup {path}: {database_bytes / 1e6:.1f} MB in {duration:.1f}s "
+                 f"({summary['throughput_mb_s']} MB/s, copy {summary['copy_seconds']}s), "
+                 f"compressed to {backup_bytes / 1e6:.1f} MB")
+    return summary
+
+def _backup_age_hours():
+    backups = list_backups()
+    if not backups:
+        return None
+    return (time.time() - os.path.getmtime(backups[0])) / 3600
+
+def scheduled_backup(database):
+    """Take a backup unless another process is taking one or the last is recent enough"""
+    if database is None:
+        logging.info("Database backups only support SQLite, skipping")
+        return None
+    os.makedirs(BACKUP_DIR, exist_ok=True)
+    with open(LOCK_FILE, 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return None
+        try:
+            age = _backup_age_hours()
+            # Every worker runs the job; the first one due takes the backup
+            if age is not None and age < BACKUP_INTERVAL_HOURS * 0.9:
+                return None
+            return create_backup(database)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def verify_backup(path):
+    """Decompress a backup to a scratch file and return the problems of the integrity check"""
+    with tempfile.TemporaryDirectory() as scratch:
+        copy = os.path.join(scratch, 'verify.db')
+        _decompress(path, copy)
+        return integrity_check(copy)
+
+def restore_backup(path, database):
+    """Replace the database file with a backup; the service must be stopped.
+
+    The current database is kept next to it as <name>.pre-restore-<time>.
+    Returns the path of that copy, or None if there was no database.
+    """
+    for suffix in ('-journal', '-wal'):
+        if os.path.exists(database + suffix):
+            raise BackupError(f"{database + suffix} exists: stop the service before restoring")
+    directory = os.path.dirname(os.path.abspath(database))
+    with tempfile.TemporaryDirectory(dir=directory) as scratch:
+        copy = os.path.join(scratch, 'restore.db')
+        _decompress(path, copy)
+        problems = integrity_check(copy)
+        if problems:
+            raise BackupError(f"{path} failed the integrity check: {'; '.join(problems[:5])}")
+        previous = None
+        if os.path.exists(database):
+            previous = f"{database}.pre-restore-{datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')}"
+            os.replace(database, previous)
+        os.replace(copy, database)
+    return previous
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('create', help='take a backup now')
+    commands.add_parser('list', help='list the backups, newest first')
+    for name in ('verify', 'restore'):
+        command = commands.add_parser(name)
+        command.add_argument('file', help='backup file (.db.gz)')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'list':
+            for path in list_backups():
+                print(f"{path}\t{os.path.getsize(path) / 1e6:.1f} MB")
+            return 0
+        if args.command == 'verify':
+            problems = verify_backup(args.file)
+            print('ok' if not problems else '\n'.join(problems))
+            return 1 if problems else 0
+
+        from app import app
+        database = database_path(app.config['SQLALCHEMY_DATABASE_URI'])
+        if database is None:
+            print("Error: backups only support SQLite databases")
+            return 1
+        if args.command == 'create':
+            summary = create_backup(database)
+            print(f"Backup written to {summary['path']}: {summary['database_bytes'] / 1e6:.1f} MB in "
+                  f"{summary['duration']}s ({summary['throughput_mb_s']} MB/s), "
+                  f"compressed to {summary['backup_bytes'] / 1e6:.1f} MB")
+        else:
+            previous = restore_backup(args.file, database)
+            print(f"Database restored from {args.file}")
+            if previous:
+                print(f"Previous database kept as {previous}")
+    except (BackupError, OSError, sqlite3.Error) as e:
+        print(f"Error: {str(e)}")
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,125 @@
+import os
+from flask import Response, stream_with_context
+from sqlalchemy import select
+from models import Article, RSSFeed, db
+from feed_deletion import active_feeds_filter
+from text_normalize import html_to_text, plain_title
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+# Articles read from the database and written at a time: one Parquet row
+# group or Arrow record batch, so memory stays bounded whatever the export size
+ROW_GROUP_SIZE = int(os.environ.get('COLUMNAR_EXPORT_ROW_GROUP_SIZE', 10000))
+
+# Format: (mimetype, file extension)
+COLUMNAR_FORMATS = {
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows')
+}
+
+_COLUMNS = (
+    ('id', Article.id),
+    ('feed_id', Article.feed_id),
+    ('feed_title', RSSFeed.title),
+    ('feed_title_text', RSSFeed.title_text),
+    ('feed_url', RSSFeed.url),
+    ('title', Article.title),
+    ('title_text', Article.title_text),
+    ('link', Article.link),
+    ('description_html', Article.description),
+    ('description_text', Article.description_text),
+    ('published_date', Article.published_date),
+    ('collected_date', Article.collected_date)
+)
+
+def available():
+    return pa is not None
+
+def _schema():
+    return pa.schema([
+        ('id', pa.int64()),
+        ('feed_id', pa.int64()),
+        ('feed_title', pa.string()),
+        ('feed_url', pa.string()),
+        ('title', pa.string()),
+        ('link', pa.string()),
+        ('description', pa.string()),
+        ('description_html', pa.string()),
+        ('published_date', pa.timestamp('us')),
+        ('collected_date', pa.timestamp('us'))
+    ])
+
+class _Sink:
+    """Write-only file collecting what the writer emits until it is drained"""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+def _record_batches(conditions, schema):
+    """Articles matching `conditions` with their feed, one record batch per id-ordered chunk"""
+    query = select(*(column for _, column in _COLUMNS)) \
+        .join(RSSFeed, RSSFeed.id == Article.feed_id) \
+        .where(active_feeds_filter, *conditions) \
+        .order_by(Article.id) \
+        .limit(ROW_GROUP_SIZE)
+    last_id = 0
+    while True:
+        rows = db.session.execute(query.where(Article.id > last_id)).all()
+        if not rows:
+            return
+        last_id = rows[-1].id
+        columns = dict(zip((name for name, _ in _COLUMNS), zip(*rows)))
+        # Plain text stored at ingest, converted the same way for rows not yet backfilled
+        for name in ('title', 'feed_title'):
+            columns[name] = [plain if plain is not None else plain_title(text)
+                             for text, plain in zip(columns[name], columns.pop(f'{name}_text'))]
+        columns['description'] = [plain if plain is not None else html_to_text(html)
+                                  for html, plain in zip(columns['description_html'],
+                                                         columns.pop('description_text'))]
+        yield pa.record_batch([pa.array(columns[field.name], field.type) for field in schema], schema=schema)
+
+def _generate(conditions, export_format):
+    schema = _schema()
+    sink = _Sink()
+    if export_format == 'parquet':
+        writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), schema, compression='zstd')
+    else:
+        writer = pa.ipc.new_stream(pa.PythonFile(sink, mode='w'), schema)
+    for batch in _record_batches(conditions, schema):
+        writer.write_batch(batch)
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+def columnar_response(conditions, export_format, download_name='articles'):
+    """Stream the articles matching the SQL `conditions` as Parquet or an Arrow IPC stream"""
+    mimetype, extension = COLUMNAR_FORMATS[export_format]
+    return Response(stream_with_context(_generate(conditions, export_format)), mimetype=mimetype, headers={
+        'Content-Disposition': f'attachment; filename={download_name}.{extension}'
+    })
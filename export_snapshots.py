@@ -0,0 +1,298 @@
+import csv
+import fcntl
+import hashlib
+import io
+import logging
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import Response, request, send_file, stream_with_context
+from sqlalchemy import func, select
+from sqlalchemy.exc import SQLAlchemyError
+from models import Article, RSSFeed, db
+from text_normalize import clean_text
+
+# Daily article export files, one per published day and format. Files only
+# ever grow: the scanner appends the articles it stored since the last call.
+EXPORT_DIR = os.environ.get('EXPORT_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'exports')
+LOCK_FILE = os.path.join(EXPORT_DIR, 'exports.lock')
+# Id of the last article appended to the day files, then the lower ids not
+# committed yet when it was passed, each with the time it was first missed
+WATERMARK_FILE = os.path.join(EXPORT_DIR, 'watermark')
+# How long a missing id is looked for. Sequence ids (PostgreSQL) are handed out
+# before commit, so with several scanner nodes a lower id can commit after a
+# higher one; ids of rolled-back inserts never show up and expire.
+GAP_SECONDS = int(os.environ.get('EXPORT_GAP_SECONDS', 300))
+# Larger jumps are taken as a moved sequence rather than ids in flight
+MAX_GAP = 10000
+
+# Longer date ranges are exported straight from the database
+MAX_SNAPSHOT_DAYS = int(os.environ.get('EXPORT_SNAPSHOT_MAX_DAYS', 92))
+
+# Rows read from the database at a time
+BATCH_SIZE = 1000
+READ_CHUNK_SIZE = 64 * 1024
+
+def export_text(text, plain):
+    """The plain text stored at ingest, normalizing rows not yet backfilled"""
+    return plain if plain is not None else clean_text(text)
+
+def _text_lines(rows):
+    return ''.join(f"{title}~{link}\n" for title, link, _ in rows)
+
+def _csv_lines(rows):
+    out = io.StringIO()
+    csv.writer(out).writerows(
+        (title, link, published.isoformat() if published else '') for title, link, published in rows
+    )
+    return out.getvalue()
+
+# Export formats: header line and row formatter. 'txt' is the original
+# `Title~Link` layout, still served as articles.csv.
+EXPORT_FORMATS = {
+    'txt': ('Title~Link\n', _text_lines),
+    'csv': ('Title,Link,Published\r\n', _csv_lines)
+}
+
+EXPORT_COLUMNS = (Article.title, Article.title_text, Article.link, Article.published_date)
+
+def _exported(query):
+    """Leave out the articles of feeds being deleted (feed_deletion.active_feeds_filter,
+    which imports this module)"""
+    return query.join(RSSFeed, RSSFeed.id == Article.feed_id).where(RSSFeed.deleted_at.is_(None))
+
+def export_rows(rows):
+    """(title, link, published) tuples from rows selected with EXPORT_COLUMNS"""
+    return [(export_text(title, title_text), link, published) for title, title_text, link, published in rows]
+
+def format_rows(rows, export_format):
+    return EXPORT_FORMATS[export_format][1](export_rows(rows))
+
+def _day_path(day, export_format):
+    return os.path.join(EXPORT_DIR, f'articles-{day.isoformat()}.{export_format}')
+
+@contextmanager
+def _locked():
+    """Exclusive lock over the export files, shared by every process"""
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    with open(LOCK_FILE, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def _read_watermark():
+    """(watermark, {missing id: first missed}), or None before the first use"""
+    try:
+        with open(WATERMARK_FILE) as f:
+            lines = f.read().split('\n')
+        gaps = {}
+        for line in lines[1:]:
+            if line:
+                article_id, missed_at = line.split()
+                gaps[int(article_id)] = float(missed_at)
+        return int(lines[0]), gaps
+    except (OSError, ValueError):
+        return None
+
+def _write_watermark(article_id, gaps):
+    tmp_file = f'{WATERMARK_FILE}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(str(article_id) + '\n')
+        f.writelines(f'{gap} {missed_at}\n' for gap, missed_at in gaps.items())
+    os.replace(tmp_file, WATERMARK_FILE)
+
+def _append_rows(rows):
+    """Append (id, deleted_at, *EXPORT_COLUMNS) rows to the existing files of their day"""
+    by_day = defaultdict(list)
+    for _, deleted_at, *columns in rows:
+        if deleted_at is None and columns[-1] is not None:
+            by_day[columns[-1].date()].append(columns)
+    for day, day_rows in by_day.items():
+        for export_format in EXPORT_FORMATS:
+            path = _day_path(day, export_format)
+            if os.path.exists(path):
+                with open(path, 'a', encoding='utf-8', newline='') as f:
+                    f.write(format_rows(day_rows, export_format))
+
+def _append_new(watermark, gaps):
+    """Append the articles above `watermark`, and those of `gaps` committed since,
+    to the existing files of their day.
+
+    Days without a file are skipped, their file is built from the database
+    when first requested. Returns the new watermark and gaps.
+    """
+    # Articles of feeds being deleted still count as seen, they are not gaps
+    query = select(Article.id, RSSFeed.deleted_at, *EXPORT_COLUMNS) \
+        .join(RSSFeed, RSSFeed.id == Article.feed_id) \
+        .order_by(Article.id)
+    now = time.time()
+    gaps = {gap: missed_at for gap, missed_at in gaps.items() if now - missed_at < GAP_SECONDS}
+    pending = sorted(gaps)
+    for i in range(0, len(pending), BATCH_SIZE):
+        rows = db.session.execute(query.where(Article.id.in_(pending[i:i + BATCH_SIZE]))).all()
+        _append_rows(rows)
+        for row in rows:
+            del gaps[row.id]
+
+    while True:
+        rows = db.session.execute(query.where(Article.id > watermark).limit(BATCH_SIZE)).all()
+        if not rows:
+            _write_watermark(watermark, gaps)
+            return watermark, gaps
+
+        _append_rows(rows)
+        previous = watermark
+        for row in rows:
+            if row.id - previous <= MAX_GAP:
+                gaps.update((gap, now) for gap in range(previous + 1, row.id))
+            previous = row.id
+        watermark = rows[-1].id
+        _write_watermark(watermark, gaps)
+
+def _build_day(day, export_format, watermark, gaps):
+    """Write the file of a day from the articles up to `watermark`, less the `gaps`
+    that _append_new will add when they commit"""
+    path = _day_path(day, export_format)
+    tmp_file = f'{path}.{os.getpid()}.tmp'
+    query = _exported(select(*EXPORT_COLUMNS)) \
+        .where(Article.published_date >= datetime.combine(day, datetime.min.time()),
+               Article.published_date < datetime.combine(day + timedelta(days=1), datetime.min.time()),
+               Article.id <= watermark) \
+        .order_by(Article.id) \
+        .execution_options(yield_per=BATCH_SIZE)
+    if gaps:
+        query = query.where(Article.id.notin_(list(gaps)))
+    header, _ = EXPORT_FORMATS[export_format]
+    with open(tmp_file, 'w', encoding='utf-8', newline='') as f:
+        f.write(header)
+        for rows in db.session.execute(query).partitions():
+            f.write(format_rows(rows, export_format))
+    os.replace(tmp_file, path)
+
+def _catch_up():
+    """Bring the day files up to date, returning the watermark and gaps"""
+    state = _read_watermark()
+    if state is None:
+        # First use: there are no day files to append to yet
+        watermark = db.session.scalar(select(func.max(Article.id))) or 0
+        _write_watermark(watermark, {})
+        return watermark, {}
+    return _append_new(*state)
+
+def append_new_articles():
+    """Bring the day files up to date with the articles stored since the last call"""
+    try:
+        with _locked():
+            _catch_up()
+    except (OSError, SQLAlchemyError) as e:
+        db.session.rollback()
+        logging.error(f"Error appending articles to export snapshots: {str(e)}")
+
+def discard_snapshots():
+    """Delete every day file, for when stored articles were removed; they are rebuilt on demand"""
+    try:
+        with _locked():
+            for name in os.listdir(EXPORT_DIR):
+                if name.startswith('articles-'):
+                    os.remove(os.path.join(EXPORT_DIR, name))
+    except OSError as e:
+        logging.error(f"Error discarding export snapshots: {str(e)}")
+
+def snapshot_files(days, export_format):
+    """Up-to-date files of complete days, building the missing ones"""
+    with _locked():
+        watermark, gaps = _catch_up()
+        paths = []
+        for day in days:
+            path = _day_path(day, export_format)
+            if not os.path.exists(path):
+                _build_day(day, export_format, watermark, gaps)
+            paths.append(path)
+        return paths
+
+def snapshot_days(start_date, end_date):
+    """The days of a download served from snapshots, or None to export from the database.
+
+    Only ranges given as two plain dates (YYYY-MM-DD) of at most
+    MAX_SNAPSHOT_DAYS days qualify.
+    """
+    if not start_date or not end_date:
+        return None
+    try:
+        first = datetime.strptime(start_date, '%Y-%m-%d').date()
+        last = datetime.strptime(end_date, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+    count = (last - first).days + 1
+    if count > MAX_SNAPSHOT_DAYS:
+        return None
+    return [first + timedelta(days=n) for n in range(max(count, 0))]
+
+def _database_day_rows(day, export_format):
+    query = _exported(select(*EXPORT_COLUMNS)) \
+        .where(Article.published_date >= datetime.combine(day, datetime.min.time()),
+               Article.published_date < datetime.combine(day + timedelta(days=1), datetime.min.time())) \
+        .order_by(Article.id) \
+        .execution_options(yield_per=BATCH_SIZE)
+    for rows in db.session.execute(query).partitions():
+        yield format_rows(rows, export_format).encode('utf-8')
+
+def _file_body(path, start, end):
+    # Stops at `end`, the size announced in the headers, even if the file grew since
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while start < end:
+            chunk = f.read(min(READ_CHUNK_SIZE, end - start))
+            if not chunk:
+                break
+            start += len(chunk)
+            yield chunk
+
+def snapshot_response(days, export_format, download_name='articles.csv'):
+    """Serve the articles published on `days`.
+
+    Complete days come from their files: a single day is sent as is, with
+    sendfile where the server supports it, Range and conditional requests.
+    Several complete days are streamed one file after another and still
+    answer Range and conditional requests. Today and later days are read
+    from the database.
+    """
+    today = datetime.utcnow().date()
+    complete = [day for day in days if day < today]
+    paths = dict(zip(complete, snapshot_files(complete, export_format)))
+
+    if len(days) == 1 and complete:
+        return send_file(paths[days[0]], mimetype='text/csv', as_attachment=True,
+                         download_name=download_name, conditional=True)
+
+    header = EXPORT_FORMATS[export_format][0].encode('utf-8')
+    stats = {day: os.stat(path) for day, path in paths.items()}
+
+    def generate():
+        yield header
+        for day in days:
+            if day in paths:
+                yield from _file_body(paths[day], len(header), stats[day].st_size)
+            else:
+                yield from _database_day_rows(day, export_format)
+
+    body = generate()
+    if len(complete) < len(days):
+        # Only the days read from the database need the app context
+        body = stream_with_context(body)
+    response = Response(body, mimetype='text/csv', headers={
+        'Content-Disposition': f'attachment; filename={download_name}'
+    })
+    if len(complete) == len(days):
+        signature = ';'.join(f'{day}:{stat.st_size}:{stat.st_mtime_ns}' for day, stat in stats.items())
+        response.set_etag(hashlib.sha256(signature.encode()).hexdigest()[:32])
+        if stats:
+            response.last_modified = max(stat.st_mtime for stat in stats.values())
+        response.content_length = len(header) + sum(stat.st_size - len(header) for stat in stats.values())
+        response.make_conditional(request, accept_ranges=True, complete_length=response.content_length)
+    return response
@@ -0,0 +1,187 @@
+import xml.etree.ElementTree as ET
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+# Private feedparser helpers, kept in step with it by the <7 cap in pyproject.toml
+from feedparser.mixin import _cp1252, _FeedParserMixin
+from feedparser.sanitizer import _sanitize_html
+from feed_parser import FeedEntry, ParsedFeed
+from text_normalize import html_to_text, plain_title
+
+ATOM_NS = '{http://www.w3.org/2005/Atom}'
+XML_BASE = '{http://www.w3.org/XML/1998/namespace}base'
+CONTENT_ENCODED = '{http://purl.org/rss/1.0/modules/content/}encoded'
+
+# Size of the slices fed to the incremental parser; early stops happen between slices
+FEED_CHUNK_SIZE = 16 * 1024
+
+class FastParseError(Exception):
+    """Raised when a document needs feedparser's tolerant pipeline"""
+
+def _to_utc_naive(value):
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def _parse_rfc822_date(text):
+    try:
+        return _to_utc_naive(parsedate_to_datetime(text))
+    except (TypeError, ValueError, IndexError):
+        raise FastParseError(f"Unsupported date format: {text}")
+
+def _parse_iso_date(text):
+    try:
+        return _to_utc_naive(datetime.fromisoformat(text))
+    except ValueError:
+        raise FastParseError(f"Unsupported date format: {text}")
+
+def _clean_text(text):
+    return text.strip().translate(_cp1252) if text else ''
+
+def _clean_rss_text(text):
+    """RSS titles are plain text unless they look like HTML, as in feedparser"""
+    text = _clean_text(text)
+    if text and _FeedParserMixin.looks_like_html(text):
+        text = _sanitize_html(text, 'utf-8', 'text/html')
+    return text
+
+def _clean_rss_html(text):
+    """RSS descriptions are always treated as HTML"""
+    text = _clean_text(text)
+    if '<' in text or '&' in text:
+        text = _sanitize_html(text, 'utf-8', 'text/html')
+    return text
+
+def _clean_atom_text(element):
+    if element is None:
+        return ''
+    content_type = element.get('type', 'text')
+    if content_type in ('xhtml', 'application/xhtml+xml') or len(element):
+        raise FastParseError("Inline XHTML content")
+    text = _clean_text(element.text)
+    if content_type in ('html', 'text/html') and text:
+        text = _sanitize_html(text, 'utf-8', 'text/html')
+    return text
+
+def _note_feed_link(element, feed_links):
+    """Remember the first feed-level link of each rel, for WebSub hub discovery"""
+    rel = element.get('rel')
+    href = _clean_text(element.get('href'))
+    if rel and href:
+        feed_links.setdefault(rel, href)
+
+def _rss_entry(item):
+    title = _clean_rss_text(item.findtext('title'))
+    link = _clean_text(item.findtext('link'))
+    if not link:
+        guid = item.find('guid')
+        if guid is not None and guid.get('isPermaLink', 'true') == 'true':
+            link = _clean_text(guid.text)
+
+    pub_date = item.findtext('pubDate')
+    published = _parse_rfc822_date(pub_date.strip()) if pub_date and pub_date.strip() else None
+
+    # Like feedparser, the full content stands in for a missing description
+    description = item.find('description')
+    if description is None:
+        description = item.find(CONTENT_ENCODED)
+    description = _clean_rss_html(description.text if description is not None else None)
+
+    return title, link, description, published
+
+def _atom_entry(entry):
+    title = _clean_atom_text(entry.find(f'{ATOM_NS}title'))
+
+    link = ''
+    for link_element in entry.iterfind(f'{ATOM_NS}link'):
+        if link_element.get('rel', 'alternate') == 'alternate':
+            link = _clean_text(link_element.get('href'))
+            break
+    if link and '://' not in link:
+        # Relative links need xml:base resolution
+        raise FastParseError("Relative entry link")
+
+    summary = entry.find(f'{ATOM_NS}summary')
+    if summary is None:
+        summary = entry.find(f'{ATOM_NS}content')
+    description = _clean_atom_text(summary)
+
+    published_text = entry.findtext(f'{ATOM_NS}published') or entry.findtext(f'{ATOM_NS}issued')
+    published = _parse_iso_date(published_text.strip()) if published_text and published_text.strip() else None
+
+    return title, link, description, published
+
+def parse_fast(body, stop_links=None):
+    """Parse a well-formed RSS 2.0 or Atom document into a ParsedFeed.
+
+    Only the fields the scanner stores are extracted. Parsing stops after the
+    first entry whose link is in `stop_links`; the returned feed is then marked
+    as truncated. Raises FastParseError for anything that needs feedparser.
+    """
+    parser = ET.XMLPullParser(events=('start', 'end'))
+    kind = None
+    depth = 0
+    feed_title = None
+    feed_links = {}
+    entries = []
+    skipped = 0
+
+    try:
+        for offset in range(0, len(body), FEED_CHUNK_SIZE):
+            parser.feed(body[offset:offset + FEED_CHUNK_SIZE])
+            for event, element in parser.read_events():
+                if event == 'start':
+                    if kind is None:
+                        if element.tag == 'rss':
+                            kind = 'rss'
+                        elif element.tag == f'{ATOM_NS}feed':
+                            if element.get(XML_BASE):
+                                raise FastParseError("xml:base is not supported")
+                            kind = 'atom'
+                        else:
+                            raise FastParseError(f"Unsupported root element: {element.tag}")
+                    depth += 1
+                    continue
+
+                depth -= 1
+                if kind == 'rss':
+                    if element.tag == 'item' and depth == 2:
+                        fields = _rss_entry(element)
+                    else:
+                        if element.tag == 'title' and depth == 2 and feed_title is None:
+                            feed_title = _clean_rss_text(element.text)
+                        elif element.tag == f'{ATOM_NS}link' and depth == 2:
+                            _note_feed_link(element, feed_links)
+                        continue
+                else:
+                    if element.tag == f'{ATOM_NS}entry' and depth == 1:
+                        if element.get(XML_BASE):
+                            raise FastParseError("xml:base is not supported")
+                        fields = _atom_entry(element)
+                    else:
+                        if element.tag == f'{ATOM_NS}title' and depth == 1 and feed_title is None:
+                            feed_title = _clean_atom_text(element)
+                        elif element.tag == f'{ATOM_NS}link' and depth == 1:
+                            _note_feed_link(element, feed_links)
+                        continue
+
+                # Free the entry subtree as we go so memory stays flat on big feeds
+                element.clear()
+                title, link, description, published = fields
+                if not title or not link:
+                    skipped += 1
+                    continue
+                entries.append(FeedEntry(title=title, link=link, description=description, published=published,
+                                         title_text=plain_title(title), description_text=html_to_text(description)))
+                if stop_links and link in stop_links:
+                    return ParsedFeed(found=True, title=feed_title, entries=tuple(entries), skipped=skipped,
+                                      truncated=True, hub=feed_links.get('hub'), self_url=feed_links.get('self'))
+
+        parser.close()
+    except ET.ParseError as e:
+        raise FastParseError(f"Malformed document: {str(e)}")
+
+    if kind is None:
+        raise FastParseError("Empty document")
+
+    return ParsedFeed(found=True, title=feed_title, entries=tuple(entries), skipped=skipped,
+                      hub=feed_links.get('hub'), self_url=feed_links.get('self'))
@@ -0,0 +1,96 @@
+import logging
+import os
+import time
+from datetime import datetime
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from models import Article, RSSFeed, db
+from export_snapshots import discard_snapshots
+from feed_stats import delete_feed_stats
+
+# Articles deleted per transaction; each batch holds the database write lock
+# only briefly so the scanner and other writers keep going
+PURGE_BATCH_SIZE = int(os.environ.get('FEED_PURGE_BATCH_SIZE', 500))
+# Pause between batches, in seconds, leaving room for waiting writers
+PURGE_PAUSE = float(os.environ.get('FEED_PURGE_PAUSE', 0.05))
+
+# Feeds still listed, scanned and exported
+active_feeds_filter = RSSFeed.deleted_at.is_(None)
+
+def mark_deleted(feed):
+    """Hide a feed right away; its articles are purged in the background"""
+    feed.deleted_at = datetime.utcnow()
+    feed.articles_purged = 0
+    feed.num_articles = db.session.scalar(select(func.count()).where(Article.feed_id == feed.id))
+    db.session.commit()
+    # The day files still list its articles; rebuilt without them on demand
+    discard_snapshots()
+    logging.info(f"Feed {feed.url} marked for deletion, {feed.num_articles} articles to purge")
+
+def deletion_progress(feed):
+    total = feed.num_articles or 0
+    return {
+        'id': feed.id,
+        'url': feed.url,
+        'deleted_at': feed.deleted_at.isoformat() if feed.deleted_at else None,
+        'articles_purged': feed.articles_purged or 0,
+        'articles_total': total,
+        'percent': round(100 * min(feed.articles_purged or 0, total) / total, 1) if total else 100.0
+    }
+
+def purge_feed(feed_id, batch_size=PURGE_BATCH_SIZE, pause=PURGE_PAUSE):
+    """Delete the articles of a feed marked for deletion a batch at a time, then the feed.
+
+    Each batch is its own transaction, so an interrupted purge resumes where
+    it stopped. Returns the number of articles deleted.
+    """
+    purged = 0
+    while True:
+        ids = db.session.scalars(
+            select(Article.id).where(Article.feed_id == feed_id).order_by(Article.id).limit(batch_size)
+        ).all()
+        if not ids:
+            break
+        db.session.execute(delete(Article).where(Article.id.in_(ids)))
+        db.session.execute(
+            update(RSSFeed).where(RSSFeed.id == feed_id)
+            .values(articles_purged=func.coalesce(RSSFeed.articles_purged, 0) + len(ids))
+        )
+        db.session.commit()
+        purged += len(ids)
+        time.sleep(pause)
+
+    # Removes stragglers stored by a scan that loaded the feed before it was marked
+    db.session.execute(delete(Article).where(Article.feed_id == feed_id))
+    delete_feed_stats(feed_id)
+    db.session.execute(delete(RSSFeed).where(RSSFeed.id == feed_id))
+    db.session.commit()
+    return purged
+
+def purge_deleted_feeds(keep=None):
+    """Purge every feed marked for deletion.
+
+    `keep` filters feeds by id, so sharded nodes only purge their own.
+    Returns the number of feeds removed.
+    """
+    removed = 0
+    failed = set()
+    while True:
+        feed_ids = [feed_id for feed_id in db.session.scalars(
+            select(RSSFeed.id).where(RSSFeed.deleted_at.isnot(None)).order_by(RSSFeed.id)
+        ) if feed_id not in failed and (keep is None or keep(feed_id))]
+        if not feed_ids:
+            break
+        feed_id = feed_ids[0]
+        started = time.perf_counter()
+        try:
+            purged = purge_feed(feed_id)
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error purging deleted feed {feed_id}: {str(e)}")
+            failed.add(feed_id)
+            continue
+        removed += 1
+        logging.info(f"Purged deleted feed {feed_id}: {purged} articles in {time.perf_counter() - started:.1f}s")
+
+    return removed
@@ -0,0 +1,88 @@
+import logging
+from collections import defaultdict
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.exc import SQLAlchemyError
+from models import Article, RSSFeed, db
+from feed_import import normalize_feed_url
+from feed_deletion import active_feeds_filter
+from feed_stats import recount_feeds
+
+def _canonical(url, resolved_url):
+    return normalize_feed_url(resolved_url or url) or url
+
+def find_duplicate_feeds():
+    """Groups of feeds whose URLs lead to the same place.
+
+    Feeds are compared by the normalized URL they last redirected to, or
+    their own URL. The feed to keep comes first in each group: the one
+    already at the canonical URL, otherwise the oldest.
+    """
+    groups = defaultdict(list)
+    query = select(RSSFeed.id, RSSFeed.url, RSSFeed.resolved_url, RSSFeed.title, RSSFeed.num_articles) \
+        .where(active_feeds_filter).order_by(RSSFeed.id)
+    for feed_id, url, resolved_url, title, num_articles in db.session.execute(query):
+        groups[_canonical(url, resolved_url)].append({
+            'id': feed_id,
+            'url': url,
+            'title': title,
+            'num_articles': num_articles
+        })
+
+    duplicates = []
+    for canonical_url, feeds in groups.items():
+        if len(feeds) < 2:
+            continue
+        feeds.sort(key=lambda feed: (feed['url'] != canonical_url, feed['id']))
+        duplicates.append({'canonical_url': canonical_url, 'feeds': feeds})
+    return duplicates
+
+def merge_feeds(keep_id, duplicate_ids, canonical_url=None):
+    """Move the articles of `duplicate_ids` to the kept feed and delete the duplicates.
+
+    Returns the number of articles moved. Raises SQLAlchemyError, leaving the
+    transaction to the caller.
+    """
+    keeper = db.session.get(RSSFeed, keep_id)
+    duplicates = RSSFeed.query.filter(RSSFeed.id.in_(duplicate_ids)).all()
+    for duplicate in duplicates:
+        if duplicate.last_article_date and (not keeper.last_article_date
+                                            or duplicate.last_article_date > keeper.last_article_date):
+            keeper.last_article_date = duplicate.last_article_date
+
+    moved = db.session.execute(
+        update(Article).where(Article.feed_id.in_(duplicate_ids)).values(feed_id=keep_id)
+    ).rowcount
+    db.session.execute(delete(RSSFeed).where(RSSFeed.id.in_(duplicate_ids)))
+    recount_feeds([keep_id, *duplicate_ids])
+
+    keeper.num_articles = db.session.scalar(select(func.count()).where(Article.feed_id == keep_id))
+    if canonical_url and keeper.url != canonical_url:
+        keeper.url = canonical_url
+        keeper.resolved_url = None
+    db.session.commit()
+    return moved
+
+def merge_duplicate_feeds(canonical_url=None):
+    """Merge every group of duplicate feeds, or only the group of `canonical_url`"""
+    merged = 0
+    moved = 0
+    errors = []
+    for group in find_duplicate_feeds():
+        if canonical_url and group['canonical_url'] != canonical_url:
+            continue
+        keep, *duplicates = group['feeds']
+        duplicate_ids = [feed['id'] for feed in duplicates]
+        try:
+            moved += merge_feeds(keep['id'], duplicate_ids, group['canonical_url'])
+            merged += len(duplicate_ids)
+            logging.info(f"Merged feeds {duplicate_ids} into feed {keep['id']} ({group['canonical_url']})")
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error merging duplicates of {group['canonical_url']}: {str(e)}")
+            errors.append({'url': group['canonical_url'], 'error': str(e)})
+
+    return {
+        'merged_feeds': merged,
+        'moved_articles': moved,
+        'errors': errors
+    }
@@ -0,0 +1,261 @@
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+import gzip
+import http.client
+import logging
+import os
+import socket
+import time
+import urllib.request
+import urllib.error
+import urllib.parse
+import zlib
+from feed_parser import parse_in_pool
+
+# Per-feed limits, in seconds: connecting (with the TLS handshake), waiting
+# for any single read, and the whole fetch from connect to the last byte,
+# which also stops servers that trickle the body out
+FEED_CONNECT_TIMEOUT = float(os.environ.get('FEED_CONNECT_TIMEOUT', 5))
+FEED_READ_TIMEOUT = float(os.environ.get('FEED_READ_TIMEOUT', 5))
+FEED_TOTAL_TIMEOUT = float(os.environ.get('FEED_TOTAL_TIMEOUT', 30))
+
+READ_CHUNK_SIZE = 64 * 1024
+# getaddrinfo takes no timeout, lookups run here so a fetch can stop waiting on one
+DNS_RESOLVER_THREADS = int(os.environ.get('FEED_DNS_RESOLVER_THREADS', 16))
+
+# Modern browser User-Agent, some feed hosts block generic clients
+USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
+ACCEPT_HEADER = 'application/rss+xml, application/atom+xml, application/rdf+xml, application/xml;q=0.9, text/xml;q=0.9, */*;q=0.8'
+
+def parse_proxy_url(proxy_url):
+    """Parse and normalize proxy URL"""
+    if not proxy_url:
+        return None
+
+    # If it doesn't start with a protocol, assume http://
+    if not proxy_url.startswith(('http://', 'https://')):
+        proxy_url = 'http://' + proxy_url
+
+    try:
+        parsed = urllib.parse.urlparse(proxy_url)
+        return proxy_url if parsed.netloc else None
+    except Exception as e:
+        logging.warning(f"Invalid proxy URL format: {str(e)}")
+        return None
+
+def get_proxy_handlers():
+    """Get proxy handlers from environment variables"""
+    proxy_handlers = []
+
+    # Common proxy environment variable names
+    proxy_vars = [
+        ('http_proxy', 'http'),
+        ('HTTP_PROXY', 'http'),
+        ('https_proxy', 'https'),
+        ('HTTPS_PROXY', 'https'),
+        ('all_proxy', 'all'),
+        ('ALL_PROXY', 'all')
+    ]
+
+    proxies = {}
+    for var_name, proxy_type in proxy_vars:
+        proxy_url = os.environ.get(var_name, os.environ.get(var_name.upper()))
+        if proxy_url:
+            parsed_url = parse_proxy_url(proxy_url)
+            if parsed_url:
+                proxies[proxy_type] = parsed_url
+
+    if proxies:
+        for proxy_type, url in proxies.items():
+            if proxy_type in ('http', 'all'):
+                proxy_handlers.append(urllib.request.ProxyHandler({'http': url}))
+            if proxy_type in ('https', 'all'):
+                proxy_handlers.append(urllib.request.ProxyHandler({'https': url}))
+
+    return proxy_handlers
+
+# `final_url` is where the request ended up after redirects, `permanent_url`
+# where its leading 301/308 redirects point (None if the first hop is not permanent)
+FetchResult = namedtuple('FetchResult', ['body', 'content_type', 'status', 'final_url', 'permanent_url'],
+                         defaults=(None, None))
+
+PERMANENT_REDIRECTS = (301, 308)
+
+class RedirectRecorder(urllib.request.HTTPRedirectHandler):
+    """Follow redirects like urllib does, remembering each hop"""
+
+    def __init__(self):
+        super().__init__()
+        self.hops = []
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        redirected = super().redirect_request(req, fp, code, msg, headers, newurl)
+        if redirected is not None:
+            self.hops.append((code, newurl))
+        return redirected
+
+def permanent_target(hops):
+    """Where the leading run of permanent redirects ends, or None"""
+    target = None
+    for code, url in hops:
+        if code not in PERMANENT_REDIRECTS:
+            break
+        target = url
+    return target
+
+class FetchTimeout(Exception):
+    """A fetch ran past one of its deadlines"""
+
+_resolver = ThreadPoolExecutor(max_workers=DNS_RESOLVER_THREADS, thread_name_prefix='feed-dns')
+
+class Deadline:
+    """Time limits of one fetch, ending at `ends` on the time.monotonic() clock"""
+
+    def __init__(self, ends):
+        self.ends = ends
+        # Socket of the current connection, read timeouts shrink as the end nears
+        self.sock = None
+
+    def expired(self):
+        return time.monotonic() >= self.ends
+
+    def timeout(self, limit):
+        """`limit`, cut to the time left; raises FetchTimeout once there is none"""
+        remaining = self.ends - time.monotonic()
+        if remaining <= 0:
+            raise FetchTimeout("Fetch did not finish before its deadline")
+        return min(limit, remaining)
+
+    def create_connection(self, address, timeout=None, source_address=None):
+        """socket.create_connection, with the host lookup held to the deadline too"""
+        host, port = address
+        lookup = _resolver.submit(socket.getaddrinfo, host, port, 0, socket.SOCK_STREAM)
+        try:
+            addresses = lookup.result(timeout=self.timeout(FEED_CONNECT_TIMEOUT))
+        except FutureTimeout:
+            # The lookup finishes in the background and its thread is reused
+            raise FetchTimeout(f"Resolving {host} timed out")
+        error = None
+        for family, kind, proto, _, sockaddr in addresses:
+            sock = None
+            try:
+                sock = socket.socket(family, kind, proto)
+                sock.settimeout(self.timeout(FEED_CONNECT_TIMEOUT))
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+                return sock
+            except OSError as e:
+                error = e
+                if sock is not None:
+                    sock.close()
+                if isinstance(e, TimeoutError) and self.expired():
+                    break
+        if error is None:
+            raise OSError(f"getaddrinfo returned no addresses for {host}")
+        raise error
+
+    def connection_class(self, base):
+        deadline = self
+
+        class Connection(base):
+            def connect(self):
+                self.timeout = deadline.timeout(FEED_CONNECT_TIMEOUT)
+                self._create_connection = deadline.create_connection
+                try:
+                    super().connect()
+                except TimeoutError:
+                    if deadline.expired():
+                        raise FetchTimeout("Fetch did not finish before its deadline")
+                    raise FetchTimeout(f"Connecting timed out after {FEED_CONNECT_TIMEOUT:g}s")
+                deadline.sock = self.sock
+                self.sock.settimeout(deadline.timeout(FEED_READ_TIMEOUT))
+
+        return Connection
+
+class DeadlineHTTPHandler(urllib.request.HTTPHandler):
+    def __init__(self, deadline):
+        super().__init__()
+        self.deadline = deadline
+
+    def http_open(self, req):
+        return self.do_open(self.deadline.connection_class(http.client.HTTPConnection), req)
+
+class DeadlineHTTPSHandler(urllib.request.HTTPSHandler):
+    def __init__(self, deadline):
+        super().__init__()
+        self.deadline = deadline
+
+    def https_open(self, req):
+        return self.do_open(self.deadline.connection_class(http.client.HTTPSConnection), req,
+                            context=self._context)
+
+def _read_body(response, deadline):
+    chunks = []
+    while True:
+        timeout = deadline.timeout(FEED_READ_TIMEOUT)
+        if deadline.sock is not None:
+            deadline.sock.settimeout(timeout)
+        chunk = response.read1(READ_CHUNK_SIZE)
+        if not chunk:
+            return b''.join(chunks)
+        chunks.append(chunk)
+
+def fetch_feed(url, handlers=None, deadline=None):
+    """Fetch the raw feed body, returning a FetchResult.
+
+    Gives up with FetchTimeout when connecting or a read takes too long, or
+    at `deadline` (time.monotonic()), FEED_TOTAL_TIMEOUT from now by default.
+    """
+    deadline = Deadline(deadline if deadline is not None else time.monotonic() + FEED_TOTAL_TIMEOUT)
+    recorder = RedirectRecorder()
+    opener = urllib.request.build_opener(*(handlers or []), DeadlineHTTPHandler(deadline),
+                                         DeadlineHTTPSHandler(deadline), recorder)
+    request = urllib.request.Request(url, headers={
+        'User-Agent': USER_AGENT,
+        'Accept': ACCEPT_HEADER,
+        'Accept-Encoding': 'gzip, deflate'
+    })
+
+    try:
+        with opener.open(request) as response:
+            body = _read_body(response, deadline)
+            content_encoding = (response.headers.get('Content-Encoding') or '').lower()
+            content_type = response.headers.get('Content-Type')
+            status = response.status
+            final_url = response.geturl()
+    except TimeoutError:
+        if deadline.expired():
+            raise FetchTimeout("Fetch did not finish before its deadline")
+        raise FetchTimeout(f"No data from the server for {FEED_READ_TIMEOUT:g}s")
+
+    if content_encoding == 'gzip':
+        body = gzip.decompress(body)
+    elif content_encoding == 'deflate':
+        try:
+            body = zlib.decompress(body)
+        except zlib.error:
+            # Some servers send raw deflate streams without the zlib header
+            body = zlib.decompress(body, -zlib.MAX_WBITS)
+
+    return FetchResult(body, content_type, status, final_url, permanent_target(recorder.hops))
+
+def fetch_feed_with_proxy(url, deadline=None):
+    """Fetch a feed URL with proxy support, returning a FetchResult"""
+    handlers = get_proxy_handlers()
+    if deadline is None:
+        deadline = time.monotonic() + FEED_TOTAL_TIMEOUT
+
+    if handlers:
+        try:
+            return fetch_feed(url, handlers, deadline)
+        except Exception as e:
+            logging.error(f"Error fetching feed: {str(e)}")
+            # Fallback to direct connection if proxy fails, within the same deadline
+            return fetch_feed(url, [urllib.request.ProxyHandler({})], deadline)
+    return fetch_feed(url, deadline=deadline)
+
+def parse_feed_with_proxy(url):
+    """Fetch a feed URL with proxy support and parse it in the parser pool"""
+    fetched = fetch_feed_with_proxy(url)
+    return parse_in_pool(fetched.body, fetched.content_type)
@@ -0,0 +1,189 @@
+import logging
+import urllib.parse
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from xml.sax.saxutils import escape, quoteattr
+from sqlalchemy import insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from models import RSSFeed, db
+from feed_deletion import active_feeds_filter
+
+# Number of feeds inserted per transaction during a bulk import
+IMPORT_CHUNK_SIZE = 500
+
+# Matches the length of RSSFeed.url
+MAX_URL_LENGTH = 500
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+def normalize_feed_url(url):
+    """Normalize a feed URL so trivially different spellings compare equal.
+
+    Returns None if the URL cannot be used as a feed URL.
+    """
+    if not url:
+        return None
+    url = url.strip()
+    if not url:
+        return None
+
+    # If it doesn't start with a protocol, assume http://
+    if '://' not in url:
+        url = 'http://' + url
+
+    try:
+        parsed = urllib.parse.urlsplit(url)
+        port = parsed.port
+    except ValueError:
+        return None
+
+    scheme = parsed.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parsed.hostname:
+        return None
+
+    netloc = parsed.hostname.lower()
+    if ':' in netloc:
+        # IPv6 literal
+        netloc = f'[{netloc}]'
+    if port and port != DEFAULT_PORTS[scheme]:
+        netloc = f'{netloc}:{port}'
+    if parsed.username:
+        userinfo = parsed.username
+        if parsed.password:
+            userinfo += f':{parsed.password}'
+        netloc = f'{userinfo}@{netloc}'
+
+    return urllib.parse.urlunsplit((scheme, netloc, parsed.path or '/', parsed.query, ''))
+
+def parse_url_list(text):
+    """Extract feed URLs from a plain text list (one URL per line, '#' comments allowed)"""
+    urls = []
+    for line in text.splitlines():
+        line = line.strip()
+        if line and not line.startswith('#'):
+            urls.append(line)
+    return urls
+
+def parse_opml(data):
+    """Extract feed URLs from an OPML document.
+
+    Raises ValueError if the document is not valid OPML.
+    """
+    try:
+        root = ET.fromstring(data)
+    except ET.ParseError as e:
+        raise ValueError(f"Invalid OPML document: {str(e)}")
+
+    if root.tag.lower() != 'opml':
+        raise ValueError("Invalid OPML document: missing <opml> root element")
+
+    urls = []
+    for outline in root.iter('outline'):
+        # The attribute is case sensitive in the spec, but some exporters get it wrong
+        url = outline.get('xmlUrl') or outline.get('xmlurl')
+        if url:
+            urls.append(url.strip())
+    return urls
+
+def parse_import_payload(data, filename=None):
+    """Parse an uploaded import file, detecting OPML vs a plain URL list"""
+    if isinstance(data, bytes):
+        text = data.decode('utf-8', errors='replace')
+    else:
+        text = data
+
+    stripped = text.lstrip('\ufeff \t\r\n')
+    if (filename and filename.lower().endswith(('.opml', '.xml'))) or stripped.startswith('<'):
+        return parse_opml(data if isinstance(data, bytes) else data.encode('utf-8'))
+    return parse_url_list(text)
+
+def _insert_chunk(rows, errors):
+    """Insert a chunk of feed rows in one transaction.
+
+    If the chunk fails as a whole, fall back to inserting the rows one by one so a
+    single bad row only rejects itself. Returns the number of feeds inserted.
+    """
+    try:
+        db.session.execute(insert(RSSFeed), rows)
+        db.session.commit()
+        return len(rows)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.warning(f"Bulk insert of {len(rows)} feeds failed, retrying row by row: {str(e)}")
+
+    inserted = 0
+    for row in rows:
+        try:
+            db.session.execute(insert(RSSFeed), [row])
+            db.session.commit()
+            inserted += 1
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            errors.append({'url': row['url'], 'error': str(e.orig) if getattr(e, 'orig', None) else str(e)})
+    return inserted
+
+def import_feeds(urls, chunk_size=IMPORT_CHUNK_SIZE):
+    """Add many feeds at once.
+
+    URLs are normalized and deduplicated in memory, checked against the existing
+    feeds with a single query and inserted in chunks. Returns a summary dict with
+    the number of feeds added, the URLs skipped as duplicates and per-row errors.
+    """
+    errors = []
+    duplicates = []
+    candidates = {}
+
+    for url in urls:
+        normalized = normalize_feed_url(url)
+        if not normalized:
+            errors.append({'url': url, 'error': 'Invalid feed URL'})
+        elif len(normalized) > MAX_URL_LENGTH:
+            errors.append({'url': url, 'error': f'URL longer than {MAX_URL_LENGTH} characters'})
+        elif normalized in candidates:
+            duplicates.append(url)
+        else:
+            candidates[normalized] = url
+
+    # One query for every known feed URL, compared in normalized form
+    existing = set()
+    for existing_url in db.session.scalars(select(RSSFeed.url)):
+        existing.add(existing_url)
+        existing.add(normalize_feed_url(existing_url))
+
+    new_urls = []
+    for normalized, original in candidates.items():
+        if normalized in existing or original in existing:
+            duplicates.append(original)
+        else:
+            new_urls.append(normalized)
+
+    added = 0
+    now = datetime.utcnow()
+    for i in range(0, len(new_urls), chunk_size):
+        rows = [{'url': url, 'last_updated': now} for url in new_urls[i:i + chunk_size]]
+        added += _insert_chunk(rows, errors)
+
+    logging.info(f"Bulk feed import: {added} added, {len(duplicates)} duplicates, {len(errors)} errors")
+    return {
+        'added': added,
+        'duplicates': duplicates,
+        'errors': errors
+    }
+
+def generate_opml(title='RSS Feed Manager subscriptions', batch_size=500):
+    """Stream the feed list as an OPML document"""
+    yield '<?xml version="1.0" encoding="UTF-8"?>\n'
+    yield '<opml version="2.0">\n'
+    yield f'  <head>\n    <title>{escape(title)}</title>\n'
+    yield f'    <dateCreated>{datetime.utcnow().strftime("%a, %d %b %Y %H:%M:%S GMT")}</dateCreated>\n  </head>\n'
+    yield '  <body>\n'
+
+    query = db.session.execute(
+        select(RSSFeed.url, RSSFeed.title).where(active_feeds_filter).order_by(RSSFeed.id)
+        .execution_options(yield_per=batch_size)
+    )
+    for url, feed_title in query:
+        text = quoteattr(feed_title or url)
+        yield f'    <outline type="rss" text={text} title={text} xmlUrl={quoteattr(url)}/>\n'
+
+    yield '  </body>\n</opml>\n'
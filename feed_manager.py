@@ -1,16 +1,40 @@
 from datetime import datetime, timedelta
-from flask import Blueprint, render_template, jsonify, request
+from flask import Blueprint, Response, current_app, render_template, jsonify, request, stream_with_context
 from flask_login import login_required
 import csv
 from io import StringIO
-from models import RSSFeed, Article, ScanProgress, db
+from models import RSSFeed, Article, db
 import logging
-from sqlalchemy import desc, asc
-from scheduler import get_next_scan_time
+from sqlalchemy import desc, asc, or_
+from scheduler import get_next_scan_time, start_feed_purge
 from feed_updater import update_all_feeds, update_single_feed, reset_scan_progress
+from feed_import import import_feeds, parse_import_payload, parse_opml, generate_opml
+from models import FeedScanResult, ScanRun
+from scan_history import recent_scan_runs, serialize_feed_result, serialize_scan_run, slowest_feeds
+from log_pipeline import LEVELS, set_runtime_level
+from sharding import aggregate_scan_progress
+from feed_duplicates import find_duplicate_feeds, merge_duplicate_feeds
+from api_encoding import columnar, encode_response, is_columnar, negotiate_format
+from text_normalize import clean_text
+from feed_fetcher import FetchResult
+from ingest_pipeline import RefreshTimeout, ingest_pushed
+from websub import MAX_PUSH_BYTES, valid_signature, verify_intent
+from export_snapshots import (EXPORT_COLUMNS, EXPORT_FORMATS, export_text, format_rows, snapshot_days,
+                              snapshot_response)
+from feed_deletion import active_feeds_filter, deletion_progress, mark_deleted
+import analytics
+from columnar_export import COLUMNAR_FORMATS, available as columnar_available, columnar_response
 
 feed_bp = Blueprint('feed', __name__)
 
+# Per-feed fields of /api/feeds, in the order of the columnar format
+FEED_COLUMNS = ('id', 'url', 'title', 'status', 'num_articles', 'recent_articles', 'last_article_date',
+                'last_updated', 'last_scan_time', 'last_scan_trigger')
+
+def _active_feed_or_404(feed_id):
+    """The feed, unless it does not exist or is being deleted"""
+    return RSSFeed.query.filter(RSSFeed.id == feed_id, active_feeds_filter).first_or_404()
+
 @feed_bp.route('/')
 @feed_bp.route('/dashboard')
 @login_required
@@ -24,16 +48,22 @@ def view_articles(feed_id=None):
     page = request.args.get('page', 1, type=int)
     sort = request.args.get('sort', 'published_date')
     order = request.args.get('order', 'desc')
+    search = clean_text(request.args.get('q', ''))
 
     # Base query with eager loading of feed relationship
-    query = Article.query.join(RSSFeed, Article.feed_id == RSSFeed.id)
+    query = Article.query.join(RSSFeed, Article.feed_id == RSSFeed.id).filter(active_feeds_filter)
 
     # Add feed filter if feed_id is provided
     feed = None
     if feed_id:
-        feed = RSSFeed.query.get_or_404(feed_id)
+        feed = _active_feed_or_404(feed_id)
         query = query.filter(Article.feed_id == feed_id)
 
+    # Search the plain text stored at ingest
+    if search:
+        query = query.filter(or_(Article.title_text.icontains(search, autoescape=True),
+                                 Article.description_text.icontains(search, autoescape=True)))
+
     # Add sorting
     sort_column = getattr(Article, sort, Article.published_date)
     if order == 'desc':
@@ -44,7 +74,82 @@ def view_articles(feed_id=None):
     # Paginate results
     articles = query.paginate(page=page, per_page=20, error_out=False)
 
-    return render_template('articles.html', articles=articles, feed=feed)
+    return render_template('articles.html', articles=articles, feed=feed, search=search)
+
+@feed_bp.route('/scans')
+@login_required
+def scan_history():
+    return render_template('scans.html')
+
+@feed_bp.route('/api/scans')
+@login_required
+def get_scan_runs():
+    limit = min(request.args.get('limit', 50, type=int), 500)
+    return jsonify({'runs': [serialize_scan_run(run) for run in recent_scan_runs(limit)]})
+
+@feed_bp.route('/api/scans/<int:run_id>')
+@login_required
+def get_scan_run(run_id):
+    run = ScanRun.query.get_or_404(run_id)
+    limit = min(request.args.get('limit', 100, type=int), 5000)
+    results = run.results
+    # e.g. ?status=deferred for the feeds the scan ran out of time for
+    if request.args.get('status'):
+        results = results.filter(FeedScanResult.status == request.args['status'])
+    results = results.order_by(FeedScanResult.total_seconds.desc()).limit(limit).all()
+    return jsonify({
+        'run': serialize_scan_run(run),
+        'results': [serialize_feed_result(result) for result in results]
+    })
+
+@feed_bp.route('/api/scans/slowest-feeds')
+@login_required
+def get_slowest_feeds():
+    runs = min(request.args.get('runs', 10, type=int), 100)
+    limit = min(request.args.get('limit', 20, type=int), 200)
+    return jsonify({'runs': runs, 'feeds': slowest_feeds(runs, limit)})
+
+def _analytics_days(default):
+    return max(1, min(request.args.get('days', default, type=int), analytics.MAX_DAYS))
+
+@feed_bp.route('/api/analytics/sparklines')
+@login_required
+def get_sparklines():
+    """Daily article counts of every feed, for the dashboard"""
+    return encode_response(analytics.sparklines(_analytics_days(30)), negotiate_format())
+
+@feed_bp.route('/api/analytics/trends')
+@login_required
+def get_trends():
+    """Feeds ranked by how much their output changed against the previous period"""
+    order = request.args.get('order', 'slowing')
+    if order not in ('slowing', 'growing'):
+        return jsonify({'error': f'Unknown order: {order}'}), 400
+    limit = min(request.args.get('limit', 50, type=int), 1000)
+    return jsonify(analytics.trends(_analytics_days(90), order, limit))
+
+@feed_bp.route('/api/analytics/feeds/<int:feed_id>')
+@login_required
+def get_feed_history(feed_id):
+    _active_feed_or_404(feed_id)
+    return jsonify(analytics.feed_history(feed_id, _analytics_days(365)))
+
+@feed_bp.route('/api/logging/level', methods=['GET', 'POST'])
+@login_required
+def log_level():
+    if request.method == 'POST':
+        data = request.get_json() or {}
+        try:
+            set_runtime_level(data.get('level') or '')
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        except OSError as e:
+            logging.error(f"Error setting log level: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'level': logging.getLevelName(logging.getLogger().getEffectiveLevel()),
+        'levels': list(LEVELS)
+    })
 
 @feed_bp.route('/api/articles/<int:article_id>')
 @login_required
@@ -58,23 +163,11 @@ def get_article(article_id):
         'source': feed.title if feed else 'Unknown Source'
     })
 
-def sanitize_text(text):
-    if not text:
-        return ''
-    # Replace all types of newlines and whitespace with single spaces
-    text = text.replace('\n', ' ').replace('\r', ' ').replace('\t', ' ').replace('\v', ' ').replace('\f', ' ')
-    # Replace multiple spaces with a single space
-    text = ' '.join(text.split())
-    # Remove any remaining special characters that might cause CSV issues
-    text = ''.join(char for char in text if char.isprintable())
-    # Strip leading/trailing whitespace
-    return text.strip()
-
 @feed_bp.route('/api/feeds/download')
 @login_required
 def download_feeds():
     try:
-        feeds = RSSFeed.query.all()
+        feeds = RSSFeed.query.filter(active_feeds_filter).all()
 
         si = StringIO()
         cw = csv.writer(si)
@@ -83,17 +176,18 @@ def download_feeds():
 
         for feed in feeds:
             # Get the newest article for this feed
-            newest_article = Article.query.filter_by(feed_id=feed.id).order_by(Article.published_date.desc()).first()
-            newest_item_title = newest_article.title if newest_article else ''
+            newest_article = Article.query.with_entities(Article.title, Article.title_text) \
+                .filter_by(feed_id=feed.id).order_by(Article.published_date.desc()).first()
+            newest_item_title = export_text(*newest_article) if newest_article else ''
 
             cw.writerow([
                 feed.url,                   # Feed URL
-                sanitize_text(feed.title or ''),  # Source Name
+                export_text(feed.title, feed.title_text),  # Source Name
                 'Startups',                 # Category
                 feed.status.upper(),        # Status
                 feed.last_scan_time.isoformat() if feed.last_scan_time else '',  # Last Checked
                 feed.num_articles,          # Items Collected
-                sanitize_text(newest_item_title)  # Newest Item
+                newest_item_title           # Newest Item
             ])
 
         output = si.getvalue()
@@ -110,16 +204,16 @@ def download_feeds():
 @login_required
 def download_feed_articles(feed_id):
     try:
-        feed = RSSFeed.query.get_or_404(feed_id)
-        articles = Article.query.filter_by(feed_id=feed_id).order_by(Article.published_date.desc()).all()
+        feed = _active_feed_or_404(feed_id)
+        articles = Article.query.with_entities(Article.title, Article.title_text, Article.link) \
+            .filter_by(feed_id=feed_id).order_by(Article.published_date.desc())
 
         # Start with header row
         output_lines = ["Title~Link"]
 
         # Add article entries
-        for article in articles:
-            clean_title = sanitize_text(article.title)
-            output_lines.append(f"{clean_title}~{article.link}")
+        for title, title_text, link in articles:
+            output_lines.append(f"{export_text(title, title_text)}~{link}")
 
         output = '\n'.join(output_lines)
 
@@ -131,31 +225,44 @@ def download_feed_articles(feed_id):
         logging.error(f"Error downloading articles for feed {feed_id}: {str(e)}")
         return jsonify({'error': 'Failed to download articles'}), 500
 
+def _article_filters(start_date, end_date, feed_ids):
+    """Conditions of an article download: published dates, both inclusive, and feeds"""
+    conditions = []
+    if start_date:
+        conditions.append(Article.published_date >= datetime.fromisoformat(start_date))
+    if end_date:
+        # Add one day to include the entire end date
+        conditions.append(Article.published_date < datetime.fromisoformat(end_date) + timedelta(days=1))
+    if feed_ids:
+        conditions.append(Article.feed_id.in_(feed_ids))
+    return conditions
+
 @feed_bp.route('/api/articles/download')
 @login_required
 def download_all_articles():
     try:
         start_date = request.args.get('start_date')
         end_date = request.args.get('end_date')
-
-        query = Article.query
-
-        if start_date:
-            query = query.filter(Article.published_date >= datetime.fromisoformat(start_date))
-        if end_date:
-            # Add one day to include the entire end date
-            end_datetime = datetime.fromisoformat(end_date) + timedelta(days=1)
-            query = query.filter(Article.published_date < end_datetime)
-
-        # Start with header row
-        output_lines = ["Title~Link"]
-
-        # Add article entries
-        for article in query.all():
-            clean_title = sanitize_text(article.title)
-            output_lines.append(f"{clean_title}~{article.link}")
-
-        output = '\n'.join(output_lines)
+        feed_ids = request.args.getlist('feed_id', type=int)
+        export_format = request.args.get('format', 'txt')
+        if export_format in COLUMNAR_FORMATS:
+            if not columnar_available():
+                return jsonify({'error': f'The {export_format} format needs the optional pyarrow package'}), 501
+            return columnar_response(_article_filters(start_date, end_date, feed_ids), export_format)
+        if export_format not in EXPORT_FORMATS:
+            return jsonify({'error': f'Unknown export format: {export_format}'}), 400
+
+        # Whole days of every feed come from the daily snapshot files
+        days = snapshot_days(start_date, end_date) if not feed_ids else None
+        if days is not None:
+            return snapshot_response(days, export_format)
+
+        query = Article.query.with_entities(*EXPORT_COLUMNS) \
+            .join(RSSFeed, Article.feed_id == RSSFeed.id) \
+            .filter(active_feeds_filter, *_article_filters(start_date, end_date, feed_ids))
+
+        header, _ = EXPORT_FORMATS[export_format]
+        output = header + format_rows(query, export_format)
 
         return output, 200, {
             'Content-Type': 'text/csv',
@@ -168,21 +275,24 @@ def download_all_articles():
 @feed_bp.route('/api/feeds/<int:feed_id>', methods=['DELETE'])
 @login_required
 def delete_feed(feed_id):
+    """Hide the feed now and purge its articles in the background"""
+    feed = _active_feed_or_404(feed_id)
     try:
-        feed = RSSFeed.query.get_or_404(feed_id)
-
-        # Delete associated articles first
-        Article.query.filter_by(feed_id=feed_id).delete()
-
-        # Then delete the feed
-        db.session.delete(feed)
-        db.session.commit()
-        return jsonify({'message': 'Feed deleted successfully'})
+        mark_deleted(feed)
+        start_feed_purge(current_app._get_current_object(), feed_id)
+        return jsonify({'message': 'Feed scheduled for deletion', 'deletion': deletion_progress(feed)}), 202
     except Exception as e:
         logging.error(f"Error deleting feed {feed_id}: {str(e)}")
         db.session.rollback()
         return jsonify({'error': f'Failed to delete feed: {str(e)}'}), 500
 
+@feed_bp.route('/api/feeds/deletions')
+@login_required
+def get_feed_deletions():
+    """Progress of the feeds whose articles are being purged"""
+    feeds = RSSFeed.query.filter(RSSFeed.deleted_at.isnot(None)).order_by(RSSFeed.deleted_at).all()
+    return jsonify({'deletions': [deletion_progress(feed) for feed in feeds]})
+
 @feed_bp.route('/api/feeds/refresh', methods=['POST'])
 @login_required
 def refresh_feeds():
@@ -195,28 +305,44 @@ def refresh_feeds():
         logging.error(f"Error refreshing feeds: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@feed_bp.route('/websub/<int:feed_id>', methods=['GET', 'POST'])
+def websub_callback(feed_id):
+    """WebSub callback: hubs verify subscriptions with GET and push new content with POST"""
+    if request.method == 'GET':
+        return verify_intent(feed_id, request.args)
+
+    try:
+        feed = db.session.get(RSSFeed, feed_id)
+        if feed is None or feed.deleted_at is not None:
+            # Tells the hub to drop the subscription
+            return '', 410
+        if request.content_length and request.content_length > MAX_PUSH_BYTES:
+            return '', 413
+        body = request.get_data()
+        if not valid_signature(feed, body, request.headers.get('X-Hub-Signature')):
+            # Acknowledged but ignored, as WebSub requires for bad signatures
+            logging.warning(f"Ignoring WebSub push for feed {feed_id} with a missing or invalid signature")
+            return '', 202
+        ingest_pushed(feed, FetchResult(body, request.content_type, 200))
+        return '', 202
+    except Exception as e:
+        logging.error(f"Error storing WebSub push for feed {feed_id}: {str(e)}")
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @feed_bp.route('/api/feeds/<int:feed_id>/refresh', methods=['POST'])
 @login_required
 def refresh_single_feed(feed_id):
     try:
-        feed = RSSFeed.query.get_or_404(feed_id)
-        # Update scan progress for single feed
-        progress = ScanProgress.get_current()
-        progress.update(
-            is_scanning=True,
-            current_feed=feed.title or feed.url,
-            current_index=1,
-            total_feeds=1,
-            completed=False
-        )
+        feed = _active_feed_or_404(feed_id)
+        # Leaves the scan progress alone, a scan may be running
         result = update_single_feed(feed)
-        # Reset scan progress after completion
-        reset_scan_progress()
         return jsonify(result)
+    except RefreshTimeout as e:
+        logging.warning(f"Refresh of feed {feed_id} timed out: {str(e)}")
+        return jsonify({'error': str(e)}), 504
     except Exception as e:
         logging.error(f"Error refreshing feed {feed_id}: {str(e)}")
-        # Reset scan progress on error
-        reset_scan_progress()
         return jsonify({'error': str(e)}), 500
 
 @feed_bp.route('/api/feeds', methods=['POST'])
@@ -227,55 +353,103 @@ def add_feed():
         return jsonify({'error': 'URL is required'}), 400
 
     try:
-        feed = RSSFeed(url=url)
-        db.session.add(feed)
-        db.session.commit()
+        # Same normalization and duplicate check as bulk imports
+        result = import_feeds([url])
+        if result['duplicates']:
+            return jsonify({'error': 'Feed already exists'}), 400
+        if result['errors']:
+            return jsonify({'error': result['errors'][0]['error']}), 400
         return jsonify({'message': 'Feed added successfully'})
     except Exception as e:
         logging.error(f"Error adding feed: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@feed_bp.route('/api/feeds/duplicates')
+@login_required
+def get_duplicate_feeds():
+    try:
+        return jsonify({'groups': find_duplicate_feeds()})
+    except Exception as e:
+        logging.error(f"Error finding duplicate feeds: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@feed_bp.route('/api/feeds/duplicates/merge', methods=['POST'])
+@login_required
+def merge_duplicates():
+    """Merge all duplicate feeds, or the group given by canonical_url"""
+    data = request.get_json(silent=True) or {}
+    try:
+        return jsonify(merge_duplicate_feeds(data.get('canonical_url')))
+    except Exception as e:
+        logging.error(f"Error merging duplicate feeds: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+def _import_response(result):
+    errors = [f"{error['url']}: {error['error']}" for error in result['errors']]
+    errors.extend(f"Feed already exists: {url}" for url in result['duplicates'])
+    response = {
+        'message': f"Successfully added {result['added']} feeds",
+        'added': result['added'],
+        'duplicates': len(result['duplicates']),
+        'errors': errors if errors else None
+    }
+    if result['added'] == 0:
+        response['error'] = 'No feeds were added:\n' + '\n'.join(errors)
+        return jsonify(response), 400
+    return jsonify(response), 200
+
 @feed_bp.route('/api/feeds/bulk', methods=['POST'])
 @login_required
 def add_feeds_bulk():
     try:
-        urls = request.json.get('urls', [])
+        payload = request.get_json(silent=True) or {}
+        urls = payload.get('urls', [])
+        if payload.get('opml'):
+            urls = urls + parse_opml(payload['opml'].encode('utf-8'))
         if not urls:
             return jsonify({'error': 'No URLs provided'}), 400
 
-        errors = []
-        success_count = 0
-
-        for url in urls:
-            try:
-                # Check if feed already exists
-                if RSSFeed.query.filter_by(url=url).first():
-                    errors.append(f"Feed already exists: {url}")
-                    continue
+        return _import_response(import_feeds(urls))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"Error in bulk feed addition: {str(e)}")
+        return jsonify({'error': str(e)}), 500
 
-                feed = RSSFeed(url=url)
-                db.session.add(feed)
-                success_count += 1
-            except Exception as e:
-                errors.append(f"Error adding {url}: {str(e)}")
+@feed_bp.route('/api/feeds/import', methods=['POST'])
+@login_required
+def import_feeds_file():
+    """Import feeds from an uploaded OPML file or plain text URL list"""
+    upload = request.files.get('file')
+    if not upload:
+        return jsonify({'error': 'No file provided'}), 400
 
-        db.session.commit()
+    try:
+        urls = parse_import_payload(upload.read(), upload.filename)
+        if not urls:
+            return jsonify({'error': 'No feed URLs found in file'}), 400
 
-        response = {
-            'message': f'Successfully added {success_count} feeds',
-            'errors': errors if errors else None
-        }
-        return jsonify(response), 200 if success_count > 0 else 400
+        return _import_response(import_feeds(urls))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
-        logging.error(f"Error in bulk feed addition: {str(e)}")
+        logging.error(f"Error importing feeds from {upload.filename}: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@feed_bp.route('/api/feeds/download/opml')
+@login_required
+def download_feeds_opml():
+    return Response(stream_with_context(generate_opml()), mimetype='text/x-opml', headers={
+        'Content-Disposition': 'attachment; filename=rss_feed_list.opml'
+    })
+
 @feed_bp.route('/api/feeds')
 @login_required
 def get_feeds():
     next_scan = get_next_scan_time()
-    feeds = RSSFeed.query.all()
+    feeds = RSSFeed.query.filter(active_feeds_filter).all()
     seven_days_ago = datetime.utcnow() - timedelta(days=7)
+    response_format = negotiate_format()
 
     feed_data = []
     for feed in feeds:
@@ -294,19 +468,18 @@ def get_feeds():
             'last_article_date': feed.last_article_date.isoformat() if feed.last_article_date else None,
             'last_updated': feed.last_updated.isoformat() if feed.last_updated else None,
             'last_scan_time': feed.last_scan_time.isoformat() if feed.last_scan_time else None,
-            'last_scan_trigger': feed.last_scan_trigger,
-            'next_automatic_scan': next_scan.isoformat() if next_scan else None
+            'last_scan_trigger': feed.last_scan_trigger
         })
 
-    # Get current scan progress from database
-    scan_progress = ScanProgress.get_current()
-    progress_data = {
-        'is_scanning': scan_progress.is_scanning,
-        'current_feed': scan_progress.current_feed,
-        'current_index': scan_progress.current_index,
-        'total_feeds': scan_progress.total_feeds,
-        'completed': scan_progress.completed
-    }
+    if is_columnar(response_format):
+        # Same for every feed, so only sent once as next_scan
+        feed_data = columnar(feed_data, FEED_COLUMNS)
+    else:
+        for row in feed_data:
+            row['next_automatic_scan'] = next_scan.isoformat() if next_scan else None
+
+    # Get current scan progress from database, combined across scanner nodes
+    progress_data = aggregate_scan_progress()
 
     # Include current scan progress in response
     response_data = {
@@ -315,4 +488,4 @@ def get_feeds():
         'next_scan': next_scan.isoformat() if next_scan else None
     }
 
-    return jsonify(response_data)
\ No newline at end of file
+    return encode_response(response_data, response_format)
\ No newline at end of file
@@ -0,0 +1,139 @@
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+import feedparser
+from text_normalize import html_to_text, plain_title
+
+# Compact, picklable records sent back from the parser processes. Only the
+# fields the scanner stores are kept; feedparser dicts are never pickled.
+# The plain-text fields are normalized here so exports and search never redo it.
+FeedEntry = namedtuple('FeedEntry', ['title', 'link', 'description', 'published', 'title_text', 'description_text'],
+                       defaults=('', ''))
+# `truncated` is set when parsing stopped early at an already known entry;
+# `hub` and `self_url` are the feed's WebSub hub and topic links, if any
+ParsedFeed = namedtuple('ParsedFeed', ['found', 'title', 'entries', 'skipped', 'truncated', 'hub', 'self_url'],
+                        defaults=(False, None, None))
+
+def _parse_env_workers():
+    value = os.environ.get('FEED_PARSE_WORKERS')
+    if value is None:
+        return min(4, os.cpu_count() or 1)
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logging.warning(f"Invalid FEED_PARSE_WORKERS value: {value}")
+        return 0
+
+# Number of parser processes; 0 parses inline in the calling thread
+PARSE_WORKERS = _parse_env_workers()
+
+# Try the lean RSS 2.0/Atom parser before falling back to feedparser
+FAST_PARSER_ENABLED = os.environ.get('FAST_FEED_PARSER', '1') != '0'
+
+_pool = None
+_pool_lock = threading.Lock()
+
+def parse_feed_body(body, content_type=None, stop_links=None):
+    """Parse a fetched feed body into a ParsedFeed.
+
+    Well-formed RSS 2.0 and Atom documents go through the fast parser, which
+    may stop at the first entry in `stop_links`. Anything else falls back to
+    feedparser. Runs inside the parser processes, so it must only return
+    plain tuples.
+    """
+    if FAST_PARSER_ENABLED:
+        # Imported here to avoid a circular import, fast_parser uses our records
+        from fast_parser import FastParseError, parse_fast
+        try:
+            return parse_fast(body, stop_links)
+        except FastParseError as e:
+            logging.debug(f"Fast parser fallback to feedparser: {str(e)}")
+
+    return parse_feed_body_feedparser(body, content_type)
+
+def parse_feed_body_feedparser(body, content_type=None):
+    """Parse a feed body with feedparser's full tolerant pipeline"""
+    response_headers = {'content-type': content_type} if content_type else None
+    parsed = feedparser.parse(body, response_headers=response_headers)
+
+    entries = []
+    skipped = 0
+    for entry in parsed.entries:
+        title = entry.get('title')
+        link = entry.get('link')
+        if not title or not link:
+            skipped += 1
+            continue
+        published_parsed = entry.get('published_parsed')
+        entries.append(FeedEntry(
+            title=title,
+            link=link,
+            description=entry.get('description', ''),
+            published=datetime(*published_parsed[:6]) if published_parsed else None,
+            title_text=plain_title(title),
+            description_text=html_to_text(entry.get('description', ''))
+        ))
+
+    feed_links = {}
+    for link in parsed.feed.get('links', []):
+        if link.get('rel') and link.get('href'):
+            feed_links.setdefault(link['rel'], link['href'])
+
+    return ParsedFeed(
+        found=bool(parsed.feed),
+        title=parsed.feed.get('title'),
+        entries=tuple(entries),
+        skipped=skipped,
+        hub=feed_links.get('hub'),
+        self_url=feed_links.get('self')
+    )
+
+def _pool_context():
+    # The scanner runs in a thread of a multi-threaded server process, so
+    # avoid plain fork() and start workers from a clean interpreter instead.
+    methods = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+
+def get_parse_pool():
+    """Return the shared parser process pool, creating it on first use"""
+    global _pool
+    if PARSE_WORKERS == 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            logging.info(f"Starting feed parser pool with {PARSE_WORKERS} processes")
+            _pool = ProcessPoolExecutor(max_workers=PARSE_WORKERS, mp_context=_pool_context())
+        return _pool
+
+def shutdown_parse_pool():
+    """Shut down the parser process pool if it is running"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+            logging.info("Feed parser pool shut down")
+
+def parse_in_pool(body, content_type=None, stop_links=None):
+    """Parse a feed body in the parser pool, falling back to inline parsing"""
+    global _pool
+    pool = get_parse_pool()
+    if pool is None:
+        return parse_feed_body(body, content_type, stop_links)
+
+    try:
+        return pool.submit(parse_feed_body, body, content_type, stop_links).result()
+    except BrokenProcessPool as e:
+        logging.error(f"Feed parser pool broken, restarting it: {str(e)}")
+        with _pool_lock:
+            if _pool is pool:
+                _pool = None
+        return parse_feed_body(body, content_type, stop_links)
+
+atexit.register(shutdown_parse_pool)
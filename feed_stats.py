@@ -0,0 +1,77 @@
+import logging
+import os
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from models import Article, FeedDailyStats, RSSFeed, db
+
+# Feeds recounted and committed at a time by the backfill
+STATS_BACKFILL_BATCH_SIZE = int(os.environ.get('STATS_BACKFILL_BATCH_SIZE', 100))
+
+def _article_day():
+    return func.date(func.coalesce(Article.published_date, Article.collected_date))
+
+def add_article_counts(rows):
+    """Count newly inserted article rows in their feed's day, in the caller's transaction"""
+    today = datetime.utcnow().date()
+    counts = Counter((row['feed_id'], row['published_date'].date() if row.get('published_date') else today)
+                     for row in rows)
+    if not counts:
+        return
+    dialect = postgresql if db.session.get_bind().dialect.name == 'postgresql' else sqlite
+    stmt = dialect.insert(FeedDailyStats)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[FeedDailyStats.feed_id, FeedDailyStats.day],
+        set_={'articles': FeedDailyStats.articles + stmt.excluded.articles}
+    )
+    db.session.execute(stmt, [{'feed_id': feed_id, 'day': day, 'articles': articles}
+                              for (feed_id, day), articles in counts.items()])
+
+def recount_feeds(feed_ids):
+    """Rebuild the rollups of `feed_ids` from their articles, in the caller's transaction"""
+    db.session.execute(delete(FeedDailyStats).where(FeedDailyStats.feed_id.in_(feed_ids)))
+    day = _article_day()
+    db.session.execute(
+        FeedDailyStats.__table__.insert().from_select(
+            ['feed_id', 'day', 'articles'],
+            select(Article.feed_id, day, func.count()).where(Article.feed_id.in_(feed_ids))
+            .group_by(Article.feed_id, day)
+        )
+    )
+
+def delete_feed_stats(feed_id):
+    db.session.execute(delete(FeedDailyStats).where(FeedDailyStats.feed_id == feed_id))
+
+def backfill_feed_stats(batch_size=STATS_BACKFILL_BATCH_SIZE):
+    """Build the rollups of feeds whose articles were stored before they existed.
+
+    Each batch of feeds is recounted and flagged in one transaction, so it
+    can be interrupted and resumed. Returns the number of feeds counted.
+    """
+    counted = 0
+    last_id = 0
+    try:
+        while True:
+            feed_ids = db.session.scalars(
+                select(RSSFeed.id)
+                .where(RSSFeed.stats_backfilled.isnot(True), RSSFeed.id > last_id)
+                .order_by(RSSFeed.id)
+                .limit(batch_size)
+            ).all()
+            if not feed_ids:
+                break
+            recount_feeds(feed_ids)
+            db.session.execute(update(RSSFeed).where(RSSFeed.id.in_(feed_ids)).values(stats_backfilled=True))
+            db.session.commit()
+            last_id = feed_ids[-1]
+            counted += len(feed_ids)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error backfilling feed statistics: {str(e)}")
+        return None
+
+    if counted:
+        logging.info(f"Backfilled daily statistics of {counted} feeds")
+    return counted
@@ -1,88 +1,18 @@
-import feedparser
+from collections import Counter
 from datetime import datetime
 import logging
-from models import RSSFeed, Article, ScanProgress, db
-import socket
-from sqlalchemy.exc import SQLAlchemyError
-import os
-import urllib.request
-import urllib.error
-import urllib.parse
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
-
-# Set socket timeout for feedparser
-socket.setdefaulttimeout(5)  # Reduced from 10 to 5 seconds timeout
-
-def parse_proxy_url(proxy_url):
-    """Parse and normalize proxy URL"""
-    if not proxy_url:
-        return None
-
-    # If it doesn't start with a protocol, assume http://
-    if not proxy_url.startswith(('http://', 'https://')):
-        proxy_url = 'http://' + proxy_url
-
-    try:
-        parsed = urllib.parse.urlparse(proxy_url)
-        return proxy_url if parsed.netloc else None
-    except Exception as e:
-        logging.warning(f"Invalid proxy URL format: {str(e)}")
-        return None
-
-def get_proxy_handlers():
-    """Get proxy handlers from environment variables"""
-    proxy_handlers = []
-
-    # Common proxy environment variable names
-    proxy_vars = [
-        ('http_proxy', 'http'),
-        ('HTTP_PROXY', 'http'),
-        ('https_proxy', 'https'),
-        ('HTTPS_PROXY', 'https'),
-        ('all_proxy', 'all'),
-        ('ALL_PROXY', 'all')
-    ]
-
-    proxies = {}
-    for var_name, proxy_type in proxy_vars:
-        proxy_url = os.environ.get(var_name, os.environ.get(var_name.upper()))
-        if proxy_url:
-            parsed_url = parse_proxy_url(proxy_url)
-            if parsed_url:
-                proxies[proxy_type] = parsed_url
-
-    if proxies:
-        for proxy_type, url in proxies.items():
-            if proxy_type in ('http', 'all'):
-                proxy_handlers.append(urllib.request.ProxyHandler({'http': url}))
-            if proxy_type in ('https', 'all'):
-                proxy_handlers.append(urllib.request.ProxyHandler({'https': url}))
-
-    return proxy_handlers
-
-def parse_feed_with_proxy(url):
-    """Parse feed URL with proxy support"""
-    handlers = get_proxy_handlers()
-
-    if handlers:
-        # Create an opener with the proxy handlers
-        opener = urllib.request.build_opener(*handlers)
-        # Set a modern User-Agent
-        feedparser.USER_AGENT = 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36'
-
-        try:
-            # Use the opener to fetch the feed
-            response = opener.open(url)
-            feed_content = response.read()
-            return feedparser.parse(feed_content)
-        except Exception as e:
-            logging.error(f"Error fetching feed: {str(e)}")
-            # Fallback to direct connection if proxy fails
-            return feedparser.parse(url)
-    else:
-        return feedparser.parse(url)
+import time
+from sqlalchemy import and_
+from models import SCANNER_NODE_ID, RSSFeed, ScanProgress, db
+from ingest_pipeline import SCAN_TIME_BUDGET_SECONDS, IngestPipeline, refresh_feed, scan_chunks
+import metrics
+from scan_history import add_scan_results, finish_scan_run, prune_scan_history, start_scan_run
+from profiling import profile_scan
+from sharding import count_owned_feeds, heartbeat, live_nodes, owns
+from export_snapshots import append_new_articles
+from websub import polled_feeds_filter
+from feed_deletion import active_feeds_filter
+import raw_store
 
 def reset_scan_progress():
     """Reset scan progress in database"""
@@ -105,116 +35,81 @@ def update_scan_progress(**kwargs):
         progress = ScanProgress.get_current()
         progress.update(**kwargs)
         if 'current_feed' in kwargs:
-            logging.info(f"Scanning feed: {kwargs['current_feed']}")
-        if 'current_index' in kwargs and 'total_feeds' in kwargs:
-            logging.info(f"Progress: {kwargs['current_index']}/{kwargs['total_feeds']} feeds")
+            logging.debug(f"Scanning feed: {kwargs['current_feed']}")
     except Exception as e:
         logging.error(f"Error updating scan progress: {str(e)}")
 
 def update_single_feed(feed):
-    try:
-        logging.info(f"Starting feed update for: {feed.url}")
-        current_time = datetime.utcnow()
-
-        # Use proxy-aware feed parser
-        parsed = parse_feed_with_proxy(feed.url)
-
-        if not parsed.feed:
-            logging.error(f"No feed data found for {feed.url}")
-            raise Exception("No feed data found")
-
-        feed.title = parsed.feed.title if hasattr(parsed.feed, 'title') else feed.url
-        feed.last_updated = current_time
-        feed.last_scan_time = current_time
-        feed.status = 'active'
-        feed.error_count = 0
-
-        current_count = Article.query.filter_by(feed_id=feed.id).count()
-        new_articles = 0
-        total_retrieved = len(parsed.entries)
-        existing_articles = 0
-        latest_date = feed.last_article_date
-        articles_to_add = []
-
-        logging.info(f"Processing {total_retrieved} articles from feed: {feed.title or feed.url}")
-        for entry in parsed.entries:
-            if not Article.query.filter_by(link=entry.link).first():
-                published_date = datetime(*entry.published_parsed[:6]) if 'published_parsed' in entry else None
-                article = Article(
-                    feed_id=feed.id,
-                    title=entry.title,
-                    link=entry.link,
-                    description=entry.get('description', ''),
-                    published_date=published_date
-                )
-                articles_to_add.append(article)
-                new_articles += 1
-                if published_date and (not latest_date or published_date > latest_date):
-                    latest_date = published_date
-            else:
-                existing_articles += 1
-
-        # Batch add articles
-        if articles_to_add:
-            try:
-                logging.info(f"Feed statistics for {feed.title or feed.url}:")
-                logging.info(f"- Total articles retrieved: {total_retrieved}")
-                logging.info(f"- New articles to add: {new_articles}")
-                logging.info(f"- Already existing articles: {existing_articles}")
-                db.session.bulk_save_objects(articles_to_add)
-                db.session.commit()
-            except SQLAlchemyError as e:
-                db.session.rollback()
-                logging.error(f"Error saving articles: {str(e)}")
-                raise
-
-        feed.num_articles = current_count + new_articles
-        if latest_date:
-            feed.last_article_date = latest_date
-
-        try:
-            db.session.commit()
-            logging.info(f"Feed update completed successfully for {feed.title or feed.url}")
-        except SQLAlchemyError as e:
-            db.session.rollback()
-            logging.error(f"Error updating feed: {str(e)}")
-            raise
-
-        # Return updated feed data for frontend
-        return {
-            'message': 'Feed refreshed successfully',
-            'feed': {
-                'last_scan_time': feed.last_scan_time.isoformat() if feed.last_scan_time else None,
-                'last_article_date': feed.last_article_date.isoformat() if feed.last_article_date else None
-            }
+    """Refresh one feed ahead of scheduled work.
+
+    Joins the scan running in this process if there is one. Returns the
+    updated feed data for the frontend; raises if the refresh failed.
+    """
+    logging.info(f"Starting feed update for: {feed.url}")
+    feed_id = feed.id
+    result = refresh_feed(feed)
+    if result['status'] == 'error':
+        raise Exception(result['error'])
+
+    # The feed may have been stored by the scan thread's session
+    feed = db.session.get(RSSFeed, feed_id, populate_existing=True)
+    return {
+        'message': 'Feed unchanged since last scan' if result['status'] == 'unchanged' else 'Feed refreshed successfully',
+        'feed': {
+            'last_scan_time': feed.last_scan_time.isoformat() if feed.last_scan_time else None,
+            'last_article_date': feed.last_article_date.isoformat() if feed.last_article_date else None
         }
-
-    except Exception as e:
-        db.session.rollback()  # Rollback on error
-        feed.status = 'error'
-        feed.error_count += 1
-        feed.last_error = str(e)
-        logging.error(f"Error updating feed {feed.url}: {str(e)}")
-        try:
-            db.session.commit()
-        except SQLAlchemyError as commit_error:
-            db.session.rollback()
-            logging.error(f"Error updating feed error status: {str(commit_error)}")
-        raise
-
-def update_all_feeds(trigger='manual'):
+    }
+
+def scan_plan(sharded, polled_only=False):
+    """Return (number of feeds, job loader) for a scan of all feeds or of this node's shard.
+
+    Feeds being deleted are left out. With `polled_only`, so are feeds kept
+    current by WebSub pushes until their safety-net poll is due. Feeds an
+    earlier scan deferred come first.
+    """
+    where = and_(active_feeds_filter, polled_feeds_filter()) if polled_only else active_feeds_filter
+    if not sharded:
+        return RSSFeed.query.filter(where).count(), scan_chunks(where=where)
+    heartbeat()
+    nodes = live_nodes()
+    total_feeds = count_owned_feeds(nodes, where=where)
+    logging.info(f"Node {SCANNER_NODE_ID} owns {total_feeds} feeds, shared by {len(nodes)} scanner nodes")
+    return total_feeds, scan_chunks(keep=lambda feed_id: owns(feed_id, nodes), where=where)
+
+def update_all_feeds(trigger='manual', sharded=None):
+    """Scan every feed for new articles.
+
+    Scheduled scans only cover the feeds this node owns among the live scanner
+    nodes, and skip feeds kept current by WebSub pushes until their safety-net
+    poll is due; manual scans cover every feed unless `sharded` says otherwise.
+    Feeds not fetched within SCAN_TIME_BUDGET_SECONDS are deferred to the
+    next scan and listed in the scan history. Returns a summary of the run with totals and the time spent in each
+    scan phase, or None if there are no feeds. The scan is profiled when
+    profiling of the next scan has been requested.
+    """
+    if sharded is None:
+        sharded = trigger == 'automatic'
+    with profile_scan(trigger):
+        return _scan_all_feeds(trigger, sharded)
+
+def _scan_all_feeds(trigger, sharded):
     logging.info(f"Starting {trigger} feed update process")
+    scan_start = time.perf_counter()
+    started_at = datetime.utcnow()
+    run_id = None
+    pipeline = None
+    scan_status = 'failed'
     try:
         # Reset scan progress at the start
         reset_scan_progress()
 
-        # Get all feeds within this session
-        feeds = RSSFeed.query.all()
-        total_feeds = len(feeds)
+        # Feeds are read in id-ordered chunks as the scan goes, not all at once
+        total_feeds, load_chunk = scan_plan(sharded, polled_only=trigger == 'automatic')
 
         if total_feeds == 0:
             logging.info("No feeds found to update")
-            return
+            return None
 
         # Initialize scan progress
         update_scan_progress(
@@ -224,133 +119,82 @@ def update_all_feeds(trigger='manual'):
             total_feeds=total_feeds,
             completed=False
         )
-
-        current_time = datetime.utcnow()
-        batch_size = 5  # Increased from 1 to 5 for more efficient processing
-        processed_count = 0
-        successful_updates = 0
-        failed_updates = 0
-        total_articles_retrieved = 0
-        total_new_articles = 0
-        total_existing_articles = 0
-
-        # Process feeds in batches
-        for i in range(0, total_feeds, batch_size):
-            batch = feeds[i:i + batch_size]
-
-            for feed in batch:
-                try:
-                    # Refresh the feed object for this iteration
-                    feed = db.session.merge(feed)
-                    processed_count += 1
-
-                    update_scan_progress(
-                        current_feed=feed.title or feed.url,
-                        current_index=processed_count,
-                        completed=False
-                    )
-
-                    parsed = parse_feed_with_proxy(feed.url)
-                    feed_articles_retrieved = len(parsed.entries)
-                    total_articles_retrieved += feed_articles_retrieved
-
-                    feed.title = parsed.feed.title if hasattr(parsed.feed, 'title') else feed.url
-                    feed.last_updated = current_time
-                    feed.last_scan_time = current_time
-                    feed.last_scan_trigger = trigger
-                    feed.status = 'active'
-                    feed.error_count = 0
-
-                    current_count = Article.query.filter_by(feed_id=feed.id).count()
-                    new_articles = 0
-                    existing_articles = 0
-                    latest_date = feed.last_article_date
-                    articles_to_add = []
-
-                    logging.info(f"Processing {feed_articles_retrieved} articles from feed: {feed.title or feed.url}")
-
-                    for entry_index, entry in enumerate(parsed.entries):
-                        try:
-                            if not Article.query.filter_by(link=entry.link).first():
-                                published_date = datetime(*entry.published_parsed[:6]) if 'published_parsed' in entry else None
-                                article = Article(
-                                    feed_id=feed.id,
-                                    title=entry.title,
-                                    link=entry.link,
-                                    description=entry.get('description', ''),
-                                    published_date=published_date
-                                )
-                                articles_to_add.append(article)
-                                new_articles += 1
-                                if published_date and (not latest_date or published_date > latest_date):
-                                    latest_date = published_date
-                            else:
-                                existing_articles += 1
-
-                        except Exception as article_error:
-                            logging.error(f"Error processing article {entry_index} for feed {feed.url}: {str(article_error)}")
-                            continue
-
-                    total_new_articles += new_articles
-                    total_existing_articles += existing_articles
-
-                    # Batch add articles with error handling
-                    if articles_to_add:
-                        try:
-                            logging.info(f"Feed statistics for {feed.title or feed.url}:")
-                            logging.info(f"- Total articles retrieved: {feed_articles_retrieved}")
-                            logging.info(f"- New articles to add: {new_articles}")
-                            logging.info(f"- Already existing articles: {existing_articles}")
-                            db.session.bulk_save_objects(articles_to_add)
-                            db.session.commit()
-                        except SQLAlchemyError as e:
-                            db.session.rollback()
-                            logging.error(f"Error saving articles batch: {str(e)}")
-                            continue
-
-                    feed.num_articles = current_count + new_articles
-                    if latest_date:
-                        feed.last_article_date = latest_date
-
-                    try:
-                        db.session.commit()
-                        successful_updates += 1
-                        logging.info(f"Successfully updated feed: {feed.title or feed.url}")
-                    except SQLAlchemyError as e:
-                        db.session.rollback()
-                        logging.error(f"Error updating feed status: {str(e)}")
-                        continue
-
-                except Exception as feed_error:
-                    failed_updates += 1
-                    db.session.rollback()
-                    feed.status = 'error'
-                    feed.error_count += 1
-                    feed.last_error = str(feed_error)
-                    feed.last_scan_time = current_time
-                    feed.last_scan_trigger = trigger
-                    try:
-                        db.session.commit()
-                    except SQLAlchemyError as commit_error:
-                        db.session.rollback()
-                        logging.error(f"Error updating feed error status: {str(commit_error)}")
-                    logging.error(f"Error updating feed {feed.url}: {str(feed_error)}")
-                    continue
+        run_id = start_scan_run(trigger, started_at)
+
+        def on_progress(processed, current_feed):
+            # Written by the pipeline's next group commit. Loaded each time
+            # because the pipeline clears the session between groups.
+            ScanProgress.get_current().update(commit=False, current_feed=current_feed, current_index=processed,
+                                              completed=False)
+
+        def on_results(results):
+            # History is written in batches as the scan goes, to keep it off the per-feed path
+            add_scan_results(run_id, results)
+
+        pipeline = IngestPipeline(trigger=trigger, on_progress=on_progress, serve_refreshes=True,
+                                  on_results=on_results, budget=SCAN_TIME_BUDGET_SECONDS)
+        pipeline.run_chunks(load_chunk)
+        append_new_articles()
+        if raw_store.enabled():
+            raw_store.evict()
+
+        counts = pipeline.status_counts
+        failed_updates = counts['error']
+        unchanged_feeds = counts['unchanged']
+        successful_updates = sum(counts.values()) - failed_updates
+        total_new_articles = pipeline.new_articles
+        total_articles_retrieved = pipeline.articles_retrieved
+        total_existing_articles = pipeline.existing_articles
+        phase_times = pipeline.phase_times
 
         # Log aggregate statistics
         logging.info("=== Feed Update Process Summary ===")
         logging.info(f"Total feeds processed: {total_feeds}")
         logging.info(f"Successful updates: {successful_updates}")
         logging.info(f"Failed updates: {failed_updates}")
+        logging.info(f"Unchanged feeds skipped: {unchanged_feeds}")
+        logging.info(f"Feeds timed out: {pipeline.timed_out}")
+        logging.info(f"Feeds deferred to the next scan: {pipeline.deferred_count}")
         logging.info(f"Total articles retrieved: {total_articles_retrieved}")
         logging.info(f"Total new articles added: {total_new_articles}")
         logging.info(f"Total existing articles: {total_existing_articles}")
+        logging.info("Phase timings: " + ', '.join(f"{name}={seconds:.2f}s" for name, seconds in phase_times.items()))
         logging.info("================================")
 
+        duration = time.perf_counter() - scan_start
+        metrics.SCAN_DURATION_SECONDS.labels(trigger=trigger).observe(duration)
+        metrics.FEEDS_IN_ERROR.set(RSSFeed.query.filter_by(status='error').count())
+        scan_status = 'completed'
+
+        return {
+            'trigger': trigger,
+            'total_feeds': total_feeds,
+            'successful_updates': successful_updates,
+            'failed_updates': failed_updates,
+            'unchanged_feeds': unchanged_feeds,
+            'timed_out_feeds': pipeline.timed_out,
+            'deferred_feeds': pipeline.deferred_count,
+            'articles_retrieved': total_articles_retrieved,
+            'new_articles': total_new_articles,
+            'existing_articles': total_existing_articles,
+            'duration': duration,
+            'phase_times': dict(phase_times)
+        }
+
     except Exception as e:
         logging.error(f"Error in update_all_feeds: {str(e)}")
         raise
     finally:
         # Reset scan progress when done
         reset_scan_progress()
-        logging.info("Feed update process finished")
\ No newline at end of file
+        if run_id is not None:
+            if pipeline is not None:
+                # Results not handed over yet when the scan stopped early
+                add_scan_results(run_id, pipeline.results)
+            counts = pipeline.status_counts if pipeline else Counter()
+            finish_scan_run(run_id, datetime.utcnow(), scan_status, sum(counts.values()),
+                            counts['success'] + counts['unchanged'], counts['error'],
+                            pipeline.new_articles if pipeline else 0,
+                            pipeline.deferred_count if pipeline else 0)
+            prune_scan_history()
+        logging.info("Feed update process finished")
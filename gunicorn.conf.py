@@ -9,7 +9,8 @@ backlog = 2048
 workers = multiprocessing.cpu_count() * 2 + 1
 worker_class = 'sync'
 worker_connections = 1000
-timeout = 30
+# Exported so the app can keep its own waits (FEED_REFRESH_TIMEOUT) under it
+timeout = int(os.environ.setdefault('GUNICORN_TIMEOUT', '30'))
 keepalive = 2
 
 # Logging
@@ -22,12 +23,16 @@ os.makedirs(logs_dir, mode=0o755, exist_ok=True)
 accesslog = os.path.join(logs_dir, 'gunicorn_access.log')
 errorlog = os.path.join(logs_dir, 'gunicorn_error.log')
 capture_output = True  # Capture and redirect application stdout/stderr to logging
-loglevel = 'debug'  # Changed to debug for more detailed logging
+loglevel = 'info'  # Application log level can be changed at runtime from the UI
 access_log_format = '%(h)s %(l)s %(u)s %(t)s "%(r)s" %(s)s %(b)s "%(f)s" "%(a)s"'
 
 # Process naming
 proc_name = 'rss-feed-manager'
 
+# Metrics from all workers are aggregated through files in this directory.
+# It must be set before the workers import prometheus_client.
+metrics_dir = os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', os.path.join(base_dir, 'instance', 'prometheus'))
+
 def post_worker_init(worker):
     """Ensure proper logging initialization after worker start"""
     import logging
@@ -35,12 +40,27 @@ def post_worker_init(worker):
     setup_logging()
     logging.info(f"Gunicorn worker {worker.pid} initialized")
 
+def child_exit(server, worker):
+    """Drop the live gauges of workers that exited"""
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
+
 # Ensure log files have proper permissions
 def on_starting(server):
     """Ensure log files exist and have proper permissions before starting"""
+    # Start every server run with empty metric files
+    os.makedirs(metrics_dir, exist_ok=True)
+    for name in os.listdir(metrics_dir):
+        if name.endswith('.db'):
+            os.remove(os.path.join(metrics_dir, name))
+
     for log_file in [accesslog, errorlog]:
         # Create log file if it doesn't exist
         if not os.path.exists(log_file):
             open(log_file, 'a').close()
         # Set permissions to 664
-        os.chmod(log_file, 0o664)
\ No newline at end of file
+        os.chmod(log_file, 0o664)
+
+    # Single application log writer in the master; workers inherit its queue
+    import log_pipeline
+    log_pipeline.start_shared_writer(logs_dir)
\ No newline at end of file
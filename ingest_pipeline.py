@@ -0,0 +1,1040 @@
+import hashlib
+import itertools
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+from sqlalchemy import and_, bindparam, func, insert, or_, select, tuple_, update
+from sqlalchemy.exc import SQLAlchemyError
+from models import RSSFeed, Article, db
+from feed_fetcher import FEED_TOTAL_TIMEOUT, FetchTimeout, fetch_feed_with_proxy
+from feed_import import MAX_URL_LENGTH, normalize_feed_url
+from feed_parser import PARSE_WORKERS, parse_in_pool
+from text_normalize import plain_title
+from feed_stats import add_article_counts, recount_feeds
+from feed_deletion import active_feeds_filter
+from export_snapshots import discard_snapshots
+import raw_store
+from websub import note_hub
+from log_pipeline import log_feed_result
+import metrics
+from profiling import profiled_thread
+
+# Phases timed during a scan; dedup, persist and progress are database time.
+# Fetch and parse run in worker threads, so their totals are busy time
+# summed over the workers rather than wall time.
+SCAN_PHASES = ('fetch', 'parse', 'dedup', 'persist', 'progress')
+
+# Concurrent downloads
+FETCH_WORKERS = int(os.environ.get('FEED_FETCH_WORKERS', 8))
+
+# Threads handing bodies to the parser pool, one per parser process
+PARSE_STAGE_WORKERS = max(1, PARSE_WORKERS)
+
+# A group of feeds is committed once any of these thresholds is reached
+GROUP_COMMIT_FEEDS = int(os.environ.get('GROUP_COMMIT_FEEDS', 50))
+GROUP_COMMIT_ARTICLES = int(os.environ.get('GROUP_COMMIT_ARTICLES', 2000))
+GROUP_COMMIT_SECONDS = float(os.environ.get('GROUP_COMMIT_SECONDS', 2.0))
+
+# Stage queues hand out interactive refreshes before scheduled work
+PRIORITY_INTERACTIVE = 0
+PRIORITY_SCHEDULED = 1
+_PRIORITY_LAST = 2
+
+# Feeds read from the database per query during a scan; jobs are loaded as
+# plain columns, a chunk at a time, so memory does not grow with the feed table
+SCAN_CHUNK_SIZE = int(os.environ.get('SCAN_CHUNK_SIZE', 500))
+
+# Finished results are handed to `on_results` in batches of this size
+RESULT_BATCH_SIZE = 500
+
+# Wall time a scan may take, in seconds (0 for no limit). Feeds not fetched
+# by then are deferred, and the next scan takes them before the others.
+SCAN_TIME_BUDGET_SECONDS = float(os.environ.get('SCAN_TIME_BUDGET_SECONDS', 1500))
+
+# Feed ids per UPDATE when flagging deferred feeds
+DEFER_BATCH_SIZE = 500
+
+# How long a refresh waits for its feed to be stored. By default a few seconds
+# under the gunicorn worker timeout, so the request can still answer 504.
+REFRESH_TIMEOUT = int(os.environ.get('FEED_REFRESH_TIMEOUT')
+                      or max(1, int(os.environ.get('GUNICORN_TIMEOUT', 30)) - 5))
+
+# Work items handed from one stage to the next. Only plain data crosses
+# threads; ORM objects stay in the persist stage, which owns the session.
+# `pushed` is a FetchResult with content a WebSub hub pushed, stored instead of fetching.
+# `stored` is the hash of a body in the raw store to rebuild the feed's articles from.
+FeedJob = namedtuple('FeedJob', ['feed_id', 'url', 'body_hash', 'stop_links', 'priority', 'pushed', 'stored'],
+                     defaults=(PRIORITY_SCHEDULED, None, None))
+FeedOutcome = namedtuple('FeedOutcome', ['job', 'started', 'timings', 'fetched', 'body_hash', 'parsed',
+                                         'unchanged', 'error'],
+                         defaults=(None, None, None, False, None))
+
+# Marks the end of a stage's output
+_DONE = object()
+
+# Asks the persist stage to commit its open group
+_COMMIT = object()
+
+# Links per IN query when checking which entries are already stored
+DEDUP_BATCH_SIZE = 500
+
+# Full scans in a row without reordering after which a flagged feed is
+# processed incrementally again
+REORDER_CLEAR_SCANS = int(os.environ.get('FEED_REORDER_CLEAR_SCANS', 10))
+
+# Rewrites a stored article of a feed from a new parse of its body
+_articles = Article.__table__
+_ARTICLE_REWRITE = _articles.update() \
+    .where(_articles.c.feed_id == bindparam('b_feed_id'), _articles.c.link == bindparam('b_link')) \
+    .values(title=bindparam('b_title'), description=bindparam('b_description'),
+            title_text=bindparam('b_title_text'), description_text=bindparam('b_description_text'),
+            published_date=func.coalesce(bindparam('b_published'), _articles.c.published_date))
+
+def body_fingerprint(body):
+    return hashlib.sha256(body).hexdigest()
+
+def incremental_stop_links(feed):
+    """Links at which parsing may stop, or None when the whole feed must be read"""
+    if feed.last_seen_link and not feed.reorders_entries:
+        return frozenset((feed.last_seen_link,))
+    return None
+
+def job_chunks(keep=None, chunk_size=SCAN_CHUNK_SIZE, where=None, deferred=False):
+    """Return a loader of FeedJobs for every feed in id order, one chunk per call.
+
+    The loader returns None once all feeds were read. `keep` filters feeds by
+    id, so a chunk can be empty before the end; `where` is an SQL condition
+    on the feeds to load. With `deferred`, only feeds deferred by an earlier
+    scan are loaded, longest deferred first.
+    """
+    key = (RSSFeed.scan_deferred_at, RSSFeed.id) if deferred else (RSSFeed.id,)
+    last = None
+
+    def load():
+        nonlocal last
+        query = select(RSSFeed.id, RSSFeed.url, RSSFeed.body_hash, RSSFeed.last_seen_link, RSSFeed.reorders_entries,
+                       RSSFeed.scan_deferred_at)
+        if where is not None:
+            query = query.where(where)
+        if deferred:
+            query = query.where(RSSFeed.scan_deferred_at.isnot(None))
+        if last is not None:
+            query = query.where(tuple_(*key) > tuple_(*last))
+        rows = db.session.execute(query.order_by(*key).limit(chunk_size)).all()
+        if not rows:
+            return None
+        last = (rows[-1].scan_deferred_at, rows[-1].id) if deferred else (rows[-1].id,)
+        return [FeedJob(row.id, row.url, row.body_hash, incremental_stop_links(row))
+                for row in rows if keep is None or keep(row.id)]
+
+    return load
+
+def scan_chunks(keep=None, where=None):
+    """Like job_chunks, but feeds deferred by an earlier scan come first"""
+    started = datetime.utcnow()
+    load_deferred = job_chunks(keep, where=where, deferred=True)
+    # Deferred feeds stay flagged until stored, and are stamped as scanned once
+    # they are, so neither kind is loaded a second time
+    rest = and_(RSSFeed.scan_deferred_at.is_(None),
+                or_(RSSFeed.last_scan_time.is_(None), RSSFeed.last_scan_time < started))
+    load_rest = job_chunks(keep, where=and_(where, rest) if where is not None else rest)
+    exhausted = False
+
+    def load():
+        nonlocal exhausted
+        if not exhausted:
+            jobs = load_deferred()
+            if jobs is not None:
+                return jobs
+            exhausted = True
+        return load_rest()
+
+    return load
+
+def find_known_links(links):
+    """Return the subset of `links` already stored as articles"""
+    links = list(links)
+    known = set()
+    for i in range(0, len(links), DEDUP_BATCH_SIZE):
+        known.update(db.session.scalars(
+            select(Article.link).where(Article.link.in_(links[i:i + DEDUP_BATCH_SIZE]))
+        ))
+    return known
+
+def _reordered(feed, entries, known):
+    """Entries above the high-water mark that are already stored or older than it mean the feed reorders"""
+    if known:
+        return True
+    return bool(feed.last_seen_date) and any(
+        entry.published and entry.published < feed.last_seen_date for entry in entries
+    )
+
+def select_new_entries(feed, parsed, reparse):
+    """Return the entries of a parsed feed that still need storing and the number of known ones.
+
+    Feeds list their newest entries first, so only the entries above the feed's
+    high-water mark (the first entry seen on the previous scan) are checked.
+    Feeds caught reordering their entries are flagged and processed in full
+    until REORDER_CLEAR_SCANS scans in a row find them in order again;
+    `reparse` returns the complete feed when parsing stopped early.
+    """
+    entries = parsed.entries
+    mark = None
+    if feed.last_seen_link:
+        for index, entry in enumerate(entries):
+            if entry.link == feed.last_seen_link:
+                mark = index
+                break
+    if mark is not None and not feed.reorders_entries:
+        entries = entries[:mark]
+
+    known = find_known_links(entry.link for entry in entries)
+    if mark is not None and not feed.reorders_entries and _reordered(feed, entries, known):
+        logging.info(f"Feed {feed.url} reorders its entries, switching to full processing")
+        feed.reorders_entries = True
+        feed.in_order_scans = 0
+        if parsed.truncated:
+            parsed = reparse()
+        entries = parsed.entries
+        known = find_known_links(entry.link for entry in entries)
+    elif mark is not None and feed.reorders_entries:
+        above = entries[:mark]
+        if _reordered(feed, above, known.intersection(entry.link for entry in above)):
+            feed.in_order_scans = 0
+        else:
+            feed.in_order_scans = (feed.in_order_scans or 0) + 1
+            if feed.in_order_scans >= REORDER_CLEAR_SCANS:
+                logging.info(f"Feed {feed.url} kept its entries in order for {feed.in_order_scans} scans, "
+                             f"switching back to incremental processing")
+                feed.reorders_entries = False
+                feed.in_order_scans = 0
+
+    new_entries = []
+    for entry in entries:
+        if entry.link not in known:
+            # Also drops entries repeated within the same feed
+            known.add(entry.link)
+            new_entries.append(entry)
+    return new_entries, len(entries) - len(new_entries)
+
+def advance_high_water(feed, parsed, body_hash):
+    """Remember the fetched body and the newest entry after a successful scan"""
+    feed.body_hash = body_hash
+    if parsed.entries:
+        feed.last_seen_link = parsed.entries[0].link
+    dates = [entry.published for entry in parsed.entries if entry.published]
+    if feed.last_seen_date:
+        dates.append(feed.last_seen_date)
+    if dates:
+        feed.last_seen_date = max(dates)
+
+@contextmanager
+def timed(name, timings):
+    """Add the duration of the block to `timings[name]` and the phase metric"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        timings[name] += elapsed
+        metrics.observe_phase(name, elapsed)
+
+class IngestPipeline:
+    """Fetch, parse and store feeds in three stages joined by bounded queues.
+
+    Fetch threads download feeds, parse threads hand the bodies to the parser
+    pool and the calling thread persists the results. Feeds are committed in
+    groups; if a group fails to commit it is retried one feed at a time, so a
+    bad feed only fails itself. Must be run inside an app context.
+    """
+
+    def __init__(self, trigger='manual', fetch_workers=FETCH_WORKERS, on_progress=None, serve_refreshes=False,
+                 on_results=None, budget=None, fetch_timeout=FEED_TOTAL_TIMEOUT):
+        self.trigger = trigger
+        self.fetch_workers = max(1, fetch_workers)
+        # Called before each group commit with the number of feeds processed
+        # and the last feed, to update the progress in the same transaction
+        self.on_progress = on_progress
+        # Whether single-feed refreshes of this process join this run
+        self.serve_refreshes = serve_refreshes
+        # If set, finished results are passed here in batches instead of kept
+        self.on_results = on_results
+        # Seconds the run may take; feeds not fetched by then are deferred
+        self.budget = budget
+        self._budget_ends = None
+        # Limit of each fetch, see feed_fetcher.fetch_feed
+        self.fetch_timeout = fetch_timeout
+
+        self.results = []
+        self.status_counts = Counter()
+        self.new_articles = 0
+        self.phase_times = dict.fromkeys(SCAN_PHASES, 0.0)
+        self.articles_retrieved = 0
+        self.existing_articles = 0
+        self.updated_articles = 0
+        self.processed = 0
+        # Feeds left for the next scan by the time budget, and feeds whose fetch timed out
+        self.deferred_count = 0
+        self.timed_out = 0
+        # Deferred jobs not flagged yet, flagged in batches as the scan goes
+        self._deferred = []
+
+        self._pending = []
+        self._pending_articles = 0
+        self._group_started = None
+        # Article rows of the open group, written just before its commit so the
+        # database write lock is only held for the commit itself
+        self._pending_rows = []
+        self._pending_links = set()
+        self._pending_urls = set()
+        # Rewrites of stored articles staged by raw store rebuilds
+        self._pending_updates = []
+        # Feeds loaded by the current group, expunged once it is committed
+        self._touched = []
+        self._stop = threading.Event()
+        self._exhausted = threading.Event()
+        self._lock = threading.Lock()
+        self._sequence = itertools.count()
+
+        # Refresh bookkeeping, guarded by _lock: feeds whose fetch has started
+        # and is not committed yet, feeds fetched by a refresh before the fetch
+        # workers reached them, and the refreshes waiting for each feed
+        self._started = set()
+        self._claimed = set()
+        self._waiters = {}
+        # Feeds of this run not yet counted or reported
+        self._to_process = set()
+        self._to_report = set()
+
+    # Worker stages
+
+    def _put(self, target, item, priority=PRIORITY_SCHEDULED):
+        """Blocking put that gives up once the pipeline is stopping"""
+        entry = (priority, next(self._sequence), item)
+        while True:
+            try:
+                target.put(entry, timeout=0.5)
+                return True
+            except queue.Full:
+                if self._stop.is_set():
+                    return False
+
+    def _stage_finished(self, stage, target, sentinels):
+        """The last worker of a stage tells the next stage there is no more work"""
+        with self._lock:
+            self._live[stage] -= 1
+            last = self._live[stage] == 0
+        if last:
+            for _ in range(sentinels):
+                self._put(target, _DONE, _PRIORITY_LAST)
+
+    def _fetch(self, job):
+        outcome = FeedOutcome(job, time.perf_counter(), dict.fromkeys(SCAN_PHASES, 0.0))
+        if job.pushed is not None:
+            return outcome._replace(fetched=job.pushed)
+        if job.stored is not None:
+            try:
+                with timed('fetch', outcome.timings):
+                    fetched = raw_store.get(job.stored)
+            except Exception as e:
+                return outcome._replace(error=e)
+            if fetched is None:
+                return outcome._replace(error=Exception("Body no longer in the raw store"))
+            return outcome._replace(fetched=fetched)
+        deadline = time.monotonic() + self.fetch_timeout
+        if self._budget_ends is not None and job.priority == PRIORITY_SCHEDULED:
+            deadline = min(deadline, self._budget_ends)
+        try:
+            with timed('fetch', outcome.timings):
+                fetched = fetch_feed_with_proxy(job.url, deadline)
+            metrics.FEED_FETCH_BYTES.observe(len(fetched.body))
+            return outcome._replace(fetched=fetched)
+        except Exception as e:
+            return outcome._replace(error=e)
+
+    def _fetch_worker(self):
+        try:
+            while not self._stop.is_set():
+                try:
+                    job = self._jobs.get(timeout=0.5)
+                except queue.Empty:
+                    continue
+                if job is _DONE:
+                    break
+                with self._lock:
+                    if job.feed_id in self._claimed:
+                        continue
+                    self._started.add(job.feed_id)
+                if self._out_of_time() and self._defer(job):
+                    continue
+                outcome = self._fetch(job)
+                # Cut short by the budget rather than by its own deadline
+                if isinstance(outcome.error, FetchTimeout) and self._out_of_time() and self._defer(job):
+                    continue
+                if not self._put(self._parse_queue, outcome):
+                    break
+        finally:
+            self._stage_finished('fetch', self._parse_queue, self._parse_workers)
+
+    def _out_of_time(self):
+        return self._budget_ends is not None and time.monotonic() >= self._budget_ends
+
+    def _defer(self, job):
+        """Leave a scheduled feed for the next scan, unless a refresh waits for it"""
+        with self._lock:
+            if job.feed_id in self._waiters:
+                return False
+            self._started.discard(job.feed_id)
+            self._deferred.append(job)
+            self.deferred_count += 1
+            return True
+
+    def _refresh_worker(self, job):
+        """Fetch one refreshed feed right away, next to the fetch workers"""
+        try:
+            self._put(self._parse_queue, self._fetch(job), job.priority)
+        finally:
+            self._stage_finished('fetch', self._parse_queue, self._parse_workers)
+
+    def submit(self, job):
+        """Add an interactive refresh to this run.
+
+        Returns a Future for the feed's result, shared with the fetch already
+        under way if there is one, or None once this run takes no more work.
+        """
+        with self._lock:
+            if self._live['fetch'] == 0 or self._stop.is_set():
+                return None
+            future = Future()
+            self._waiters.setdefault(job.feed_id, []).append(future)
+            shared = job.feed_id in self._started
+            if not shared:
+                self._started.add(job.feed_id)
+                self._claimed.add(job.feed_id)
+                # The refresh thread counts as a fetch worker until it hands its feed on
+                self._live['fetch'] += 1
+        if shared:
+            # The feed may already wait in the open group
+            self._put(self._persist_queue, _COMMIT, PRIORITY_INTERACTIVE)
+            return future
+        threading.Thread(target=self._refresh_worker, args=(job,), name=f'feed-refresh-{job.feed_id}',
+                         daemon=True).start()
+        return future
+
+    def _parse_worker(self):
+        try:
+            while True:
+                try:
+                    priority, _, outcome = self._parse_queue.get(timeout=0.5)
+                except queue.Empty:
+                    if self._stop.is_set():
+                        break
+                    continue
+                if outcome is _DONE:
+                    break
+                if outcome.error is None:
+                    outcome = self._parse(outcome)
+                if not self._put(self._persist_queue, outcome, priority):
+                    break
+        finally:
+            self._stage_finished('parse', self._persist_queue, 1)
+
+    def _parse(self, outcome):
+        fetched = outcome.fetched
+        body_hash = outcome.job.stored or body_fingerprint(fetched.body)
+        if raw_store.enabled() and outcome.job.stored is None:
+            # Kept even when parsing fails, a parser fix can then rebuild the feed.
+            # Unchanged bodies are stored too if missing, e.g. when the store was just turned on.
+            self._keep_raw(raw_store.put, body_hash, fetched)
+        if body_hash == outcome.job.body_hash:
+            # Same bytes as the last successful scan, nothing to parse
+            return outcome._replace(body_hash=body_hash, unchanged=True)
+        try:
+            with timed('parse', outcome.timings):
+                parsed = parse_in_pool(fetched.body, fetched.content_type, outcome.job.stop_links)
+            return outcome._replace(body_hash=body_hash, parsed=parsed)
+        except Exception as e:
+            return outcome._replace(error=e)
+
+    def _keep_raw(self, action, *args):
+        try:
+            action(*args)
+        except OSError as e:
+            logging.error(f"Error writing to the raw store: {str(e)}")
+
+    # Persist stage
+
+    def run(self, feeds):
+        """Ingest `feeds` and return the per-feed results, in completion order"""
+        return self.run_jobs([FeedJob(feed.id, feed.url, feed.body_hash, incremental_stop_links(feed))
+                              for feed in feeds])
+
+    def run_jobs(self, jobs):
+        chunks = iter([jobs])
+        return self.run_chunks(lambda: next(chunks, None), len(jobs))
+
+    def run_chunks(self, load_chunk, expected=None):
+        """Ingest the jobs returned by `load_chunk`, called until it returns None.
+
+        Chunks are loaded by the calling thread as the fetch workers drain the
+        queue, so only about one chunk of jobs is held at a time.
+        """
+        self._jobs = queue.Queue()
+        self._load_chunk = load_chunk
+        if self.budget:
+            self._budget_ends = time.monotonic() + self.budget
+        self._refill()
+
+        fetch_workers = self.fetch_workers
+        if expected is not None:
+            fetch_workers = min(fetch_workers, expected) or 1
+        self._parse_workers = max(1, min(PARSE_STAGE_WORKERS, fetch_workers))
+        self._parse_queue = queue.PriorityQueue(maxsize=fetch_workers * 2)
+        self._persist_queue = queue.PriorityQueue(maxsize=fetch_workers * 2)
+        self._live = {'fetch': fetch_workers, 'parse': self._parse_workers}
+        if self.serve_refreshes:
+            _set_running_scan(self)
+
+        threads = [threading.Thread(target=profiled_thread(self._fetch_worker), name=f'feed-fetch-{i}',
+                                    daemon=True)
+                   for i in range(fetch_workers)]
+        threads += [threading.Thread(target=profiled_thread(self._parse_worker), name=f'feed-parse-{i}',
+                                     daemon=True)
+                    for i in range(self._parse_workers)]
+        for thread in threads:
+            thread.start()
+
+        try:
+            while True:
+                if not self._exhausted.is_set() and self._jobs.qsize() < SCAN_CHUNK_SIZE // 2:
+                    self._refill()
+                timeout = None
+                if self._pending:
+                    timeout = max(0.0, self._group_started + GROUP_COMMIT_SECONDS - time.perf_counter())
+                if not self._exhausted.is_set():
+                    timeout = min(timeout, 0.2) if timeout is not None else 0.2
+                try:
+                    _, _, outcome = self._persist_queue.get(timeout=timeout)
+                except queue.Empty:
+                    self._commit_group()
+                    self._record_deferred()
+                    continue
+                if outcome is _DONE:
+                    break
+                if outcome is _COMMIT:
+                    self._commit_group()
+                    continue
+
+                self._persist(outcome)
+                if (self._awaited(outcome.job.feed_id)
+                        or len(self._pending) >= GROUP_COMMIT_FEEDS
+                        or self._pending_articles >= GROUP_COMMIT_ARTICLES
+                        or (self._pending and time.perf_counter() - self._group_started >= GROUP_COMMIT_SECONDS)):
+                    self._commit_group()
+            self._commit_group()
+            self._record_deferred(final=True)
+            if self.deferred_count:
+                logging.warning(f"Scan time budget of {self.budget:g}s ran out, "
+                                f"{self.deferred_count} feeds deferred to the next scan")
+            self._hand_over_results(final=True)
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            if self.serve_refreshes:
+                _set_running_scan(None)
+            with self._lock:
+                self._stop.set()
+                waiters = self._waiters
+                self._waiters = {}
+            for thread in threads:
+                thread.join()
+            for futures in waiters.values():
+                for future in futures:
+                    future.set_exception(RuntimeError("Scan stopped before the feed was refreshed"))
+
+        return self.results
+
+    def _refill(self):
+        """Queue the next chunk of jobs, skipping feeds a refresh already took"""
+        jobs = self._load_chunk()
+        if jobs is None:
+            self._exhausted.set()
+            for _ in range(self.fetch_workers):
+                self._jobs.put(_DONE)
+            return
+        for job in jobs:
+            with self._lock:
+                claimed = job.feed_id in self._claimed
+            if claimed:
+                self.processed += 1
+                continue
+            self._to_process.add(job.feed_id)
+            self._to_report.add(job.feed_id)
+            self._jobs.put(job)
+
+    def _record_deferred(self, final=False):
+        """Flag the feeds the time budget left out, so the next scan takes them first.
+
+        Called between group commits; deferred jobs are written and reported a
+        batch at a time, and the rest at the end of the run.
+        """
+        with self._lock:
+            if not self._deferred or (len(self._deferred) < DEFER_BATCH_SIZE and not final):
+                return
+            deferred = self._deferred
+            self._deferred = []
+        feed_ids = [job.feed_id for job in deferred]
+        now = datetime.utcnow()
+        try:
+            for i in range(0, len(feed_ids), DEFER_BATCH_SIZE):
+                # Feeds deferred again keep their place in the queue
+                db.session.execute(
+                    update(RSSFeed)
+                    .where(RSSFeed.id.in_(feed_ids[i:i + DEFER_BATCH_SIZE]), RSSFeed.scan_deferred_at.is_(None))
+                    .values(scan_deferred_at=now)
+                )
+            db.session.commit()
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error recording deferred feeds: {str(e)}")
+        for job in deferred:
+            self._to_report.discard(job.feed_id)
+            self.results.append({
+                'feed_id': job.feed_id,
+                'feed_url': job.url,
+                'status': 'deferred',
+                'http_status': None,
+                'bytes': None,
+                'new_items': 0,
+                'error': 'Scan time budget ran out before the feed was fetched'
+            })
+
+    def _awaited(self, feed_id):
+        """Whether a refresh is waiting for this feed, which then skips the group wait"""
+        with self._lock:
+            return feed_id in self._waiters
+
+    def _persist(self, outcome):
+        if outcome.job.feed_id in self._to_process:
+            self._to_process.discard(outcome.job.feed_id)
+            self.processed += 1
+        try:
+            entry = self._store(outcome)
+        except SQLAlchemyError as e:
+            logging.warning(f"Write failed for {outcome.job.url}, retrying its group one feed at a time: {str(e)}")
+            db.session.rollback()
+            self._discard_pending()
+            retry = [pending[0] for pending in self._pending] + [outcome]
+            self._reset_group()
+            self._store_one_by_one(retry)
+            self._release()
+            return
+
+        if not self._pending:
+            self._group_started = time.perf_counter()
+        self._pending.append(entry)
+        self._pending_articles += entry[1]['new_items']
+
+    def _new_result(self, outcome):
+        fetched = outcome.fetched
+        return {
+            'feed_id': outcome.job.feed_id,
+            'feed_url': outcome.job.url,
+            'status': 'error',
+            'http_status': fetched.status if fetched else getattr(outcome.error, 'code', None),
+            'bytes': len(fetched.body) if fetched else None,
+            'new_items': 0,
+            'error': None
+        }
+
+    def _store(self, outcome):
+        """Stage one feed's new articles and status for the next commit.
+
+        Returns (outcome, result, entries retrieved, entries already stored).
+        Raises SQLAlchemyError if the database rejects the reads.
+        """
+        with db.session.no_autoflush:
+            return self._stage(outcome)
+
+    def _stage(self, outcome):
+        result = self._new_result(outcome)
+        feed = db.session.get(RSSFeed, outcome.job.feed_id)
+        if feed is not None:
+            self._touched.append(feed)
+        if feed is None or feed.deleted_at is not None:
+            result['error'] = 'Feed no longer exists'
+            return outcome, result, 0, 0
+        if outcome.job.stored is not None:
+            return self._stage_rebuild(outcome, feed, result)
+        feed.scan_deferred_at = None
+
+        error = outcome.error
+        if error is None and not outcome.unchanged and not outcome.parsed.found:
+            error = Exception("No feed data found")
+
+        new_entries = []
+        existing = 0
+        if error is None and not outcome.unchanged:
+            try:
+                with timed('dedup', outcome.timings):
+                    new_entries, existing = select_new_entries(
+                        feed, outcome.parsed,
+                        lambda: parse_in_pool(outcome.fetched.body, outcome.fetched.content_type)
+                    )
+            except SQLAlchemyError:
+                raise
+            except Exception as e:
+                error = e
+            # Links stored by an earlier feed of the same open group
+            staged = [entry for entry in new_entries if entry.link not in self._pending_links]
+            existing += len(new_entries) - len(staged)
+            new_entries = staged
+
+        now = datetime.utcnow()
+        pushed = outcome.job.pushed is not None
+        if pushed:
+            # last_scan_time stays the last poll, which decides the safety-net polls
+            feed.websub_pushed_at = now
+            feed.last_scan_trigger = 'push'
+        else:
+            feed.last_scan_time = now
+            feed.last_scan_trigger = 'manual' if outcome.job.priority == PRIORITY_INTERACTIVE else self.trigger
+        if error is not None:
+            feed.status = 'error'
+            feed.error_count = (feed.error_count or 0) + 1
+            feed.last_error = str(error)[:500]
+            result['error'] = str(error)
+            return outcome, result, 0, 0
+
+        feed.last_updated = now
+        feed.status = 'active'
+        feed.error_count = 0
+        if not pushed:
+            self._follow_redirects(feed, outcome.fetched)
+        if outcome.unchanged:
+            result['status'] = 'unchanged'
+            return outcome, result, 0, 0
+
+        parsed = outcome.parsed
+        # Hubs may push only the changed entries, without the feed's title and links
+        if parsed.title or not pushed:
+            feed.title = parsed.title or feed.url
+            feed.title_text = plain_title(feed.title)
+        if not pushed:
+            note_hub(feed, parsed)
+        with timed('persist', outcome.timings):
+            current_count = Article.query.filter_by(feed_id=feed.id).count()
+            latest_date = feed.last_article_date
+            rows = []
+            for entry in new_entries:
+                rows.append({
+                    'feed_id': feed.id,
+                    'title': entry.title,
+                    'link': entry.link,
+                    'description': entry.description,
+                    'title_text': entry.title_text,
+                    'description_text': entry.description_text,
+                    'published_date': entry.published
+                })
+                if entry.published and (not latest_date or entry.published > latest_date):
+                    latest_date = entry.published
+            self._pending_rows.extend(rows)
+            self._pending_links.update(row['link'] for row in rows)
+
+            feed.num_articles = current_count + len(rows)
+            if latest_date:
+                feed.last_article_date = latest_date
+            advance_high_water(feed, parsed, outcome.body_hash)
+
+        result['status'] = 'success'
+        result['new_items'] = len(rows)
+        return outcome, result, len(parsed.entries), existing
+
+    def _stage_rebuild(self, outcome, feed, result):
+        """Stage the articles of a body from the raw store.
+
+        New entries are added and stored ones rewritten from the new parse.
+        The feed's scan state and status are left as the last scan set them.
+        """
+        error = outcome.error
+        if error is None and not outcome.parsed.found:
+            error = Exception("No feed data found")
+        if error is not None:
+            result['error'] = str(error)
+            return outcome, result, 0, 0
+
+        parsed = outcome.parsed
+        feed.title = parsed.title or feed.url
+        feed.title_text = plain_title(feed.title)
+        with timed('dedup', outcome.timings):
+            entries = []
+            seen = set(self._pending_links)
+            for entry in parsed.entries:
+                if entry.link not in seen:
+                    seen.add(entry.link)
+                    entries.append(entry)
+            known = find_known_links(entry.link for entry in entries)
+
+        with timed('persist', outcome.timings):
+            current_count = Article.query.filter_by(feed_id=feed.id).count()
+            rows = []
+            for entry in entries:
+                if entry.link in known:
+                    self._pending_updates.append({
+                        'b_feed_id': feed.id,
+                        'b_link': entry.link,
+                        'b_title': entry.title,
+                        'b_description': entry.description,
+                        'b_title_text': entry.title_text,
+                        'b_description_text': entry.description_text,
+                        'b_published': entry.published
+                    })
+                    continue
+                rows.append({
+                    'feed_id': feed.id,
+                    'title': entry.title,
+                    'link': entry.link,
+                    'description': entry.description,
+                    'title_text': entry.title_text,
+                    'description_text': entry.description_text,
+                    'published_date': entry.published
+                })
+            self._pending_rows.extend(rows)
+            self._pending_links.update(row['link'] for row in rows)
+            feed.num_articles = current_count + len(rows)
+
+        result['status'] = 'success'
+        result['new_items'] = len(rows)
+        result['updated_items'] = len(entries) - len(rows)
+        return outcome, result, len(parsed.entries), len(entries) - len(rows)
+
+    def _follow_redirects(self, feed, fetched):
+        """Move the feed to the target of a permanent redirect and remember where its URL leads"""
+        target = normalize_feed_url(fetched.permanent_url)
+        if target and target != feed.url and len(target) <= MAX_URL_LENGTH:
+            if target in self._pending_urls or \
+                    RSSFeed.query.filter(RSSFeed.url == target, RSSFeed.id != feed.id).count():
+                # Left for the duplicate merge, see feed_duplicates.py
+                logging.info(f"Feed {feed.url} moved permanently to {target}, which is already subscribed")
+            else:
+                logging.info(f"Feed {feed.url} moved permanently to {target}")
+                feed.url = target
+                self._pending_urls.add(target)
+
+        final_url = normalize_feed_url(fetched.final_url)
+        if final_url and final_url != feed.url and len(final_url) <= MAX_URL_LENGTH:
+            feed.resolved_url = final_url
+        else:
+            feed.resolved_url = None
+
+    def _store_one_by_one(self, outcomes):
+        """Store and commit feeds individually, recording database errors on the feed"""
+        for outcome in outcomes:
+            try:
+                entry = self._store(outcome)
+                self._write_pending()
+                db.session.commit()
+            except SQLAlchemyError as e:
+                db.session.rollback()
+                self._discard_pending()
+                logging.error(f"Error saving feed {outcome.job.url}: {str(e)}")
+                entry = self._store(outcome._replace(error=e, unchanged=False))
+                try:
+                    db.session.commit()
+                except SQLAlchemyError as commit_error:
+                    db.session.rollback()
+                    self._discard_pending()
+                    logging.error(f"Error updating feed error status: {str(commit_error)}")
+            self._finish(*entry)
+
+    def _write_pending(self):
+        if self._pending_rows:
+            db.session.execute(insert(Article), self._pending_rows)
+            add_article_counts(self._pending_rows)
+        if self._pending_updates:
+            db.session.execute(_ARTICLE_REWRITE, self._pending_updates)
+            # Rewritten published dates can move articles to another day
+            recount_feeds({row['b_feed_id'] for row in self._pending_updates})
+        self._discard_pending()
+
+    def _discard_pending(self):
+        self._pending_rows = []
+        self._pending_updates = []
+        self._pending_links = set()
+        self._pending_urls = set()
+
+    def _reset_group(self):
+        self._pending = []
+        self._pending_articles = 0
+        self._group_started = None
+
+    def _commit_group(self):
+        if not self._pending:
+            return
+        pending = self._pending
+        self._reset_group()
+
+        if self.on_progress:
+            start = time.perf_counter()
+            self.on_progress(self.processed, pending[-1][0].job.url)
+            self.phase_times['progress'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        try:
+            self._write_pending()
+            db.session.commit()
+        except SQLAlchemyError as e:
+            logging.warning(f"Group commit of {len(pending)} feeds failed, retrying one feed at a time: {str(e)}")
+            db.session.rollback()
+            self._discard_pending()
+            self._store_one_by_one([entry[0] for entry in pending])
+        else:
+            for entry in pending:
+                self._finish(*entry)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.phase_times['persist'] += elapsed
+            metrics.GROUP_COMMIT_SECONDS.observe(elapsed)
+        self._release()
+
+    def _release(self):
+        """Drop the committed group's feeds from the session and pass on finished results"""
+        for feed in self._touched:
+            if feed in db.session:
+                db.session.expunge(feed)
+        self._touched = []
+        self._record_deferred()
+        self._hand_over_results()
+
+    def _hand_over_results(self, final=False):
+        if self.on_results and self.results and (final or len(self.results) >= RESULT_BATCH_SIZE):
+            results = self.results
+            self.results = []
+            self.on_results(results)
+
+    def _finish(self, outcome, result, retrieved, existing):
+        """Account for a feed whose writes are committed"""
+        timings = outcome.timings
+        result.update(
+            fetch_seconds=timings['fetch'],
+            parse_seconds=timings['parse'],
+            persist_seconds=timings['dedup'] + timings['persist'],
+            total_seconds=time.perf_counter() - outcome.started
+        )
+        for name in ('fetch', 'parse', 'dedup', 'persist'):
+            self.phase_times[name] += timings[name]
+        feed_id = outcome.job.feed_id
+        if feed_id in self._to_report:
+            # Refreshes of feeds outside this run, or already reported, are not part of its results
+            self._to_report.discard(feed_id)
+            self.articles_retrieved += retrieved
+            self.existing_articles += existing
+            self.status_counts[result['status']] += 1
+            self.new_articles += result['new_items']
+            self.updated_articles += result.get('updated_items', 0)
+            if isinstance(outcome.error, FetchTimeout):
+                self.timed_out += 1
+            self.results.append(result)
+
+        metrics.FEEDS_SCANNED.labels(result=result['status']).inc()
+        if result['new_items']:
+            metrics.ARTICLES_INGESTED.inc(result['new_items'])
+        log_feed_result('Feed scanned', result)
+
+        with self._lock:
+            self._started.discard(feed_id)
+            futures = self._waiters.pop(feed_id, [])
+        for future in futures:
+            future.set_result(dict(result))
+
+class RefreshTimeout(Exception):
+    """A refresh that joined the running scan was not stored in time"""
+
+# The scan running in this process, which takes the refreshes of single feeds
+_running_scan = None
+_running_scan_lock = threading.Lock()
+
+def _set_running_scan(pipeline):
+    global _running_scan
+    with _running_scan_lock:
+        _running_scan = pipeline
+
+def refresh_feed(feed, timeout=REFRESH_TIMEOUT):
+    """Refresh one feed ahead of scheduled work and return its result dict.
+
+    If a scan is running in this process the feed joins it: the scan's fetch
+    of the feed is shared when already under way, otherwise the feed is
+    fetched at once and goes through parse and persist before other work.
+    Without a running scan the feed gets a pipeline of its own, even if
+    another process is scanning it. Raises RefreshTimeout after `timeout`.
+    """
+    job = FeedJob(feed.id, feed.url, feed.body_hash, incremental_stop_links(feed), PRIORITY_INTERACTIVE)
+    return _run_interactive(job, timeout)
+
+def ingest_pushed(feed, fetched, timeout=REFRESH_TIMEOUT):
+    """Store content a WebSub hub pushed for `feed` and return its result dict.
+
+    The pushed FetchResult takes the place of the fetch; parsing and
+    storing work as for a refresh.
+    """
+    job = FeedJob(feed.id, feed.url, feed.body_hash, incremental_stop_links(feed), PRIORITY_INTERACTIVE, fetched)
+    return _run_interactive(job, timeout)
+
+def reparse_from_store(feed_ids=None):
+    """Rebuild the articles of feeds from their last body in the raw store, without fetching.
+
+    Stored articles are rewritten from the new parse and entries missing
+    from the database are added, so parser fixes and new fields reach the
+    existing data. `feed_ids` limits the feeds rebuilt. Returns a summary.
+    """
+    started = time.perf_counter()
+    where = and_(active_feeds_filter, RSSFeed.body_hash.isnot(None))
+    if feed_ids:
+        where = and_(where, RSSFeed.id.in_(feed_ids))
+    load_jobs = job_chunks(where=where)
+
+    def load_chunk():
+        jobs = load_jobs()
+        if jobs is None:
+            return None
+        # No body hash or stop links: the stored body is always parsed in full
+        return [FeedJob(job.feed_id, job.url, None, None, stored=job.body_hash) for job in jobs]
+
+    pipeline = IngestPipeline(trigger='reparse', on_results=lambda results: None)
+    pipeline.run_chunks(load_chunk)
+    if pipeline.updated_articles:
+        # The day files still hold the old titles
+        discard_snapshots()
+    summary = {
+        'feeds': pipeline.processed,
+        'errors': pipeline.status_counts['error'],
+        'new_articles': pipeline.new_articles,
+        'updated_articles': pipeline.updated_articles,
+        'duration': time.perf_counter() - started
+    }
+    logging.info(f"Reparsed {summary['feeds']} feeds from the raw store in {summary['duration']:.1f}s: "
+                 f"{summary['new_articles']} new and {summary['updated_articles']} updated articles, "
+                 f"{summary['errors']} errors")
+    return summary
+
+def _run_interactive(job, timeout):
+    with _running_scan_lock:
+        scan = _running_scan
+    future = scan.submit(job) if scan is not None else None
+    if future is not None:
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            raise RefreshTimeout(f"Feed not stored after {timeout}s, the running scan is still busy with it; "
+                                 f"it will be updated when the scan stores it")
+
+    # On its own, the fetch is held to the same timeout
+    pipeline = IngestPipeline(trigger='manual', fetch_workers=1, fetch_timeout=min(FEED_TOTAL_TIMEOUT, timeout))
+    return pipeline.run_jobs([job])[0]
@@ -0,0 +1,197 @@
+import atexit
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import random
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+LOGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs')
+
+# Runtime log level shared by every process; written from the UI
+LEVEL_FILE = os.path.join(LOGS_DIR, 'log_level')
+LEVEL_CHECK_INTERVAL = 2.0
+LEVELS = ('DEBUG', 'INFO', 'WARNING', 'ERROR')
+
+# One structured record per scanned feed goes to this logger
+FEED_LOGGER_NAME = 'rss.feeds'
+
+# Share of successful per-feed records that are kept; failures are always kept
+FEED_LOG_SAMPLE_RATE = float(os.environ.get('FEED_LOG_SAMPLE_RATE', 0.1))
+
+# Records per second allowed from a single logging call site, and the burst above it
+LOG_RATE_LIMIT = float(os.environ.get('LOG_RATE_LIMIT', 10))
+LOG_RATE_BURST = int(os.environ.get('LOG_RATE_BURST', 50))
+
+LOG_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+DATE_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+feed_logger = logging.getLogger(FEED_LOGGER_NAME)
+
+# Set in the gunicorn master before forking so every worker logs to the same writer
+_shared_queue = None
+_listener = None
+_level_watcher = None
+
+class StructuredFormatter(logging.Formatter):
+    """Append the `fields` of structured records as JSON"""
+
+    def format(self, record):
+        message = super().format(record)
+        fields = getattr(record, 'fields', None)
+        if fields:
+            message = f"{message} {json.dumps(fields, default=str, sort_keys=True)}"
+        return message
+
+class SamplingFilter(logging.Filter):
+    """Keep a sample of routine per-feed records and every failure"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+class RateLimitFilter(logging.Filter):
+    """Token bucket per logging call site, so one noisy line cannot flood the log.
+
+    The next record let through from a throttled call site reports how many
+    were dropped.
+    """
+
+    def __init__(self, rate, burst):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated, suppressed = self._buckets.get(key, (self.burst, now, 0))
+            tokens = min(self.burst, tokens + (now - updated) * self.rate)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now, suppressed + 1)
+                return False
+            self._buckets[key] = (tokens - 1, now, 0)
+
+        if suppressed:
+            record.msg = f"{record.getMessage()} ({suppressed} similar messages suppressed)"
+            record.args = None
+        return True
+
+def build_handlers(logs_dir=LOGS_DIR):
+    """Handlers owned by the background writer: monthly rotated file and console"""
+    formatter = StructuredFormatter(LOG_FORMAT, DATE_FORMAT)
+
+    file_handler = TimedRotatingFileHandler(
+        os.path.join(logs_dir, 'app.log'),
+        when='midnight',
+        interval=30,  # Monthly rotation
+        backupCount=12,  # Keep 12 months of logs
+        encoding='utf-8'
+    )
+    file_handler.setFormatter(formatter)
+
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    return [file_handler, console_handler]
+
+def _start_listener(log_queue, handlers):
+    global _listener
+    _listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_writer)
+
+def stop_writer():
+    """Flush queued records and stop the writer of this process, if it has one"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+def start_shared_writer(logs_dir=LOGS_DIR):
+    """Start the single log writer in the gunicorn master.
+
+    Workers forked afterwards inherit the queue and only enqueue records.
+    """
+    global _shared_queue
+    _shared_queue = multiprocessing.get_context('fork').Queue()
+    _start_listener(_shared_queue, build_handlers(logs_dir))
+
+def install(default_level, logs_dir=LOGS_DIR):
+    """Route this process's logging through a queue to the background writer.
+
+    Uses the shared writer when running in a gunicorn worker, otherwise starts
+    a writer thread in this process.
+    """
+    if _shared_queue is not None:
+        log_queue = _shared_queue
+    else:
+        stop_writer()
+        log_queue = queue.SimpleQueue()
+        _start_listener(log_queue, build_handlers(logs_dir))
+
+    queue_handler = QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMIT, LOG_RATE_BURST))
+
+    root_logger = logging.getLogger()
+    root_logger.handlers = [queue_handler]
+    root_logger.setLevel(read_runtime_level() or default_level)
+
+    feed_logger.filters = [SamplingFilter(FEED_LOG_SAMPLE_RATE)]
+    _start_level_watcher(default_level)
+
+def read_runtime_level():
+    try:
+        with open(LEVEL_FILE) as f:
+            level = f.read().strip().upper()
+    except OSError:
+        return None
+    return level if level in LEVELS else None
+
+def set_runtime_level(level):
+    """Change the log level of every process without a restart"""
+    level = level.upper()
+    if level not in LEVELS:
+        raise ValueError(f"Unknown log level: {level}")
+    tmp_file = f'{LEVEL_FILE}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as f:
+        f.write(level)
+    os.replace(tmp_file, LEVEL_FILE)
+    logging.getLogger().setLevel(level)
+    logging.warning(f"Log level set to {level}")
+
+def _start_level_watcher(default_level):
+    global _level_watcher
+    if _level_watcher is not None:
+        return
+
+    def watch():
+        last_mtime = None
+        while True:
+            time.sleep(LEVEL_CHECK_INTERVAL)
+            try:
+                mtime = os.stat(LEVEL_FILE).st_mtime_ns
+            except OSError:
+                mtime = None
+            if mtime != last_mtime:
+                last_mtime = mtime
+                logging.getLogger().setLevel(read_runtime_level() or default_level)
+
+    _level_watcher = threading.Thread(target=watch, name='log-level-watcher', daemon=True)
+    _level_watcher.start()
+
+def log_feed_result(message, fields):
+    """Emit one structured, sampled record for a scanned feed"""
+    level = logging.WARNING if fields.get('status') == 'error' else logging.INFO
+    if feed_logger.isEnabledFor(level):
+        feed_logger.log(level, message, extra={'fields': fields})
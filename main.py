@@ -1,13 +1,13 @@
 import os
 import logging
 from datetime import datetime
-from logging.handlers import TimedRotatingFileHandler
+import log_pipeline
 from app import app
 from auth import init_admin
 from scheduler import init_scheduler
 
 def setup_logging():
-    """Configure centralized logging with monthly rotation"""
+    """Configure centralized, queued logging with monthly rotation"""
     try:
         # Get absolute path for logs directory
         base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -22,13 +22,7 @@ def setup_logging():
                 print(f"Please ensure {logs_dir} exists and has proper permissions")
                 raise
 
-        # Create formatter with consistent format for all logs
-        formatter = logging.Formatter(
-            '%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-            '%Y-%m-%d %H:%M:%S'
-        )
-
-        # Set up file handler with monthly rotation for application logs
+        # Application log file, written by the background log writer
         app_log_file = os.path.join(logs_dir, 'app.log')
 
         # Ensure log file exists with proper permissions
@@ -52,31 +46,9 @@ def setup_logging():
             print(f"Please check permissions for {app_log_file}")
             raise
 
-        app_file_handler = TimedRotatingFileHandler(
-            app_log_file,
-            when='midnight',
-            interval=30,  # Monthly rotation
-            backupCount=12,  # Keep 12 months of logs
-            encoding='utf-8'
-        )
-        app_file_handler.setFormatter(formatter)
-        app_file_handler.setLevel(logging.INFO)
-
-        # Set up console handler for development
-        console_handler = logging.StreamHandler()
-        console_handler.setFormatter(formatter)
-        console_handler.setLevel(logging.DEBUG if app.debug else logging.INFO)
-
-        # Configure root logger
-        root_logger = logging.getLogger()
-        root_logger.setLevel(logging.DEBUG if app.debug else logging.INFO)
-
-        # Remove any existing handlers
-        root_logger.handlers = []
-
-        # Add our handlers
-        root_logger.addHandler(app_file_handler)
-        root_logger.addHandler(console_handler)
+        # Records are queued and written by a single background writer, so
+        # formatting and disk I/O stay off the request and scan paths
+        log_pipeline.install(logging.DEBUG if app.debug else logging.INFO, logs_dir)
 
         # Specific logger configurations
         logging.getLogger('sqlalchemy').setLevel(logging.WARNING)
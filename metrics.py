@@ -0,0 +1,94 @@
+import hmac
+import os
+import time
+from flask import Blueprint, Response, abort, g, request
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge,
+                               Histogram, generate_latest, multiprocess)
+
+# Under gunicorn, PROMETHEUS_MULTIPROC_DIR is set by gunicorn.conf.py before the
+# workers start, so every worker writes its samples to shared files and the
+# /metrics endpoint aggregates them no matter which worker serves the scrape.
+MULTIPROC_DIR = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+SCAN_BUCKETS = (1, 5, 15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+
+FEED_FETCH_SECONDS = Histogram('rss_feed_fetch_seconds', 'Time to download one feed', buckets=LATENCY_BUCKETS)
+FEED_FETCH_BYTES = Histogram('rss_feed_fetch_bytes', 'Size of downloaded feed bodies', buckets=SIZE_BUCKETS)
+FEED_PARSE_SECONDS = Histogram('rss_feed_parse_seconds', 'Time to parse one feed', buckets=LATENCY_BUCKETS)
+FEED_DEDUP_SECONDS = Histogram('rss_feed_dedup_seconds', 'Time to find the new entries of one feed',
+                               buckets=LATENCY_BUCKETS)
+FEED_PERSIST_SECONDS = Histogram('rss_feed_persist_seconds',
+                                 'Time to stage the articles and status of one feed for its group commit',
+                                 buckets=LATENCY_BUCKETS)
+GROUP_COMMIT_SECONDS = Histogram('rss_group_commit_seconds', 'Time to commit one group of feeds',
+                                 buckets=LATENCY_BUCKETS)
+SCAN_DURATION_SECONDS = Histogram('rss_scan_duration_seconds', 'Duration of full feed scans', ['trigger'],
+                                  buckets=SCAN_BUCKETS)
+FEEDS_SCANNED = Counter('rss_feeds_scanned', 'Feeds scanned', ['result'])
+ARTICLES_INGESTED = Counter('rss_articles_ingested', 'New articles stored')
+FEEDS_IN_ERROR = Gauge('rss_feeds_in_error', 'Feeds in error state after the last scan',
+                       multiprocess_mode='mostrecent')
+BACKUP_DURATION_SECONDS = Gauge('rss_backup_duration_seconds', 'Duration of the last database backup',
+                                multiprocess_mode='mostrecent')
+BACKUP_BYTES = Gauge('rss_backup_bytes', 'Compressed size of the last database backup',
+                     multiprocess_mode='mostrecent')
+BACKUP_LAST_SUCCESS = Gauge('rss_backup_last_success_timestamp_seconds', 'When the last database backup finished',
+                            multiprocess_mode='mostrecent')
+REQUEST_LATENCY_SECONDS = Histogram('rss_http_request_duration_seconds', 'Request latency per route',
+                                    ['endpoint', 'method', 'status'], buckets=LATENCY_BUCKETS)
+
+PHASE_HISTOGRAMS = {
+    'fetch': FEED_FETCH_SECONDS,
+    'parse': FEED_PARSE_SECONDS,
+    'dedup': FEED_DEDUP_SECONDS,
+    'persist': FEED_PERSIST_SECONDS
+}
+
+metrics_bp = Blueprint('metrics', __name__)
+
+def observe_phase(name, seconds):
+    """Record the duration of one per-feed scan phase"""
+    histogram = PHASE_HISTOGRAMS.get(name)
+    if histogram is not None:
+        histogram.observe(seconds)
+
+def instrument_blueprint(blueprint):
+    """Record the latency of every request handled by a blueprint.
+
+    Must be called before the blueprint is registered on the app.
+    """
+    @blueprint.before_request
+    def _start_request_timer():
+        g.request_start_time = time.perf_counter()
+
+    @blueprint.after_request
+    def _observe_request_latency(response):
+        start = g.pop('request_start_time', None)
+        if start is not None:
+            REQUEST_LATENCY_SECONDS.labels(
+                endpoint=request.endpoint or 'unknown',
+                method=request.method,
+                status=str(response.status_code)
+            ).observe(time.perf_counter() - start)
+        return response
+
+@metrics_bp.route('/metrics')
+def metrics():
+    # Prometheus scrapers do not log in, so scrapes need METRICS_TOKEN instead;
+    # without one the endpoint is off unless METRICS_PUBLIC opens it explicitly
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        expected = f'Bearer {token}'
+        if not hmac.compare_digest(request.headers.get('Authorization', ''), expected):
+            abort(401)
+    elif os.environ.get('METRICS_PUBLIC', '0') == '0':
+        abort(404)
+
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return Response(generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
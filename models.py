@@ -1,3 +1,5 @@
+import os
+import socket
 from datetime import datetime
 from app import db
 from flask_login import UserMixin
@@ -14,6 +16,11 @@ class Admin(UserMixin, db.Model):
     def check_password(self, password):
         return check_password_hash(self.password_hash, password)
 
+# Identifies this scanner process. Scanner nodes sharing a database split the
+# feeds between them, so the id must be unique among the running nodes. Every
+# worker of a host sees the same environment, so a configured id gets the pid.
+SCANNER_NODE_ID = f"{os.environ.get('SCANNER_NODE_ID') or socket.gethostname()}:{os.getpid()}"
+
 class RSSFeed(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     url = db.Column(db.String(500), unique=True, nullable=False)
@@ -26,19 +33,60 @@ class RSSFeed(db.Model):
     last_article_date = db.Column(db.DateTime)
     last_scan_trigger = db.Column(db.String(50), default='manual')  # 'manual' or 'automatic'
     last_scan_time = db.Column(db.DateTime)
+    # Incremental scanning: hash of the last fetched body and the newest entry seen
+    body_hash = db.Column(db.String(64))
+    last_seen_link = db.Column(db.String(500))
+    last_seen_date = db.Column(db.DateTime)
+    reorders_entries = db.Column(db.Boolean, default=False)
+    # Full scans in a row that found a reordering feed in order, to clear the flag
+    in_order_scans = db.Column(db.Integer, default=0)
+    # Where the URL last redirected to, used to find feeds subscribed twice
+    resolved_url = db.Column(db.String(500), index=True)
+    # Plain-text title, normalized at ingest for exports
+    title_text = db.Column(db.String(200))
+    # WebSub: the hub and topic the feed advertises and our subscription to them.
+    # websub_state is None, 'pending', 'subscribed', 'failed' or 'denied'.
+    websub_hub = db.Column(db.String(500))
+    websub_topic = db.Column(db.String(500))
+    websub_state = db.Column(db.String(20))
+    websub_secret = db.Column(db.String(64))
+    websub_requested_at = db.Column(db.DateTime)
+    websub_lease_expires = db.Column(db.DateTime)
+    websub_pushed_at = db.Column(db.DateTime)
+    # Set when the feed is deleted; it is hidden at once and its articles are
+    # purged in the background, counted by articles_purged
+    deleted_at = db.Column(db.DateTime)
+    articles_purged = db.Column(db.Integer)
+    # False (NULL) for feeds whose articles predate FeedDailyStats, until the backfill counts them
+    stats_backfilled = db.Column(db.Boolean, default=True)
+    # Set when a scan ran out of time before reaching the feed; the next scan takes it first
+    scan_deferred_at = db.Column(db.DateTime, index=True)
 
 class Article(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    feed_id = db.Column(db.Integer, db.ForeignKey('rss_feed.id'), nullable=False)
+    feed_id = db.Column(db.Integer, db.ForeignKey('rss_feed.id'), nullable=False, index=True)
     title = db.Column(db.String(200), nullable=False)
     link = db.Column(db.String(500), unique=True, nullable=False)
     description = db.Column(db.Text)
+    # Plain text normalized at ingest, read by exports and search
+    title_text = db.Column(db.String(200))
+    description_text = db.Column(db.Text)
     published_date = db.Column(db.DateTime)
     collected_date = db.Column(db.DateTime, default=datetime.utcnow)
     feed = db.relationship('RSSFeed', backref=db.backref('articles', lazy='dynamic'))
 
+class FeedDailyStats(db.Model):
+    """Articles of a feed per day, by published date or, without one, collection date.
+
+    Kept up to date at ingest and delete so analytics never read the article table.
+    """
+    feed_id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, primary_key=True, index=True)
+    articles = db.Column(db.Integer, nullable=False, default=0)
+
 class ScanProgress(db.Model):
     id = db.Column(db.Integer, primary_key=True)
+    node_id = db.Column(db.String(100), unique=True)  # One row per scanner node
     is_scanning = db.Column(db.Boolean, default=False)
     current_feed = db.Column(db.String(500))
     current_index = db.Column(db.Integer, default=0)
@@ -47,16 +95,54 @@ class ScanProgress(db.Model):
     last_updated = db.Column(db.DateTime, default=datetime.utcnow)
 
     @staticmethod
-    def get_current():
-        progress = ScanProgress.query.first()
+    def get_current(node_id=SCANNER_NODE_ID):
+        progress = ScanProgress.query.filter_by(node_id=node_id).first()
         if not progress:
-            progress = ScanProgress()
+            progress = ScanProgress(node_id=node_id)
             db.session.add(progress)
             db.session.commit()
         return progress
 
-    def update(self, **kwargs):
+    def update(self, commit=True, **kwargs):
         for key, value in kwargs.items():
             setattr(self, key, value)
         self.last_updated = datetime.utcnow()
-        db.session.commit()
\ No newline at end of file
+        if commit:
+            db.session.commit()
+
+class ScanNode(db.Model):
+    node_id = db.Column(db.String(100), primary_key=True)
+    hostname = db.Column(db.String(255))
+    pid = db.Column(db.Integer)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_heartbeat = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+
+class ScanRun(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    trigger = db.Column(db.String(50))  # 'manual' or 'automatic'
+    started_at = db.Column(db.DateTime, index=True)
+    finished_at = db.Column(db.DateTime)
+    duration = db.Column(db.Float)  # seconds
+    status = db.Column(db.String(50), default='completed')  # 'completed' or 'failed'
+    total_feeds = db.Column(db.Integer, default=0)
+    successful_feeds = db.Column(db.Integer, default=0)
+    failed_feeds = db.Column(db.Integer, default=0)
+    new_articles = db.Column(db.Integer, default=0)
+    deferred_feeds = db.Column(db.Integer, default=0)  # left for the next scan by the time budget
+
+class FeedScanResult(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    scan_run_id = db.Column(db.Integer, db.ForeignKey('scan_run.id'), nullable=False, index=True)
+    # Not a foreign key, so history is kept when a feed is deleted
+    feed_id = db.Column(db.Integer, index=True)
+    feed_url = db.Column(db.String(500))
+    status = db.Column(db.String(50))  # 'success', 'unchanged', 'error' or 'deferred'
+    http_status = db.Column(db.Integer)
+    bytes = db.Column(db.Integer)
+    new_items = db.Column(db.Integer, default=0)
+    fetch_seconds = db.Column(db.Float)
+    parse_seconds = db.Column(db.Float)
+    persist_seconds = db.Column(db.Float)  # dedup and database commits
+    total_seconds = db.Column(db.Float)
+    error = db.Column(db.String(500))
+    scan_run = db.relationship('ScanRun', backref=db.backref('results', lazy='dynamic'))
@@ -0,0 +1,322 @@
+import cProfile
+import fcntl
+import json
+import logging
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from flask import Blueprint, abort, current_app, g, jsonify, render_template, request, send_from_directory
+from flask_login import login_required
+
+PROFILES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'logs', 'profiles')
+
+# The control file is shared by every worker and the scheduler, so a switch
+# flipped from the UI reaches whichever process serves the next request or scan
+CONTROL_FILE = os.path.join(PROFILES_DIR, 'control.json')
+LOCK_FILE = os.path.join(PROFILES_DIR, 'control.lock')
+
+# How often each process looks at the control file; between checks the hooks
+# only read a cached dict, so there is no measurable cost while profiling is off
+CONTROL_CHECK_INTERVAL = 2.0
+
+# Oldest profiles are deleted beyond this count
+MAX_PROFILES = int(os.environ.get('MAX_PROFILES', 50))
+
+MAX_PROFILED_REQUESTS = 100
+
+EMPTY_STATE = {'scan': False, 'routes': {}}
+
+_state = EMPTY_STATE
+_state_mtime = None
+_checked_at = 0.0
+
+# Only one profiler can be active per process at a time
+_profiler_lock = threading.Lock()
+
+# Profilers of the pipeline threads of the scan being profiled, merged into its
+# profile. From Python 3.12 cProfile hooks sys.monitoring, which already covers
+# every thread, and a second profiler cannot be enabled.
+_thread_profilers = None
+PROFILE_THREADS = sys.version_info < (3, 12)
+
+profiling_bp = Blueprint('profiling', __name__)
+
+def _read_control():
+    try:
+        with open(CONTROL_FILE) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return dict(EMPTY_STATE, routes={})
+    return {'scan': bool(state.get('scan')), 'routes': dict(state.get('routes') or {})}
+
+def _write_control(state):
+    tmp_file = f'{CONTROL_FILE}.{os.getpid()}.tmp'
+    with open(tmp_file, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_file, CONTROL_FILE)
+
+@contextmanager
+def _locked_control():
+    """Read-modify-write the control file under an exclusive file lock"""
+    global _checked_at
+    os.makedirs(PROFILES_DIR, exist_ok=True)
+    with open(LOCK_FILE, 'a') as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            state = _read_control()
+            yield state
+            _write_control(state)
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+    # Make this process pick up the change on its next check
+    _checked_at = 0.0
+
+def armed_state():
+    """Return the cached profiling switches, re-reading the control file at most every few seconds"""
+    global _state, _state_mtime, _checked_at
+    now = time.monotonic()
+    if now - _checked_at < CONTROL_CHECK_INTERVAL:
+        return _state
+    _checked_at = now
+
+    try:
+        mtime = os.stat(CONTROL_FILE).st_mtime_ns
+    except OSError:
+        mtime = None
+    if mtime != _state_mtime:
+        _state_mtime = mtime
+        _state = _read_control() if mtime is not None else EMPTY_STATE
+    return _state
+
+def arm_scan():
+    with _locked_control() as state:
+        state['scan'] = True
+    logging.info("Profiling armed for the next scan")
+
+def arm_route(endpoint, count):
+    with _locked_control() as state:
+        state['routes'][endpoint] = count
+    logging.info(f"Profiling armed for the next {count} requests to {endpoint}")
+
+def disarm(target=None, endpoint=None):
+    """Turn off one switch, or all of them if no target is given"""
+    with _locked_control() as state:
+        if target in (None, 'scan'):
+            state['scan'] = False
+        if target in (None, 'route'):
+            if endpoint:
+                state['routes'].pop(endpoint, None)
+            else:
+                state['routes'] = {}
+    logging.info(f"Profiling disarmed: {target or 'all'}")
+
+def _claim_scan():
+    with _locked_control() as state:
+        claimed = state['scan']
+        state['scan'] = False
+    return claimed
+
+def _claim_request(endpoint):
+    with _locked_control() as state:
+        remaining = state['routes'].get(endpoint, 0)
+        if remaining <= 0:
+            return False
+        if remaining == 1:
+            del state['routes'][endpoint]
+        else:
+            state['routes'][endpoint] = remaining - 1
+    return True
+
+def _prune_profiles():
+    profiles = list_profiles()
+    for profile in profiles[MAX_PROFILES:]:
+        try:
+            os.remove(os.path.join(PROFILES_DIR, profile['name']))
+        except OSError as e:
+            logging.warning(f"Error removing old profile {profile['name']}: {str(e)}")
+
+def _save_profile(profiler, kind, label, others=()):
+    """Write a profile, merged with `others`, in pstats format and return its file name"""
+    label = re.sub(r'[^A-Za-z0-9_.-]+', '_', label)
+    name = f"{kind}-{label}-{datetime.utcnow().strftime('%Y%m%d-%H%M%S-%f')}-{os.getpid()}.prof"
+    try:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        stats = pstats.Stats(profiler)
+        for other in others:
+            stats.add(other)
+        stats.dump_stats(os.path.join(PROFILES_DIR, name))
+        _prune_profiles()
+        logging.info(f"Saved {kind} profile {name}")
+        return name
+    except OSError as e:
+        logging.error(f"Error saving {kind} profile: {str(e)}")
+        return None
+
+def profiled_thread(target):
+    """Wrap a scan pipeline thread's `target` so it is profiled with the scan"""
+    def run(*args, **kwargs):
+        profilers = _thread_profilers
+        if profilers is None:
+            return target(*args, **kwargs)
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return target(*args, **kwargs)
+        finally:
+            profiler.disable()
+            profilers.append(profiler)
+    return run
+
+@contextmanager
+def profile_scan(trigger):
+    """Profile the wrapped scan if a scan profile has been requested.
+
+    The calling thread and the pipeline threads started with profiled_thread
+    are merged into one profile; parsing in the parser processes shows up as
+    waiting time.
+    """
+    global _thread_profilers
+    if not armed_state()['scan'] or not _profiler_lock.acquire(blocking=False):
+        yield
+        return
+
+    try:
+        try:
+            claimed = _claim_scan()
+        except OSError as e:
+            logging.error(f"Error claiming scan profile: {str(e)}")
+            claimed = False
+        if not claimed:
+            yield
+            return
+        profiler = cProfile.Profile()
+        if PROFILE_THREADS:
+            _thread_profilers = []
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            others, _thread_profilers = _thread_profilers or [], None
+            _save_profile(profiler, 'scan', trigger, others)
+    finally:
+        _profiler_lock.release()
+
+def _start_request_profile():
+    routes = armed_state()['routes']
+    if not routes or request.endpoint not in routes:
+        return
+    if not _profiler_lock.acquire(blocking=False):
+        return
+    try:
+        claimed = _claim_request(request.endpoint)
+    except OSError as e:
+        logging.error(f"Error claiming request profile: {str(e)}")
+        claimed = False
+    if not claimed:
+        _profiler_lock.release()
+        return
+    profiler = cProfile.Profile()
+    g.request_profiler = profiler
+    profiler.enable()
+
+def _stop_request_profile(exc):
+    # Teardown runs even when the view raised, so the lock is always released
+    profiler = g.pop('request_profiler', None)
+    if profiler is not None:
+        profiler.disable()
+        _profiler_lock.release()
+        _save_profile(profiler, 'request', request.endpoint or 'unknown')
+
+def init_profiling(app):
+    """Install the request profiling hooks on the app"""
+    app.before_request(_start_request_profile)
+    app.teardown_request(_stop_request_profile)
+
+def list_profiles():
+    """Saved profiles, newest first"""
+    profiles = []
+    try:
+        names = os.listdir(PROFILES_DIR)
+    except OSError:
+        return profiles
+    for name in names:
+        if not name.endswith('.prof'):
+            continue
+        try:
+            stat = os.stat(os.path.join(PROFILES_DIR, name))
+        except OSError:
+            continue
+        profiles.append({
+            'name': name,
+            'kind': name.split('-', 1)[0],
+            'size': stat.st_size,
+            'created': datetime.utcfromtimestamp(stat.st_mtime).isoformat()
+        })
+    profiles.sort(key=lambda profile: profile['created'], reverse=True)
+    return profiles
+
+@profiling_bp.route('/profiles')
+@login_required
+def profiles_page():
+    return render_template('profiles.html')
+
+@profiling_bp.route('/api/profiles')
+@login_required
+def get_profiles():
+    endpoints = sorted({rule.endpoint for rule in current_app.url_map.iter_rules()
+                        if rule.endpoint != 'static'})
+    return jsonify({
+        'armed': _read_control(),
+        'endpoints': endpoints,
+        'profiles': list_profiles()
+    })
+
+@profiling_bp.route('/api/profiles/arm', methods=['POST'])
+@login_required
+def arm_profile():
+    data = request.get_json() or {}
+    target = data.get('target')
+    try:
+        if target == 'scan':
+            arm_scan()
+        elif target == 'route':
+            endpoint = data.get('endpoint')
+            if endpoint not in current_app.view_functions:
+                return jsonify({'error': 'Unknown endpoint'}), 400
+            try:
+                count = int(data.get('count', 1))
+            except (TypeError, ValueError):
+                return jsonify({'error': 'count must be a number'}), 400
+            if not 1 <= count <= MAX_PROFILED_REQUESTS:
+                return jsonify({'error': f'count must be between 1 and {MAX_PROFILED_REQUESTS}'}), 400
+            arm_route(endpoint, count)
+        else:
+            return jsonify({'error': "target must be 'scan' or 'route'"}), 400
+        return jsonify({'armed': _read_control()})
+    except OSError as e:
+        logging.error(f"Error arming profiler: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@profiling_bp.route('/api/profiles/disarm', methods=['POST'])
+@login_required
+def disarm_profile():
+    data = request.get_json(silent=True) or {}
+    try:
+        disarm(data.get('target'), data.get('endpoint'))
+        return jsonify({'armed': _read_control()})
+    except OSError as e:
+        logging.error(f"Error disarming profiler: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+@profiling_bp.route('/api/profiles/download/<path:name>')
+@login_required
+def download_profile(name):
+    if not name.endswith('.prof'):
+        abort(404)
+    return send_from_directory(PROFILES_DIR, name, as_attachment=True)
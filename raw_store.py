@@ -0,0 +1,146 @@
+"""Content-addressed store of raw fetched feed bodies.
+
+Usage:
+    python raw_store.py stats                  objects and size of the store
+    python raw_store.py evict                  apply the size and age limits now
+    python raw_store.py reparse [--feed ID]    rebuild articles from the stored bodies
+"""
+import argparse
+import gzip
+import logging
+import os
+import sys
+import tempfile
+import time
+from feed_fetcher import FetchResult
+
+# Off unless RAW_STORE=1; scans then keep every distinct body they fetch
+RAW_STORE_ENABLED = os.environ.get('RAW_STORE', '0') != '0'
+RAW_STORE_DIR = os.environ.get('RAW_STORE_DIR') or \
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'instance', 'raw_store')
+
+# Eviction drops the least recently seen bodies past either limit
+RAW_STORE_MAX_MB = int(os.environ.get('RAW_STORE_MAX_MB', 1024))
+RAW_STORE_MAX_AGE_DAYS = float(os.environ.get('RAW_STORE_MAX_AGE_DAYS', 30))
+
+COMPRESS_LEVEL = 6
+
+def enabled():
+    return RAW_STORE_ENABLED
+
+def _object_path(body_hash):
+    # Fanned out over 256 directories by the first two hex digits
+    return os.path.join(RAW_STORE_DIR, body_hash[:2], f'{body_hash}.gz')
+
+def put(body_hash, fetched):
+    """Keep a fetched body under its hash, `body_fingerprint(fetched.body)`.
+
+    A body already stored is not written again, only marked as seen, which
+    keeps it from age eviction.
+    """
+    path = _object_path(body_hash)
+    try:
+        os.utime(path)
+        return False
+    except FileNotFoundError:
+        pass
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # A file of its own: parse threads can store the same body at once
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    # The content type goes first, it decides how the body is decoded
+    content_type = (fetched.content_type or '').encode('latin-1', 'replace')
+    try:
+        with os.fdopen(fd, 'wb') as raw, gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=COMPRESS_LEVEL) as f:
+            f.write(content_type + b'\n')
+            f.write(fetched.body)
+        os.replace(tmp_file, path)
+    except BaseException:
+        os.remove(tmp_file)
+        raise
+    return True
+
+def get(body_hash):
+    """The stored body as a FetchResult, or None when it is not in the store"""
+    try:
+        with gzip.open(_object_path(body_hash), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return None
+    content_type, _, body = data.partition(b'\n')
+    return FetchResult(body, content_type.decode('latin-1') or None, 200)
+
+def _objects():
+    """(mtime, size, path) of every stored body"""
+    try:
+        directories = list(os.scandir(RAW_STORE_DIR))
+    except FileNotFoundError:
+        return []
+    objects = []
+    for directory in directories:
+        if not directory.is_dir():
+            continue
+        for entry in os.scandir(directory.path):
+            if entry.name.endswith('.gz'):
+                stat = entry.stat()
+                objects.append((stat.st_mtime, stat.st_size, entry.path))
+    return objects
+
+def stats():
+    objects = _objects()
+    return {
+        'objects': len(objects),
+        'bytes': sum(size for _, size, _ in objects),
+        'oldest': min((mtime for mtime, _, _ in objects), default=None)
+    }
+
+def evict(max_bytes=None, max_age_days=None):
+    """Delete bodies not seen for `max_age_days`, then the least recently seen
+    until the store fits in `max_bytes`. Returns (objects, bytes) deleted."""
+    max_bytes = RAW_STORE_MAX_MB * 1024 * 1024 if max_bytes is None else max_bytes
+    max_age_days = RAW_STORE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    objects = sorted(_objects())
+    total = sum(size for _, size, _ in objects)
+    cutoff = time.time() - max_age_days * 86400
+    deleted = freed = 0
+    for mtime, size, path in objects:
+        if mtime >= cutoff and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        deleted += 1
+        freed += size
+    if deleted:
+        logging.info(f"Evicted {deleted} raw bodies ({freed / 1e6:.1f} MB) from the raw store")
+    return deleted, freed
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('stats', help='objects and size of the store')
+    commands.add_parser('evict', help='apply the size and age limits now')
+    reparse = commands.add_parser('reparse', help='rebuild articles from the stored bodies')
+    reparse.add_argument('--feed', type=int, action='append', help='only this feed id (repeatable)')
+    args = parser.parse_args()
+
+    if args.command == 'stats':
+        summary = stats()
+        print(f"{summary['objects']} bodies, {summary['bytes'] / 1e6:.1f} MB in {RAW_STORE_DIR}")
+        return 0
+    if args.command == 'evict':
+        deleted, freed = evict()
+        print(f"Evicted {deleted} bodies, {freed / 1e6:.1f} MB")
+        return 0
+
+    from app import app
+    from ingest_pipeline import reparse_from_store
+    with app.app_context():
+        summary = reparse_from_store(args.feed)
+    print(f"Reparsed {summary['feeds']} feeds in {summary['duration']:.1f}s: {summary['new_articles']} new and "
+          f"{summary['updated_articles']} updated articles, {summary['errors']} errors")
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+import logging
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import case, delete, func, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from models import FeedScanResult, ScanRun, db
+
+# Scan runs older than this are pruned after each scan
+SCAN_HISTORY_DAYS = int(os.environ.get('SCAN_HISTORY_DAYS', 30))
+
+# Rows per INSERT when writing the per-feed results of a run
+RESULT_BATCH_SIZE = 500
+
+def _rounded(seconds):
+    return round(seconds, 4) if seconds is not None else None
+
+def start_scan_run(trigger, started_at):
+    """Create the history row of a scan as it starts and return its id.
+
+    History is best effort: errors are logged and None is returned.
+    """
+    try:
+        run = ScanRun(trigger=trigger, started_at=started_at, status='running', total_feeds=0,
+                      successful_feeds=0, failed_feeds=0, new_articles=0)
+        db.session.add(run)
+        db.session.commit()
+        return run.id
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error recording scan run history: {str(e)}")
+        return None
+
+def add_scan_results(run_id, feed_results):
+    """Persist a batch of per-feed results of a running scan.
+
+    `feed_results` is a list of dicts with the FeedScanResult columns (without
+    scan_run_id). Errors are logged, never raised.
+    """
+    if run_id is None or not feed_results:
+        return
+    rows = []
+    for result in feed_results:
+        row = dict(result, scan_run_id=run_id)
+        for column in ('fetch_seconds', 'parse_seconds', 'persist_seconds', 'total_seconds'):
+            row[column] = _rounded(row.get(column))
+        if row.get('error'):
+            row['error'] = row['error'][:500]
+        rows.append(row)
+
+    try:
+        for i in range(0, len(rows), RESULT_BATCH_SIZE):
+            db.session.execute(insert(FeedScanResult), rows[i:i + RESULT_BATCH_SIZE])
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error recording scan results: {str(e)}")
+
+def finish_scan_run(run_id, finished_at, status, total_feeds, successful_feeds, failed_feeds, new_articles,
+                    deferred_feeds=0):
+    """Record the outcome and totals of a scan started with start_scan_run"""
+    if run_id is None:
+        return
+    try:
+        run = db.session.get(ScanRun, run_id)
+        run.finished_at = finished_at
+        run.duration = (finished_at - run.started_at).total_seconds()
+        run.status = status
+        run.total_feeds = total_feeds
+        run.successful_feeds = successful_feeds
+        run.failed_feeds = failed_feeds
+        run.new_articles = new_articles
+        run.deferred_feeds = deferred_feeds
+        db.session.commit()
+        logging.info(f"Recorded scan run {run_id} with {total_feeds} feed results")
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error recording scan run history: {str(e)}")
+
+def prune_scan_history(days=SCAN_HISTORY_DAYS):
+    """Delete scan runs and their results older than `days`"""
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    try:
+        old_runs = select(ScanRun.id).where(ScanRun.started_at < cutoff)
+        deleted_results = db.session.execute(
+            delete(FeedScanResult).where(FeedScanResult.scan_run_id.in_(old_runs))
+        ).rowcount
+        deleted_runs = db.session.execute(delete(ScanRun).where(ScanRun.started_at < cutoff)).rowcount
+        db.session.commit()
+        if deleted_runs:
+            logging.info(f"Pruned {deleted_runs} scan runs and {deleted_results} feed results older than {days} days")
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error pruning scan history: {str(e)}")
+
+def serialize_scan_run(run):
+    return {
+        'id': run.id,
+        'trigger': run.trigger,
+        'started_at': run.started_at.isoformat() if run.started_at else None,
+        'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+        'duration': run.duration,
+        'status': run.status,
+        'total_feeds': run.total_feeds,
+        'successful_feeds': run.successful_feeds,
+        'failed_feeds': run.failed_feeds,
+        'new_articles': run.new_articles,
+        'deferred_feeds': run.deferred_feeds or 0
+    }
+
+def serialize_feed_result(result):
+    return {
+        'feed_id': result.feed_id,
+        'feed_url': result.feed_url,
+        'status': result.status,
+        'http_status': result.http_status,
+        'bytes': result.bytes,
+        'new_items': result.new_items,
+        'fetch_seconds': result.fetch_seconds,
+        'parse_seconds': result.parse_seconds,
+        'persist_seconds': result.persist_seconds,
+        'total_seconds': result.total_seconds,
+        'error': result.error
+    }
+
+def recent_scan_runs(limit=50):
+    return ScanRun.query.order_by(ScanRun.started_at.desc()).limit(limit).all()
+
+def slowest_feeds(runs=10, limit=20):
+    """Feeds with the highest average scan time over the last `runs` scans"""
+    recent_runs = select(ScanRun.id).order_by(ScanRun.started_at.desc()).limit(runs)
+    average = func.avg(FeedScanResult.total_seconds)
+    query = (
+        select(
+            FeedScanResult.feed_id,
+            func.max(FeedScanResult.feed_url),
+            average,
+            func.max(FeedScanResult.total_seconds),
+            func.avg(FeedScanResult.fetch_seconds),
+            func.avg(FeedScanResult.parse_seconds),
+            func.avg(FeedScanResult.persist_seconds),
+            func.avg(FeedScanResult.bytes),
+            func.count(),
+            func.sum(case((FeedScanResult.status == 'error', 1), else_=0))
+        )
+        .where(FeedScanResult.scan_run_id.in_(recent_runs), FeedScanResult.status != 'deferred')
+        .group_by(FeedScanResult.feed_id)
+        .order_by(average.desc())
+        .limit(limit)
+    )
+
+    feeds = []
+    for (feed_id, feed_url, avg_total, max_total, avg_fetch, avg_parse, avg_persist,
+         avg_bytes, scans, errors) in db.session.execute(query):
+        feeds.append({
+            'feed_id': feed_id,
+            'feed_url': feed_url,
+            'avg_seconds': _rounded(avg_total),
+            'max_seconds': _rounded(max_total),
+            'avg_fetch_seconds': _rounded(avg_fetch),
+            'avg_parse_seconds': _rounded(avg_parse),
+            'avg_persist_seconds': _rounded(avg_persist),
+            'avg_bytes': int(avg_bytes) if avg_bytes is not None else None,
+            'scans': scans,
+            'errors': errors or 0
+        })
+    return feeds
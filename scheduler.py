@@ -1,7 +1,15 @@
 from apscheduler.schedulers.background import BackgroundScheduler
 from apscheduler.executors.pool import ThreadPoolExecutor
 from feed_updater import update_all_feeds
+from sharding import HEARTBEAT_SECONDS, heartbeat, leave, live_nodes, owns
+from text_backfill import backfill_plain_text
+from feed_stats import backfill_feed_stats
+from feed_deletion import purge_deleted_feeds
+import websub
+import backup
+import fcntl
 import logging
+import os
 import threading
 import atexit
 
@@ -9,6 +17,9 @@ scheduler = None
 scheduler_lock = threading.Lock()
 job_lock = threading.Lock()
 
+# Feeds marked deleted on another node, or before a restart, are purged within this time
+PURGE_INTERVAL_MINUTES = 5
+
 def init_scheduler(app):
     """Initialize the scheduler with the Flask app context"""
     global scheduler
@@ -19,9 +30,13 @@ def init_scheduler(app):
 
         logging.info("Initializing background scheduler")
 
-        # Configure thread pool executor with max workers
+        # Configure thread pool executor with max workers; heartbeats get their
+        # own thread so a long scan does not make this node look gone, and
+        # deleted feeds are purged and backups taken next to a running scan
         executors = {
-            'default': ThreadPoolExecutor(max_workers=1)
+            'default': ThreadPoolExecutor(max_workers=1),
+            'heartbeat': ThreadPoolExecutor(max_workers=1),
+            'maintenance': ThreadPoolExecutor(max_workers=1)
         }
 
         # Create scheduler with proper configuration
@@ -44,11 +59,63 @@ def init_scheduler(app):
                 replace_existing=True  # Replace any existing job with same ID
             )
 
+            scheduler.add_job(
+                func=lambda: run_heartbeat_with_context(app),
+                trigger="interval",
+                seconds=HEARTBEAT_SECONDS,
+                id='scanner_heartbeat',
+                name='Scanner node heartbeat',
+                executor='heartbeat',
+                replace_existing=True
+            )
+
+            # One-off: normalize the text and count the articles of rows
+            # stored before ingest did it
+            scheduler.add_job(
+                func=lambda: run_backfill_with_context(app),
+                id='backfill_plain_text',
+                name='Backfill plain-text columns and daily feed statistics',
+                replace_existing=True
+            )
+
+            # Feeds deleted on this node are also purged right away, see start_feed_purge
+            scheduler.add_job(
+                func=lambda: run_purge_with_context(app),
+                trigger="interval",
+                minutes=PURGE_INTERVAL_MINUTES,
+                id='purge_deleted_feeds',
+                name='Purge articles of deleted feeds',
+                executor='maintenance',
+                replace_existing=True
+            )
+
+            if backup.BACKUP_INTERVAL_HOURS > 0:
+                scheduler.add_job(
+                    func=lambda: run_backup_with_context(app),
+                    trigger="interval",
+                    hours=backup.BACKUP_INTERVAL_HOURS,
+                    id='database_backup',
+                    name='Back up the database',
+                    executor='maintenance',
+                    replace_existing=True
+                )
+
+            if websub.enabled():
+                scheduler.add_job(
+                    func=lambda: run_websub_with_context(app),
+                    trigger="interval",
+                    minutes=websub.MAINTENANCE_MINUTES,
+                    id='websub_subscriptions',
+                    name='Subscribe and renew WebSub subscriptions',
+                    replace_existing=True
+                )
+
+            run_heartbeat_with_context(app)
             scheduler.start()
             logging.info("Scheduler started successfully")
 
             # Register shutdown handler
-            atexit.register(lambda: shutdown_scheduler())
+            atexit.register(lambda: shutdown_scheduler(app))
 
             # Calculate and log next run time
             next_run = scheduler.get_job('refresh_feeds').next_run_time
@@ -76,6 +143,80 @@ def run_update_with_context(app):
     finally:
         job_lock.release()
 
+def run_heartbeat_with_context(app):
+    """Tell the other scanner nodes this one is alive"""
+    with app.app_context():
+        heartbeat()
+
+def run_backfill_with_context(app):
+    """Fill the plain-text columns and daily statistics of existing feeds and articles"""
+    # Every worker schedules the job at startup; the first to take the lock
+    # runs it and the others skip it instead of repeating its writes
+    with open(os.path.join(app.instance_path, 'backfill.lock'), 'a') as lock:
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            logging.info("Backfill already running in another process, skipping")
+            return
+        try:
+            # Shares job_lock with the scans so both never write articles at once
+            with job_lock:
+                with app.app_context():
+                    backfill_plain_text()
+                    backfill_feed_stats()
+        finally:
+            fcntl.flock(lock, fcntl.LOCK_UN)
+
+def run_purge_with_context(app, feed_id=None):
+    """Delete the articles of deleted feeds in small batches, then the feeds.
+
+    With `feed_id`, only that feed is purged, whichever node owns it.
+    """
+    with app.app_context():
+        try:
+            if feed_id is not None:
+                purge_deleted_feeds(keep=lambda deleted_id: deleted_id == feed_id)
+                return
+            # Each node purges the deleted feeds it would scan
+            nodes = live_nodes()
+            purge_deleted_feeds(keep=lambda deleted_id: owns(deleted_id, nodes))
+        except Exception as e:
+            logging.error(f"Error purging deleted feeds: {str(e)}")
+
+def run_backup_with_context(app):
+    """Take an online backup of the SQLite database"""
+    with app.app_context():
+        try:
+            backup.scheduled_backup(backup.database_path(app.config['SQLALCHEMY_DATABASE_URI']))
+        except Exception as e:
+            logging.error(f"Error backing up the database: {str(e)}")
+
+def start_feed_purge(app, feed_id):
+    """Purge a feed just marked deleted now, in this process, instead of waiting for its owner"""
+    if scheduler:
+        try:
+            # The maintenance executor runs it after any purge or backup already under way
+            scheduler.add_job(
+                func=lambda: run_purge_with_context(app, feed_id),
+                id=f'purge_feed_{feed_id}',
+                name=f'Purge articles of deleted feed {feed_id}',
+                executor='maintenance',
+                misfire_grace_time=None,
+                replace_existing=True
+            )
+        except Exception as e:
+            logging.error(f"Error starting feed purge: {str(e)}")
+
+def run_websub_with_context(app):
+    """Subscribe feeds that advertise a hub and renew expiring leases"""
+    with app.app_context():
+        try:
+            # Each node looks after the subscriptions of the feeds it scans
+            nodes = live_nodes()
+            websub.maintain_subscriptions(keep=lambda feed_id: owns(feed_id, nodes))
+        except Exception as e:
+            logging.error(f"Error maintaining WebSub subscriptions: {str(e)}")
+
 def get_next_scan_time():
     """Helper function to safely get next scan time"""
     global scheduler
@@ -89,7 +230,7 @@ def get_next_scan_time():
     logging.warning("Scheduler or refresh job not found")
     return None
 
-def shutdown_scheduler():
+def shutdown_scheduler(app=None):
     """Safely shut down the scheduler"""
     global scheduler
     if scheduler:
@@ -97,4 +238,8 @@ def shutdown_scheduler():
             scheduler.shutdown(wait=False)
             logging.info("Scheduler shut down successfully")
         except Exception as e:
-            logging.error(f"Error shutting down scheduler: {str(e)}")
\ No newline at end of file
+            logging.error(f"Error shutting down scheduler: {str(e)}")
+        if app is not None:
+            # Hand this node's feeds to the other scanner nodes right away
+            with app.app_context():
+                leave()
\ No newline at end of file
@@ -0,0 +1,100 @@
+import hashlib
+import logging
+import os
+import socket
+from datetime import datetime, timedelta
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import SQLAlchemyError
+from models import SCANNER_NODE_ID, RSSFeed, ScanNode, ScanProgress, db
+
+# Every node refreshes its heartbeat this often; nodes silent for
+# NODE_TIMEOUT_SECONDS are considered gone and their feeds move to the others
+HEARTBEAT_SECONDS = int(os.environ.get('SCANNER_HEARTBEAT_SECONDS', 30))
+NODE_TIMEOUT_SECONDS = int(os.environ.get('SCANNER_NODE_TIMEOUT_SECONDS', HEARTBEAT_SECONDS * 3))
+
+# Rows of nodes gone for longer than this are deleted
+NODE_RETENTION = timedelta(days=1)
+
+def heartbeat():
+    """Register this node as alive and forget nodes gone for a long time"""
+    now = datetime.utcnow()
+    try:
+        node = db.session.get(ScanNode, SCANNER_NODE_ID)
+        if node is None:
+            node = ScanNode(node_id=SCANNER_NODE_ID, hostname=socket.gethostname(), pid=os.getpid(), started_at=now)
+            db.session.add(node)
+            logging.info(f"Scanner node {SCANNER_NODE_ID} joined")
+        node.last_heartbeat = now
+        cutoff = now - NODE_RETENTION
+        # Progress rows of nodes that did not leave cleanly go with their node
+        gone = select(ScanNode.node_id).where(ScanNode.last_heartbeat < cutoff)
+        db.session.execute(delete(ScanProgress).where(ScanProgress.node_id.in_(gone)))
+        db.session.execute(delete(ScanNode).where(ScanNode.last_heartbeat < cutoff))
+        # and so do those of processes without a heartbeat, such as web workers after a manual scan
+        db.session.execute(delete(ScanProgress).where(ScanProgress.last_updated < cutoff,
+                                                      ScanProgress.node_id.notin_(select(ScanNode.node_id))))
+        db.session.commit()
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error recording scanner heartbeat: {str(e)}")
+
+def leave():
+    """Remove this node so the others take over its feeds at their next scan"""
+    try:
+        db.session.execute(delete(ScanNode).where(ScanNode.node_id == SCANNER_NODE_ID))
+        db.session.execute(delete(ScanProgress).where(ScanProgress.node_id == SCANNER_NODE_ID))
+        db.session.commit()
+        logging.info(f"Scanner node {SCANNER_NODE_ID} left")
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error removing scanner node: {str(e)}")
+
+def live_nodes():
+    """Ids of the nodes with a recent heartbeat, always including this one"""
+    cutoff = datetime.utcnow() - timedelta(seconds=NODE_TIMEOUT_SECONDS)
+    nodes = set(db.session.scalars(select(ScanNode.node_id).where(ScanNode.last_heartbeat >= cutoff)))
+    nodes.add(SCANNER_NODE_ID)
+    return sorted(nodes)
+
+def _score(node_id, feed_id):
+    digest = hashlib.blake2b(f'{node_id}/{feed_id}'.encode(), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+def owner(feed_id, nodes):
+    """Rendezvous hashing: the feed belongs to the node with the highest score.
+
+    When a node joins or leaves, only the feeds it wins or held change owner.
+    """
+    return max(nodes, key=lambda node_id: _score(node_id, feed_id))
+
+def owns(feed_id, nodes):
+    """Whether this node scans the feed, given the live nodes"""
+    return len(nodes) == 1 or owner(feed_id, nodes) == SCANNER_NODE_ID
+
+def count_owned_feeds(nodes, batch_size=1000, where=None):
+    """Number of feeds this node scans, streaming the feed ids. `where` limits the feeds counted."""
+    count_query = select(func.count(RSSFeed.id))
+    id_query = select(RSSFeed.id)
+    if where is not None:
+        count_query = count_query.where(where)
+        id_query = id_query.where(where)
+    if len(nodes) == 1:
+        return db.session.scalar(count_query)
+    feed_ids = db.session.scalars(id_query.execution_options(yield_per=batch_size))
+    return sum(1 for feed_id in feed_ids if owns(feed_id, nodes))
+
+def aggregate_scan_progress():
+    """Combine the scan progress of every live node into one view"""
+    nodes = live_nodes()
+    rows = ScanProgress.query.filter(ScanProgress.node_id.in_(nodes)).all()
+    scanning = [row for row in rows if row.is_scanning]
+    current = max(scanning, key=lambda row: row.last_updated or datetime.min) if scanning else None
+    return {
+        'is_scanning': bool(scanning),
+        'current_feed': current.current_feed if current else None,
+        'current_index': sum(row.current_index or 0 for row in scanning),
+        'total_feeds': sum(row.total_feeds or 0 for row in scanning),
+        'completed': not scanning,
+        'nodes': len(nodes),
+        'scanning_nodes': len(scanning)
+    }
@@ -77,8 +77,61 @@ function startCountdownTimer(nextScanTimeISO) {
     window.countdownInterval = setInterval(updateCountdown, 1000);
 }
 
+// The feed list is requested in the compact columnar format and turned back
+// into one object per feed
+const COLUMNAR_JSON = 'application/vnd.rss-feed-manager.columnar+json';
+
+function feedsFromColumns(table) {
+    const names = Object.keys(table.columns);
+    const feeds = new Array(table.count);
+    for (let i = 0; i < table.count; i++) {
+        const feed = {};
+        names.forEach(name => { feed[name] = table.columns[name][i]; });
+        feeds[i] = feed;
+    }
+    return feeds;
+}
+
+function getFeeds() {
+    return $.ajax({
+        url: '/api/feeds',
+        dataType: 'json',
+        headers: { Accept: COLUMNAR_JSON }
+    }).then(function(response) {
+        response.feeds = feedsFromColumns(response.feeds);
+        return response;
+    });
+}
+
+// Daily article counts per feed, from the rollups; refreshed far less often
+// than the feed list since they only change with new articles
+const SPARKLINE_REFRESH_MS = 10 * 60 * 1000;
+let sparklineCounts = {};
+
+function loadSparklines() {
+    return $.getJSON('/api/analytics/sparklines', { days: 30 })
+        .done(function(response) {
+            sparklineCounts = response.feeds;
+        });
+}
+
+function sparklineSvg(counts) {
+    if (!counts || counts.length < 2) return '';
+    const width = 90;
+    const height = 20;
+    const max = Math.max(1, ...counts);
+    const step = width / (counts.length - 1);
+    const points = counts.map((count, i) =>
+        `${(i * step).toFixed(1)},${(height - 1 - (count / max) * (height - 2)).toFixed(1)}`).join(' ');
+    const total = counts.reduce((sum, count) => sum + count, 0);
+    return `<svg width="${width}" height="${height}" class="sparkline">
+        <title>${total} articles in ${counts.length} days</title>
+        <polyline fill="none" stroke="currentColor" stroke-width="1.5" points="${points}"/>
+    </svg>`;
+}
+
 function loadFeeds() {
-    $.get('/api/feeds')
+    getFeeds()
         .done(function(response) {
             updateFeedsDisplay(response);
         })
@@ -166,6 +219,7 @@ function updateFeedsDisplay(response, sortConfig = { column: 'title', direction:
                 <td>${feed.url}</td>
                 <td>${feed.num_articles}</td>
                 <td>${feed.recent_articles}</td>
+                <td>${sparklineSvg(sparklineCounts[feed.id])}</td>
                 <td>${formatTimestamp(feed.last_article_date, true)}</td>
                 <td>${formatTimestamp(feed.last_scan_time, true)}</td>
                 <td>${feed.last_scan_trigger}</td>
@@ -216,6 +270,8 @@ $(document).ready(function() {
 
     // Initial load
     loadFeeds();
+    loadSparklines();
+    setInterval(loadSparklines, SPARKLINE_REFRESH_MS);
 
     // Refresh feeds more frequently during scanning
     let pollInterval = 5000;  // Default 5 second interval
@@ -225,7 +281,7 @@ $(document).ready(function() {
     }
 
     function pollFeeds() {
-        $.get('/api/feeds')
+        getFeeds()
             .done(function(response) {
                 updatePollInterval(response.scan_progress);
                 updateFeedsDisplay(response, currentSort);
@@ -268,7 +324,7 @@ $(document).ready(function() {
         }
 
         // Reload feeds with new sort
-        $.get('/api/feeds')
+        getFeeds()
             .done(function(response) {
                 updateFeedsDisplay(response, currentSort);
             })
@@ -307,7 +363,7 @@ $(document).ready(function() {
 
                 // Full reload after a delay to get all updated stats
                 setTimeout(() => {
-                    $.get('/api/feeds')
+                    getFeeds()
                         .done(function(response) {
                             updateFeedsDisplay(response, currentSort);
                         });
@@ -342,7 +398,7 @@ $(document).ready(function() {
             method: 'DELETE'
         })
             .done(function(response) {
-                $.get('/api/feeds')
+                getFeeds()
                     .done(function(response) {
                         updateFeedsDisplay(response, currentSort);
                     });
@@ -363,7 +419,7 @@ $(document).ready(function() {
 
         $.post('/api/feeds/refresh')
             .done(function(response) {
-                $.get('/api/feeds')
+                getFeeds()
                     .done(function(response) {
                         updateFeedsDisplay(response, currentSort);
                     });
@@ -381,24 +437,44 @@ $(document).ready(function() {
     $('#addFeedForm').submit(function(e) {
         e.preventDefault();
         const urls = $('#feedUrls').val().split('\n').map(url => url.trim()).filter(url => url);
+        const file = $('#feedFile')[0].files[0];
 
-        if (urls.length === 0) {
-            showError('Please enter at least one URL');
+        if (urls.length === 0 && !file) {
+            showError('Please enter at least one URL or choose a file to import');
             return;
         }
 
+        let request;
+        if (file) {
+            // Uploaded OPML or URL list files are parsed on the server
+            const formData = new FormData();
+            formData.append('file', file);
+            request = {
+                url: '/api/feeds/import',
+                method: 'POST',
+                data: formData,
+                processData: false,
+                contentType: false
+            };
+        } else {
+            request = {
+                url: '/api/feeds/bulk',
+                method: 'POST',
+                contentType: 'application/json',
+                data: JSON.stringify({ urls: urls })
+            };
+        }
+
         $.ajax({
-            url: '/api/feeds/bulk',
-            method: 'POST',
-            contentType: 'application/json',
-            data: JSON.stringify({ urls: urls }),
+            ...request,
             success: function(response) {
                 if (response.errors && response.errors.length > 0) {
                     showError('Some feeds could not be added:\n' + response.errors.join('\n'));
                 }
                 $('#addFeedModal').modal('hide');
                 $('#feedUrls').val('');
-                $.get('/api/feeds')
+                $('#feedFile').val('');
+                getFeeds()
                     .done(function(response) {
                         updateFeedsDisplay(response, currentSort);
                     });
@@ -0,0 +1,52 @@
+import logging
+import os
+from sqlalchemy import select, update
+from sqlalchemy.exc import SQLAlchemyError
+from models import Article, RSSFeed, db
+from text_normalize import html_to_text, plain_title
+
+# Rows normalized and committed at a time
+BACKFILL_BATCH_SIZE = int(os.environ.get('TEXT_BACKFILL_BATCH_SIZE', 1000))
+
+def _backfill(model, columns, convert, batch_size):
+    """Fill the plain-text columns of `model` rows stored before they existed.
+
+    Walks the rows missing them in id order, one committed batch at a time,
+    so it can be interrupted and resumed. Returns the number of rows filled.
+    """
+    filled = 0
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            select(model.id, *columns)
+            .where(model.title_text.is_(None), model.id > last_id)
+            .order_by(model.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            return filled
+        db.session.execute(update(model), [convert(row) for row in rows])
+        db.session.commit()
+        last_id = rows[-1].id
+        filled += len(rows)
+
+def backfill_plain_text(batch_size=BACKFILL_BATCH_SIZE):
+    """Normalize the titles and descriptions of existing feeds and articles"""
+    try:
+        feeds = _backfill(RSSFeed, [RSSFeed.title], lambda row: {
+            'id': row.id,
+            'title_text': plain_title(row.title)
+        }, batch_size)
+        articles = _backfill(Article, [Article.title, Article.description], lambda row: {
+            'id': row.id,
+            'title_text': plain_title(row.title),
+            'description_text': html_to_text(row.description)
+        }, batch_size)
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        logging.error(f"Error backfilling plain text: {str(e)}")
+        return None
+
+    if feeds or articles:
+        logging.info(f"Backfilled plain text of {feeds} feeds and {articles} articles")
+    return {'feeds': feeds, 'articles': articles}
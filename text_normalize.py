@@ -0,0 +1,66 @@
+import html
+import re
+import sys
+import unicodedata
+
+# Characters that become a space: every kind of line break and whitespace
+_SPACE_CATEGORIES = ('Zs', 'Zl', 'Zp')
+# Characters that are dropped: control, format (zero-width, soft hyphen,
+# bidi marks), surrogate and private use characters
+_DROP_CATEGORIES = ('Cc', 'Cf', 'Cs', 'Co')
+
+def _build_translation():
+    table = {}
+    # Astral planes are left to the isprintable() check in clean_text, they
+    # rarely occur and would make the table twenty times larger
+    for code in range(min(sys.maxunicode, 0xFFFF) + 1):
+        char = chr(code)
+        if char.isspace() or unicodedata.category(char) in _SPACE_CATEGORIES:
+            if char != ' ':
+                table[code] = ' '
+        elif unicodedata.category(char) in _DROP_CATEGORIES:
+            table[code] = None
+    return table
+
+_TRANSLATION = _build_translation()
+
+# Tags that separate words when rendered; other tags are removed in place
+_BLOCK_TAG = re.compile(
+    r'<\s*/?\s*(?:p|br|div|li|ul|ol|h[1-6]|tr|td|th|table|blockquote|pre|hr|img|section|article|figure)\b[^>]*>',
+    re.IGNORECASE)
+_SKIPPED_BLOCK = re.compile(r'<\s*(script|style)\b[^>]*>.*?<\s*/\s*\1\s*>', re.IGNORECASE | re.DOTALL)
+_COMMENT = re.compile(r'<!--.*?-->', re.DOTALL)
+_TAG = re.compile(r'<[^>]*>')
+
+def clean_text(text):
+    """Collapse whitespace and drop non-printable characters.
+
+    Text without line breaks or control characters, the common case, only
+    has its spaces collapsed; everything else goes through one translate()
+    call instead of a pass per character.
+    """
+    if not text:
+        return ''
+    if text.isprintable():
+        return ' '.join(text.split())
+    text = ' '.join(text.translate(_TRANSLATION).split())
+    if not text.isprintable():
+        text = ''.join(char for char in text if char.isprintable())
+    return text
+
+def html_to_text(value):
+    """Plain text of an HTML fragment: tags stripped, entities decoded, whitespace collapsed"""
+    if not value:
+        return ''
+    if '<' in value:
+        value = _COMMENT.sub(' ', value)
+        value = _SKIPPED_BLOCK.sub(' ', value)
+        value = _BLOCK_TAG.sub(' ', value)
+        value = _TAG.sub('', value)
+    if '&' in value:
+        value = html.unescape(value)
+    return clean_text(value)
+
+def plain_title(value, max_length=200):
+    """Plain text of an entry or feed title, cut to the column length"""
+    return html_to_text(value)[:max_length]
@@ -0,0 +1,93 @@
+"""Compare the fast RSS/Atom parser with feedparser on speed and output.
+
+Runs both parsers over the documents in tools/parser_corpus/ plus a set of
+synthetic feeds, reports entries whose output differs and the parse time of
+each parser.
+
+Usage: python tools/bench_fast_parser.py [--synthetic 100] [--entries 50] [--repeat 3]
+"""
+import argparse
+import glob
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_parser import FastParseError, parse_fast
+from feed_parser import parse_feed_body_feedparser
+from synthetic_feeds import make_feed
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'parser_corpus')
+
+def load_corpus(synthetic, entries):
+    documents = []
+    for path in sorted(glob.glob(os.path.join(CORPUS_DIR, '*.xml'))):
+        with open(path, 'rb') as f:
+            documents.append((os.path.basename(path), f.read()))
+    for feed_id in range(synthetic):
+        documents.append((f'synthetic-{feed_id}', make_feed(feed_id, entries)))
+    return documents
+
+def compare(name, fast, slow):
+    """Return a list of human readable differences between two ParsedFeeds"""
+    differences = []
+    if fast.title != slow.title:
+        differences.append(f"{name}: feed title {fast.title!r} != {slow.title!r}")
+    if len(fast.entries) != len(slow.entries):
+        differences.append(f"{name}: {len(fast.entries)} entries != {len(slow.entries)}")
+    for index, (a, b) in enumerate(zip(fast.entries, slow.entries)):
+        for field in a._fields:
+            if getattr(a, field) != getattr(b, field):
+                differences.append(f"{name}[{index}].{field}: {getattr(a, field)!r} != {getattr(b, field)!r}")
+    return differences
+
+def timed(func, *args, repeat=1):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--synthetic', type=int, default=100, help='number of synthetic feeds')
+    parser.add_argument('--entries', type=int, default=50, help='entries per synthetic feed')
+    parser.add_argument('--repeat', type=int, default=3, help='timing repetitions (best is kept)')
+    args = parser.parse_args()
+
+    documents = load_corpus(args.synthetic, args.entries)
+    fast_time = slow_time = 0.0
+    fast_docs = fallbacks = entries = 0
+    differences = []
+
+    for name, body in documents:
+        slow, slow_elapsed = timed(parse_feed_body_feedparser, body, repeat=args.repeat)
+        slow_time += slow_elapsed
+        start = time.perf_counter()
+        try:
+            fast, elapsed = timed(parse_fast, body, repeat=args.repeat)
+        except FastParseError as e:
+            fallbacks += 1
+            print(f"fallback  {name}: {str(e)}")
+            # A fallback document costs the failed fast attempt plus feedparser
+            fast_time += time.perf_counter() - start + slow_elapsed
+            continue
+        fast_time += elapsed
+        fast_docs += 1
+        entries += len(fast.entries)
+        differences.extend(compare(name, fast, slow))
+
+    print()
+    for difference in differences:
+        print(f"mismatch  {difference}")
+    print()
+    print(f"documents: {len(documents)} ({fast_docs} fast path, {fallbacks} fallback)")
+    print(f"entries compared: {entries}, mismatching fields: {len(differences)}")
+    print(f"feedparser: {slow_time:.3f}s   fast parser: {fast_time:.3f}s   "
+          f"speedup: {slow_time / fast_time if fast_time else float('nan'):.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark feed parse throughput against the number of parser processes.
+
+Usage: python tools/bench_parse_pool.py [--feeds 200] [--entries 50] [--workers 1,2,4]
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feed_parser import parse_feed_body, _pool_context
+from synthetic_feeds import make_feed
+
+def run_inline(bodies):
+    start = time.perf_counter()
+    entries = sum(len(parse_feed_body(body).entries) for body in bodies)
+    return time.perf_counter() - start, entries
+
+def run_pool(bodies, workers):
+    with ProcessPoolExecutor(max_workers=workers, mp_context=_pool_context()) as pool:
+        # Warm up the workers so process start-up is not measured
+        list(pool.map(parse_feed_body, bodies[:workers]))
+        start = time.perf_counter()
+        entries = sum(len(parsed.entries) for parsed in pool.map(parse_feed_body, bodies))
+        return time.perf_counter() - start, entries
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--feeds', type=int, default=200, help='number of feed bodies to parse')
+    parser.add_argument('--entries', type=int, default=50, help='entries per feed')
+    parser.add_argument('--description-size', type=int, default=800, help='approximate description length')
+    parser.add_argument('--workers', default=None,
+                        help='comma separated worker counts (default: powers of two up to the core count)')
+    args = parser.parse_args()
+
+    cores = os.cpu_count() or 1
+    if args.workers:
+        worker_counts = [int(count) for count in args.workers.split(',')]
+    else:
+        worker_counts = []
+        count = 1
+        while count <= cores:
+            worker_counts.append(count)
+            count *= 2
+        if worker_counts[-1] != cores:
+            worker_counts.append(cores)
+
+    bodies = [make_feed(i, args.entries, args.description_size) for i in range(args.feeds)]
+    megabytes = sum(len(body) for body in bodies) / 1e6
+    print(f"{args.feeds} feeds, {args.entries} entries each, {megabytes:.1f} MB, {cores} cores")
+    print(f"{'mode':>10} {'seconds':>9} {'feeds/s':>9} {'entries/s':>10} {'speedup':>8}")
+
+    baseline, entries = run_inline(bodies)
+    print(f"{'inline':>10} {baseline:9.2f} {args.feeds / baseline:9.1f} {entries / baseline:10.0f} {1.0:8.2f}")
+
+    for workers in worker_counts:
+        elapsed, entries = run_pool(bodies, workers)
+        print(f"{f'{workers} procs':>10} {elapsed:9.2f} {args.feeds / elapsed:9.1f} "
+              f"{entries / elapsed:10.0f} {baseline / elapsed:8.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+"""Local HTTP server serving thousands of synthetic RSS/Atom feeds.
+
+Feeds are served at /feeds/<id>.xml. Size, latency, error rate and change
+rate are configurable, and everything is seeded so runs are reproducible.
+
+Control endpoints:
+    POST /_advance  publish new items on a `change_rate` fraction of feeds
+    GET  /_stats    request, error and byte counters as JSON
+
+Usage: python tools/feed_farm.py --feeds 2000 --latency-ms 20 --error-rate 0.02
+"""
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic_feeds import make_feed
+
+class FeedFarm:
+    def __init__(self, feeds=1000, entries=20, description_size=500, latency_ms=0,
+                 latency_jitter_ms=0, error_rate=0.0, change_rate=0.1, new_items=2, seed=1):
+        self.feeds = feeds
+        self.entries = entries
+        self.description_size = description_size
+        self.latency_ms = latency_ms
+        self.latency_jitter_ms = latency_jitter_ms
+        self.change_rate = change_rate
+        self.new_items = new_items
+        self.rng = random.Random(seed)
+        self.versions = [0] * feeds
+        self.failing = set(self.rng.sample(range(feeds), int(feeds * error_rate)))
+        self.bodies = {}
+        self.lock = threading.Lock()
+        self.stats = {'requests': 0, 'errors': 0, 'bytes_sent': 0, 'round': 0}
+
+    def body(self, feed_id):
+        """Rendered feed body, cached per feed version"""
+        key = (feed_id, self.versions[feed_id])
+        body = self.bodies.get(key)
+        if body is None:
+            body = make_feed(feed_id, self.entries, self.description_size, self.versions[feed_id])
+            with self.lock:
+                self.bodies.pop((feed_id, self.versions[feed_id] - self.new_items), None)
+                self.bodies[key] = body
+        return body
+
+    def prerender(self):
+        for feed_id in range(self.feeds):
+            self.body(feed_id)
+
+    def advance(self):
+        """Publish new items on a random subset of feeds, returns the number changed"""
+        changed = 0
+        for feed_id in range(self.feeds):
+            if self.rng.random() < self.change_rate:
+                self.versions[feed_id] += self.new_items
+                changed += 1
+        self.stats['round'] += 1
+        self.prerender()
+        return changed
+
+    def delay(self):
+        if self.latency_ms or self.latency_jitter_ms:
+            jitter = random.uniform(-self.latency_jitter_ms, self.latency_jitter_ms)
+            time.sleep(max(0.0, self.latency_ms + jitter) / 1000.0)
+
+def make_handler(farm):
+    class FeedFarmHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status, body, content_type):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            with farm.lock:
+                farm.stats['bytes_sent'] += len(body)
+
+        def do_GET(self):
+            if self.path == '/_stats':
+                self._send(200, json.dumps(farm.stats).encode(), 'application/json')
+                return
+
+            with farm.lock:
+                farm.stats['requests'] += 1
+            try:
+                feed_id = int(self.path.rsplit('/', 1)[-1].split('.')[0])
+                if not self.path.startswith('/feeds/') or not 0 <= feed_id < farm.feeds:
+                    raise ValueError
+            except ValueError:
+                self._send(404, b'not found', 'text/plain')
+                return
+
+            farm.delay()
+            if feed_id in farm.failing:
+                with farm.lock:
+                    farm.stats['errors'] += 1
+                self._send(500, b'synthetic failure', 'text/plain')
+                return
+            self._send(200, farm.body(feed_id), 'application/xml; charset=utf-8')
+
+        def do_POST(self):
+            if self.path == '/_advance':
+                changed = farm.advance()
+                self._send(200, json.dumps({'changed': changed}).encode(), 'application/json')
+            else:
+                self._send(404, b'not found', 'text/plain')
+
+        def log_message(self, format, *args):
+            pass
+
+    return FeedFarmHandler
+
+def add_farm_arguments(parser):
+    parser.add_argument('--feeds', type=int, default=1000, help='number of feeds served')
+    parser.add_argument('--entries', type=int, default=20, help='entries per feed')
+    parser.add_argument('--description-size', type=int, default=500, help='approximate description length')
+    parser.add_argument('--latency-ms', type=float, default=0, help='response latency in milliseconds')
+    parser.add_argument('--latency-jitter-ms', type=float, default=0, help='random +/- latency jitter')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of feeds answering 500')
+    parser.add_argument('--change-rate', type=float, default=0.1, help='fraction of feeds changed per round')
+    parser.add_argument('--new-items', type=int, default=2, help='new items per changed feed and round')
+    parser.add_argument('--seed', type=int, default=1, help='random seed')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_farm_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900, help='port to listen on (0 picks a free port)')
+    args = parser.parse_args()
+
+    farm = FeedFarm(args.feeds, args.entries, args.description_size, args.latency_ms,
+                    args.latency_jitter_ms, args.error_rate, args.change_rate, args.new_items, args.seed)
+    farm.prerender()
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(farm))
+    server.daemon_threads = True
+    server.request_queue_size = 1024
+    # The READY line is read by the benchmark harness to find the port
+    print(f"READY {server.server_port}", flush=True)
+    print(f"Serving {args.feeds} feeds at http://{args.host}:{server.server_port}/feeds/<id>.xml",
+          file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
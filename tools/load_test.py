@@ -0,0 +1,364 @@
+"""Load test the web tier with dashboards open while scans run.
+
+Builds a scratch SQLite database with --feeds feeds served by a local feed
+farm and --articles stored articles, starts gunicorn with the project's
+gunicorn.conf.py against it and, while scans run back to back, replays
+browser traffic for --duration seconds: dashboards polling /api/feeds (every
+500 ms during a scan, as dashboard.js does), article pages and searches, and
+article and feed list exports. Reports p50/p95/p99 latency, error rate and
+"database is locked" responses per endpoint, plus the "database is locked"
+lines and worker timeouts logged by the server.
+
+Usage:
+    python tools/load_test.py --feeds 2000 --articles 200000 --dashboards 20 --duration 60
+"""
+import argparse
+import gzip
+import http.cookiejar
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+LOGS_DIR = os.path.join(REPO_DIR, 'logs')
+
+sys.path.insert(0, REPO_DIR)
+
+from feed_farm import add_farm_arguments
+from scan_bench import start_farm
+from synthetic_feeds import WORDS
+
+COLUMNAR_JSON = 'application/vnd.rss-feed-manager.columnar+json'
+LOCKED_MESSAGE = b'database is locked'
+SEED_BATCH_SIZE = 5000
+SERVER_START_TIMEOUT = 60
+
+def seed_articles(count, feeds, days, seed):
+    """Bulk insert `count` articles spread over `feeds` feeds and the last `days` days"""
+    from sqlalchemy import func, insert, select, update
+    from models import Article, RSSFeed, db
+    from text_normalize import html_to_text
+
+    rng = random.Random(seed)
+    feed_ids = list(db.session.scalars(select(RSSFeed.id).order_by(RSSFeed.id)))[:feeds]
+    now = datetime.utcnow()
+    for start in range(0, count, SEED_BATCH_SIZE):
+        rows = []
+        for index in range(start, min(start + SEED_BATCH_SIZE, count)):
+            title = ' '.join(rng.choice(WORDS) for _ in range(rng.randint(4, 10))).capitalize()
+            description = f"<p>{' '.join(rng.choice(WORDS) for _ in range(30))} &amp; more</p>"
+            rows.append({
+                'feed_id': rng.choice(feed_ids),
+                'title': title,
+                'link': f'https://archive.example.com/articles/{index}',
+                'description': description,
+                'title_text': title,
+                'description_text': html_to_text(description),
+                'published_date': now - timedelta(seconds=rng.randint(0, days * 86400)),
+                'collected_date': now
+            })
+        db.session.execute(insert(Article), rows)
+        db.session.commit()
+
+    counts = select(func.count(Article.id)).where(Article.feed_id == RSSFeed.id).scalar_subquery()
+    db.session.execute(update(RSSFeed).values(num_articles=counts))
+    db.session.commit()
+
+def build_database(args, base_url, database_url):
+    """Scratch database with the farm's feeds, seeded articles and the admin user"""
+    os.environ['DATABASE_URL'] = database_url
+    import logging
+    from app import app, db
+    from auth import init_admin
+    from feed_import import import_feeds
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        db.create_all()
+        init_admin()
+        import_feeds([f"{base_url}/feeds/{i}.xml" for i in range(args.feeds)])
+        seed_articles(args.articles, args.feeds, args.days, args.seed)
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(args, env):
+    """Start gunicorn with the project configuration and wait until it answers"""
+    port = free_port()
+    command = [sys.executable, '-m', 'gunicorn', '-c', os.path.join(REPO_DIR, 'gunicorn.conf.py'),
+               '--bind', f'127.0.0.1:{port}', 'wsgi:app']
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    server = subprocess.Popen(command, cwd=REPO_DIR, env=env)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with {server.returncode}")
+        try:
+            urllib.request.urlopen(f'{base_url}/login', timeout=2).read()
+            return server, base_url
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError("gunicorn did not start in time")
+
+class Stats:
+    """Latency samples and failures per endpoint, shared by every virtual user"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.locked = defaultdict(int)
+
+    def record(self, endpoint, seconds, failed, locked):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            if failed:
+                self.errors[endpoint] += 1
+            if locked:
+                self.locked[endpoint] += 1
+
+    def report(self):
+        rows = []
+        for endpoint in sorted(self.latencies):
+            samples = sorted(self.latencies[endpoint])
+            count = len(samples)
+            rows.append({
+                'endpoint': endpoint,
+                'requests': count,
+                'errors': self.errors[endpoint],
+                'error_rate': self.errors[endpoint] / count,
+                'locked': self.locked[endpoint],
+                'p50_ms': percentile(samples, 50) * 1000,
+                'p95_ms': percentile(samples, 95) * 1000,
+                'p99_ms': percentile(samples, 99) * 1000,
+                'max_ms': samples[-1] * 1000
+            })
+        return rows
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of sorted samples"""
+    rank = max(1, round(pct / 100 * len(samples)))
+    return samples[min(rank, len(samples)) - 1]
+
+class Browser:
+    """One logged-in browser session"""
+
+    def __init__(self, base_url, stats, timeout):
+        self.base_url = base_url
+        self.stats = stats
+        self.timeout = timeout
+        self.opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+
+    def login(self):
+        data = urllib.parse.urlencode({'username': 'admin', 'password': 'admin'}).encode()
+        self.opener.open(f'{self.base_url}/login', data=data, timeout=self.timeout).read()
+
+    def request(self, endpoint, path, method='GET', headers=None, timeout=None):
+        """Send a request and record it under `endpoint`; returns the body, or None on failure"""
+        request = urllib.request.Request(f'{self.base_url}{path}', method=method, headers=headers or {})
+        start = time.perf_counter()
+        body = None
+        failed = True
+        try:
+            with self.opener.open(request, timeout=timeout or self.timeout) as response:
+                body = response.read()
+                if response.headers.get('Content-Encoding') == 'gzip':
+                    body = gzip.decompress(body)
+                failed = False
+        except urllib.error.HTTPError as e:
+            body = e.read()
+        except OSError:
+            pass
+        self.stats.record(endpoint, time.perf_counter() - start, failed, bool(body and LOCKED_MESSAGE in body))
+        return None if failed else body
+
+def dashboard_user(browser, stop):
+    """An open dashboard tab: page load, then /api/feeds polling like dashboard.js"""
+    browser.request('GET /', '/')
+    headers = {'Accept': COLUMNAR_JSON, 'Accept-Encoding': 'gzip'}
+    while not stop.is_set():
+        body = browser.request('GET /api/feeds', '/api/feeds', headers=headers)
+        interval = 5.0
+        if body:
+            try:
+                if json.loads(body)['scan_progress']['is_scanning']:
+                    interval = 0.5
+            except (ValueError, KeyError):
+                pass
+        stop.wait(interval)
+
+def reader_user(browser, stop, args, rng):
+    """Someone browsing, searching and opening articles"""
+    while not stop.is_set():
+        choice = rng.random()
+        if choice < 0.5:
+            page = rng.randint(1, 20)
+            sort = rng.choice(['published_date', 'title'])
+            browser.request('GET /articles', f'/articles?page={page}&sort={sort}&order=desc')
+        elif choice < 0.75:
+            browser.request('GET /articles?q=', f'/articles?q={rng.choice(WORDS)}')
+        else:
+            browser.request('GET /api/articles/<id>', f'/api/articles/{rng.randint(1, max(args.articles, 1))}')
+        stop.wait(rng.uniform(0.5, 1.5) * args.think_seconds)
+
+def exporter_user(browser, stop, args, rng):
+    """A downstream job downloading article ranges and the feed list"""
+    today = datetime.utcnow().date()
+    while not stop.is_set():
+        choice = rng.random()
+        if choice < 0.8:
+            last = today - timedelta(days=rng.randint(0, min(args.days, 7)))
+            first = last - timedelta(days=rng.randint(0, 6))
+            export_format = rng.choice(['txt', 'csv'])
+            endpoint = 'GET /api/articles/download (today)' if last == today else 'GET /api/articles/download'
+            browser.request(endpoint, f'/api/articles/download?start_date={first}&end_date={last}'
+                                      f'&format={export_format}', timeout=args.export_timeout)
+        else:
+            browser.request('GET /api/feeds/download', '/api/feeds/download', timeout=args.export_timeout)
+        stop.wait(rng.uniform(0.5, 1.5) * args.export_interval)
+
+def scan_driver(browser, stop, farm_url, scans):
+    """Run manual scans back to back, changing some farm feeds before each one"""
+    while not stop.is_set():
+        try:
+            urllib.request.urlopen(urllib.request.Request(f'{farm_url}/_advance', method='POST'), timeout=10).read()
+        except OSError:
+            pass
+        if browser.request('POST /api/feeds/refresh', '/api/feeds/refresh', method='POST', timeout=3600) is not None:
+            scans.append(time.monotonic())
+
+def log_offsets():
+    offsets = {}
+    for name in ('app.log', 'gunicorn_error.log'):
+        path = os.path.join(LOGS_DIR, name)
+        offsets[name] = os.path.getsize(path) if os.path.exists(path) else 0
+    return offsets
+
+def count_log_lines(offsets, needle):
+    """Lines containing `needle` written to the server logs since `offsets`"""
+    count = 0
+    for name, offset in offsets.items():
+        path = os.path.join(LOGS_DIR, name)
+        if not os.path.exists(path):
+            continue
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            count += sum(1 for line in f if needle in line)
+    return count
+
+def run_load(args, base_url, farm_url):
+    stats = Stats()
+    stop = threading.Event()
+    scans = []
+    threads = []
+
+    def start_user(target, *extra):
+        browser = Browser(base_url, stats, args.timeout)
+        browser.login()
+        thread = threading.Thread(target=target, args=(browser, stop, *extra), daemon=True)
+        thread.start()
+        threads.append(thread)
+
+    rng = random.Random(args.seed)
+    if not args.no_scan:
+        start_user(scan_driver, farm_url, scans)
+        # Let the scan get going so the dashboards switch to fast polling
+        time.sleep(1)
+    for _ in range(args.dashboards):
+        start_user(dashboard_user)
+    for _ in range(args.readers):
+        start_user(reader_user, args, random.Random(rng.random()))
+    for _ in range(args.exporters):
+        start_user(exporter_user, args, random.Random(rng.random()))
+
+    stop.wait(args.duration)
+    stop.set()
+    for thread in threads:
+        thread.join(timeout=args.timeout)
+    return stats, len(scans)
+
+def print_report(rows, scans, locked_log_lines, worker_timeouts):
+    print(f"{'endpoint':<40} {'requests':>8} {'errors':>7} {'locked':>7} {'p50 ms':>8} {'p95 ms':>8} "
+          f"{'p99 ms':>8} {'max ms':>8}")
+    for row in rows:
+        print(f"{row['endpoint']:<40} {row['requests']:>8} {row['error_rate']:>7.1%} {row['locked']:>7} "
+              f"{row['p50_ms']:>8.0f} {row['p95_ms']:>8.0f} {row['p99_ms']:>8.0f} {row['max_ms']:>8.0f}")
+    print(f"scans completed: {scans}, 'database is locked' in server logs: {locked_log_lines}, "
+          f"worker timeouts: {worker_timeouts}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_farm_arguments(parser)
+    parser.set_defaults(entries=10, description_size=300, latency_ms=20, change_rate=0.2)
+    parser.add_argument('--articles', type=int, default=50000, help='articles stored before the test')
+    parser.add_argument('--days', type=int, default=30, help='seeded articles are spread over this many days')
+    parser.add_argument('--dashboards', type=int, default=10, help='open dashboard tabs')
+    parser.add_argument('--readers', type=int, default=5, help='users browsing the articles page')
+    parser.add_argument('--exporters', type=int, default=2, help='clients downloading exports')
+    parser.add_argument('--think-seconds', type=float, default=2.0, help='average pause between reader requests')
+    parser.add_argument('--export-interval', type=float, default=10.0, help='average pause between exports')
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of traffic')
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: gunicorn.conf.py)')
+    parser.add_argument('--timeout', type=float, default=30.0, help='client timeout for page and API requests')
+    parser.add_argument('--export-timeout', type=float, default=120.0, help='client timeout for exports')
+    parser.add_argument('--no-scan', action='store_true', help='measure without a scan running')
+    parser.add_argument('--output', help='also write the results to this JSON file')
+    args = parser.parse_args()
+
+    scratch_dir = tempfile.mkdtemp(prefix='load_test_')
+    database_url = f"sqlite:///{os.path.join(scratch_dir, 'load_test.db')}"
+    env = dict(os.environ,
+               DATABASE_URL=database_url,
+               EXPORT_DIR=os.path.join(scratch_dir, 'exports'),
+               RAW_STORE_DIR=os.path.join(scratch_dir, 'raw_store'),
+               PROMETHEUS_MULTIPROC_DIR=os.path.join(scratch_dir, 'prometheus'))
+
+    farm, farm_url = start_farm(args)
+    server = None
+    try:
+        print(f"seeding {args.feeds} feeds and {args.articles} articles in {scratch_dir}", flush=True)
+        build_database(args, farm_url, database_url)
+        server, base_url = start_server(args, env)
+        offsets = log_offsets()
+        print(f"replaying traffic against {base_url} for {args.duration:.0f}s", flush=True)
+        stats, scans = run_load(args, base_url, farm_url)
+        rows = stats.report()
+        locked_log_lines = count_log_lines(offsets, LOCKED_MESSAGE)
+        worker_timeouts = count_log_lines(offsets, b'WORKER TIMEOUT')
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        farm.terminate()
+        farm.wait()
+
+    print_report(rows, scans, locked_log_lines, worker_timeouts)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'arguments': vars(args),
+                'endpoints': rows,
+                'scans': scans,
+                'locked_log_lines': locked_log_lines,
+                'worker_timeouts': worker_timeouts
+            }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
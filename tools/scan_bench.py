@@ -0,0 +1,179 @@
+"""Reproducible scanner benchmark against a local feed farm.
+
+Starts tools/feed_farm.py in a separate process, registers its feeds in a
+scratch database and runs update_all_feeds for a number of rounds, changing
+a fraction of the feeds between rounds. Reports feeds/sec, new articles/sec,
+database time, peak RSS and per-phase timings, and saves them as JSON.
+
+Usage:
+    python tools/scan_bench.py --feeds 2000 --latency-ms 20 --rounds 3
+    python tools/scan_bench.py --compare before.json after.json
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import datetime
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+RESULTS_DIR = os.path.join(TOOLS_DIR, 'bench_results')
+
+sys.path.insert(0, REPO_DIR)
+
+from feed_farm import add_farm_arguments
+
+DB_PHASES = ('dedup', 'persist', 'progress')
+
+def start_farm(args):
+    """Start the feed farm subprocess and return (process, base_url)"""
+    command = [sys.executable, os.path.join(TOOLS_DIR, 'feed_farm.py'), '--port', '0']
+    for name in ('feeds', 'entries', 'description_size', 'latency_ms', 'latency_jitter_ms',
+                 'error_rate', 'change_rate', 'new_items', 'seed'):
+        command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    process = subprocess.Popen(command, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    if not line.startswith('READY '):
+        process.kill()
+        raise RuntimeError(f"Feed farm failed to start: {line!r}")
+    return process, f"http://127.0.0.1:{int(line.split()[1])}"
+
+def peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale
+    return round(own, 1), round(children, 1)
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                                       text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_benchmark(args):
+    scratch_dir = tempfile.mkdtemp(prefix='scan_bench_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch_dir, 'scan_bench.db')}"
+    # Keep the export files and raw bodies of the scratch database out of instance/
+    os.environ['EXPORT_DIR'] = os.path.join(scratch_dir, 'exports')
+    os.environ['RAW_STORE_DIR'] = os.path.join(scratch_dir, 'raw_store')
+
+    # Import after DATABASE_URL is set so the app binds to the scratch database
+    import logging
+    from app import app, db
+    from feed_import import import_feeds
+    from feed_updater import update_all_feeds
+    from models import Article
+    logging.getLogger().setLevel(getattr(logging, args.log_level))
+
+    farm, base_url = start_farm(args)
+    rounds = []
+    try:
+        with app.app_context():
+            db.create_all()
+            import_feeds([f"{base_url}/feeds/{i}.xml" for i in range(args.feeds)])
+
+            for round_index in range(args.rounds):
+                if round_index:
+                    request = urllib.request.Request(f"{base_url}/_advance", method='POST')
+                    with urllib.request.urlopen(request) as response:
+                        changed = json.load(response)['changed']
+                else:
+                    changed = args.feeds
+
+                start = time.perf_counter()
+                summary = update_all_feeds(trigger='benchmark')
+                wall = time.perf_counter() - start
+                db_time = sum(summary['phase_times'].get(name, 0.0) for name in DB_PHASES)
+                own_rss, children_rss = peak_rss_mb()
+
+                result = {
+                    'round': round_index,
+                    'feeds_changed': changed,
+                    'wall_seconds': round(wall, 3),
+                    'feeds_per_sec': round(summary['total_feeds'] / wall, 2),
+                    'new_articles': summary['new_articles'],
+                    'new_articles_per_sec': round(summary['new_articles'] / wall, 2),
+                    'failed_feeds': summary['failed_updates'],
+                    'db_seconds': round(db_time, 3),
+                    'phase_seconds': {name: round(value, 3) for name, value in summary['phase_times'].items()},
+                    'peak_rss_mb': own_rss,
+                    'peak_rss_children_mb': children_rss,
+                    'total_articles': Article.query.count()
+                }
+                rounds.append(result)
+                print(f"round {round_index}: {result['wall_seconds']:.2f}s, "
+                      f"{result['feeds_per_sec']:.1f} feeds/s, "
+                      f"{result['new_articles_per_sec']:.1f} new articles/s, "
+                      f"db {result['db_seconds']:.2f}s, peak RSS {own_rss} MB", flush=True)
+
+        with urllib.request.urlopen(f"{base_url}/_stats") as response:
+            farm_stats = json.load(response)
+    finally:
+        farm.terminate()
+        farm.wait()
+
+    return {
+        'created': datetime.utcnow().isoformat(timespec='seconds'),
+        'git_revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'config': {name: value for name, value in vars(args).items() if name not in ('compare', 'output')},
+        'env': {name: os.environ.get(name) for name in ('FEED_PARSE_WORKERS', 'FAST_FEED_PARSER')},
+        'farm_stats': farm_stats,
+        'rounds': rounds
+    }
+
+def compare(before_path, after_path):
+    with open(before_path) as f:
+        before = json.load(f)
+    with open(after_path) as f:
+        after = json.load(f)
+
+    print(f"before: {before_path} ({before.get('git_revision')})")
+    print(f"after:  {after_path} ({after.get('git_revision')})")
+    if before.get('config') != after.get('config'):
+        print("warning: benchmark configurations differ")
+
+    metrics = ('wall_seconds', 'feeds_per_sec', 'new_articles_per_sec', 'db_seconds', 'peak_rss_mb')
+    for old, new in zip(before['rounds'], after['rounds']):
+        print(f"\nround {old['round']}")
+        rows = [(name, old[name], new[name]) for name in metrics]
+        rows += [(f"phase {name}", old['phase_seconds'].get(name, 0), new['phase_seconds'].get(name, 0))
+                 for name in sorted(set(old['phase_seconds']) | set(new['phase_seconds']))]
+        for name, old_value, new_value in rows:
+            change = f"{(new_value - old_value) / old_value * 100:+.1f}%" if old_value else 'n/a'
+            print(f"  {name:<22} {old_value:>12} {new_value:>12} {change:>9}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_farm_arguments(parser)
+    parser.add_argument('--rounds', type=int, default=3, help='number of scans to run')
+    parser.add_argument('--log-level', default='WARNING', help='application log level during the run')
+    parser.add_argument('--output', help='where to write the JSON results (default: tools/bench_results/)')
+    parser.add_argument('--compare', nargs=2, metavar=('BEFORE', 'AFTER'), help='compare two result files')
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+
+    results = run_benchmark(args)
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"scan-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.json")
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {output}")
+
+if __name__ == '__main__':
+    main()
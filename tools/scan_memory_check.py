@@ -0,0 +1,137 @@
+"""Check that scan memory stays flat as the feed table grows.
+
+For each feed count, starts a fresh process with a scratch SQLite database and
+a local feed farm, registers the feeds and runs one full scan while sampling
+the scanning process's RSS. Reports how much RSS grew during the scan and
+fails if the growth at the largest feed count exceeds the growth at the
+smallest by more than --max-growth-mb.
+
+Usage:
+    python tools/scan_memory_check.py --sizes 1000 4000 16000 --entries 5
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+
+sys.path.insert(0, REPO_DIR)
+
+from feed_farm import add_farm_arguments
+from scan_bench import start_farm
+
+SAMPLE_INTERVAL = 0.02
+
+def current_rss_mb():
+    """Resident set size of this process, from /proc where available"""
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except OSError:
+        scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+class RssSampler(threading.Thread):
+    """Record the highest RSS seen while running"""
+
+    def __init__(self):
+        super().__init__(daemon=True)
+        self.peak = current_rss_mb()
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(SAMPLE_INTERVAL):
+            self.peak = max(self.peak, current_rss_mb())
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+        self.peak = max(self.peak, current_rss_mb())
+        return self.peak
+
+def measure(args):
+    """Child process: scan `args.feeds` feeds once and print the RSS figures as JSON"""
+    scratch_dir = tempfile.mkdtemp(prefix='scan_memory_')
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(scratch_dir, 'scan.db')}"
+    # Keep the export files and raw bodies of the scratch database out of instance/
+    os.environ['EXPORT_DIR'] = os.path.join(scratch_dir, 'exports')
+    os.environ['RAW_STORE_DIR'] = os.path.join(scratch_dir, 'raw_store')
+
+    import gc
+    import logging
+    from app import app, db
+    from feed_import import import_feeds
+    from feed_updater import update_all_feeds
+    logging.getLogger().setLevel(logging.WARNING)
+
+    farm, base_url = start_farm(args)
+    try:
+        with app.app_context():
+            db.create_all()
+            import_feeds([f"{base_url}/feeds/{i}.xml" for i in range(args.feeds)])
+            db.session.remove()
+
+        with app.app_context():
+            gc.collect()
+            before = current_rss_mb()
+            sampler = RssSampler()
+            sampler.start()
+            start = time.perf_counter()
+            summary = update_all_feeds(trigger='benchmark')
+            wall = time.perf_counter() - start
+            peak = sampler.stop()
+    finally:
+        farm.terminate()
+        farm.wait()
+
+    print(json.dumps({
+        'feeds': args.feeds,
+        'failed': summary['failed_updates'],
+        'new_articles': summary['new_articles'],
+        'wall_seconds': round(wall, 2),
+        'rss_before_mb': round(before, 1),
+        'peak_rss_mb': round(peak, 1),
+        'growth_mb': round(peak - before, 1)
+    }), flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_farm_arguments(parser)
+    parser.set_defaults(entries=5, description_size=200)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 4000, 16000], help='feed counts to scan')
+    parser.add_argument('--max-growth-mb', type=float, default=20.0,
+                        help='allowed extra RSS growth of the largest scan over the smallest')
+    parser.add_argument('--measure', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        measure(args)
+        return
+
+    results = []
+    for size in args.sizes:
+        command = [sys.executable, os.path.abspath(__file__), '--measure', '--feeds', str(size)]
+        for name in ('entries', 'description_size', 'latency_ms', 'latency_jitter_ms', 'error_rate', 'seed'):
+            command += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+        output = subprocess.run(command, check=True, stdout=subprocess.PIPE, text=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        results.append(result)
+        print(f"{result['feeds']:>7} feeds: {result['wall_seconds']:.1f}s, RSS {result['rss_before_mb']} MB "
+              f"before the scan, peak {result['peak_rss_mb']} MB, growth {result['growth_mb']} MB", flush=True)
+
+    extra = results[-1]['growth_mb'] - results[0]['growth_mb']
+    print(f"growth from {results[0]['feeds']} to {results[-1]['feeds']} feeds: {extra:+.1f} MB "
+          f"(limit {args.max_growth_mb} MB)")
+    if extra > args.max_growth_mb:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,141 @@
+"""Run sharded scans with several local scanner nodes sharing one database.
+
+Starts tools/feed_farm.py, registers its feeds in a scratch SQLite database
+(or --database-url, e.g. a PostgreSQL instance) and, for each node count,
+starts that many scanner processes with their own SCANNER_NODE_ID. Every
+node scans only the feeds it owns. Reports per-node feed counts and wall
+time, and checks that each feed was scanned exactly once.
+
+Usage:
+    python tools/shard_demo.py --feeds 2000 --latency-ms 50 --nodes 1 2 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(TOOLS_DIR)
+
+sys.path.insert(0, REPO_DIR)
+
+from feed_farm import add_farm_arguments
+from scan_bench import start_farm
+
+# How long a node waits for the others to register before scanning
+BARRIER_TIMEOUT = 30
+
+def run_node(expected_nodes, prefix):
+    """Scanner node process: register, wait for the other nodes, scan the own shard"""
+    import logging
+    from app import app
+    from feed_updater import update_all_feeds
+    from models import SCANNER_NODE_ID
+    from sharding import heartbeat, leave, live_nodes
+    logging.getLogger().setLevel(logging.WARNING)
+
+    with app.app_context():
+        heartbeat()
+        deadline = time.monotonic() + BARRIER_TIMEOUT
+        while len([node for node in live_nodes() if node.startswith(prefix)]) < expected_nodes:
+            if time.monotonic() > deadline:
+                raise RuntimeError("Other scanner nodes did not start in time")
+            time.sleep(0.2)
+            heartbeat()
+
+        start = time.perf_counter()
+        summary = update_all_feeds(trigger='automatic')
+        wall = time.perf_counter() - start
+        leave()
+
+    print(json.dumps({
+        'node': SCANNER_NODE_ID,
+        'feeds': summary['total_feeds'] if summary else 0,
+        'failed': summary['failed_updates'] if summary else 0,
+        'new_articles': summary['new_articles'] if summary else 0,
+        'wall_seconds': round(wall, 3)
+    }), flush=True)
+
+def run_round(node_count, round_index, env):
+    prefix = f'demo-{round_index}-'
+    processes = []
+    for i in range(node_count):
+        node_env = dict(env, SCANNER_NODE_ID=f'{prefix}{i}')
+        processes.append(subprocess.Popen(
+            [sys.executable, __file__, '--node', '--expected-nodes', str(node_count), '--prefix', prefix],
+            env=node_env, stdout=subprocess.PIPE, text=True
+        ))
+
+    start = time.perf_counter()
+    nodes = []
+    for process in processes:
+        output, _ = process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"Scanner node exited with {process.returncode}")
+        nodes.append(json.loads(output.strip().splitlines()[-1]))
+    return nodes, time.perf_counter() - start
+
+def check_coverage(node_count, total_feeds):
+    """Each feed must appear in exactly one of the last `node_count` scan runs"""
+    from collections import Counter
+    from models import FeedScanResult, ScanRun
+    runs = [run.id for run in ScanRun.query.order_by(ScanRun.id.desc()).limit(node_count)]
+    counts = Counter(feed_id for (feed_id,) in FeedScanResult.query.with_entities(FeedScanResult.feed_id)
+                     .filter(FeedScanResult.scan_run_id.in_(runs)))
+    missing = total_feeds - len(counts)
+    duplicated = sum(1 for count in counts.values() if count > 1)
+    return missing, duplicated
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    add_farm_arguments(parser)
+    parser.add_argument('--nodes', type=int, nargs='+', default=[1, 2, 4], help='node counts to run, in order')
+    parser.add_argument('--database-url', help='shared database (default: scratch SQLite file)')
+    parser.add_argument('--node', action='store_true', help=argparse.SUPPRESS)
+    parser.add_argument('--expected-nodes', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--prefix', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.node:
+        run_node(args.expected_nodes, args.prefix)
+        return
+
+    scratch_dir = tempfile.mkdtemp(prefix='shard_demo_')
+    database_url = args.database_url or f"sqlite:///{os.path.join(scratch_dir, 'shard_demo.db')}"
+    os.environ['DATABASE_URL'] = database_url
+    # Shared by the nodes, and kept out of instance/ like the scratch database
+    os.environ['EXPORT_DIR'] = os.path.join(scratch_dir, 'exports')
+    os.environ['RAW_STORE_DIR'] = os.path.join(scratch_dir, 'raw_store')
+    env = dict(os.environ)
+
+    # Import after DATABASE_URL is set so the app binds to the shared database
+    from app import app, db
+    from feed_import import import_feeds
+
+    farm, base_url = start_farm(args)
+    try:
+        with app.app_context():
+            db.create_all()
+            import_feeds([f"{base_url}/feeds/{i}.xml" for i in range(args.feeds)])
+
+        baseline = None
+        for round_index, node_count in enumerate(args.nodes):
+            nodes, wall = run_round(node_count, round_index, env)
+            with app.app_context():
+                missing, duplicated = check_coverage(node_count, args.feeds)
+            throughput = args.feeds / wall
+            baseline = baseline or throughput / node_count
+            print(f"{node_count} node(s): {wall:.2f}s, {throughput:.1f} feeds/s "
+                  f"({throughput / baseline:.2f}x one node), missing {missing}, scanned twice {duplicated}")
+            for node in nodes:
+                print(f"  {node['node']}: {node['feeds']} feeds in {node['wall_seconds']:.2f}s, "
+                      f"{node['failed']} failed")
+    finally:
+        farm.terminate()
+        farm.wait()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Synthetic RSS 2.0 / Atom documents for benchmarks and local test servers"""
+import random
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from xml.sax.saxutils import escape
+
+WORDS = (
+    'startup funding round seed series venture capital market growth product '
+    'launch founder team investor platform revenue customer scale global '
+    'acquisition software hardware cloud data model network security mobile'
+).split()
+
+BASE_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+def _sentence(rng, words):
+    return ' '.join(rng.choice(WORDS) for _ in range(words)).capitalize()
+
+def _description(rng, size):
+    # Mix of markup, entities and plain text, similar to real feed summaries
+    parts = []
+    length = 0
+    while length < size:
+        text = _sentence(rng, rng.randint(8, 20))
+        chunk = f'<p>{escape(text)} &amp; <a href="https://example.com/{rng.randint(1, 10**6)}">more</a></p>'
+        parts.append(chunk)
+        length += len(chunk)
+    return ''.join(parts)
+
+def make_entries(feed_id, num_entries, description_size=500, version=0):
+    """Entries for a synthetic feed, newest first.
+
+    Bumping `version` prepends that many new entries, simulating a feed that
+    published new items since the last fetch.
+    """
+    rng = random.Random(feed_id)
+    entries = []
+    total = num_entries + version
+    for index in range(total - 1, total - 1 - num_entries, -1):
+        entries.append({
+            'title': _sentence(rng, rng.randint(4, 10)),
+            'link': f'https://feed{feed_id}.example.com/articles/{index}',
+            'description': _description(rng, description_size),
+            'published': BASE_DATE + timedelta(hours=index)
+        })
+    return entries
+
+def _hub_links(hub, self_url, prefix):
+    """WebSub discovery links, only rendered when a hub is given"""
+    if not hub:
+        return ''
+    return (f'<{prefix}link rel="hub" href="{escape(hub)}"/>'
+            f'<{prefix}link rel="self" href="{escape(self_url)}"/>')
+
+def make_rss(feed_id, num_entries=20, description_size=500, version=0, hub=None, self_url=None):
+    """Render a synthetic RSS 2.0 document as bytes"""
+    items = []
+    for entry in make_entries(feed_id, num_entries, description_size, version):
+        items.append(
+            '<item>'
+            f'<title>{escape(entry["title"])}</title>'
+            f'<link>{escape(entry["link"])}</link>'
+            f'<guid isPermaLink="true">{escape(entry["link"])}</guid>'
+            f'<description>{escape(entry["description"])}</description>'
+            f'<pubDate>{format_datetime(entry["published"], usegmt=True)}</pubDate>'
+            '</item>'
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<rss version="2.0" xmlns:atom="http://www.w3.org/2005/Atom"><channel>'
+        f'<title>Synthetic feed {feed_id}</title>'
+        f'<link>https://feed{feed_id}.example.com/</link>'
+        '<description>Synthetic benchmark feed</description>'
+        + _hub_links(hub, self_url, 'atom:')
+        + ''.join(items) +
+        '</channel></rss>'
+    ).encode('utf-8')
+
+def make_atom(feed_id, num_entries=20, description_size=500, version=0, hub=None, self_url=None):
+    """Render a synthetic Atom document as bytes"""
+    items = []
+    for entry in make_entries(feed_id, num_entries, description_size, version):
+        published = entry['published'].strftime('%Y-%m-%dT%H:%M:%SZ')
+        items.append(
+            '<entry>'
+            f'<title>{escape(entry["title"])}</title>'
+            f'<link rel="alternate" href="{escape(entry["link"])}"/>'
+            f'<id>{escape(entry["link"])}</id>'
+            f'<published>{published}</published>'
+            f'<updated>{published}</updated>'
+            f'<summary type="html">{escape(entry["description"])}</summary>'
+            '</entry>'
+        )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<feed xmlns="http://www.w3.org/2005/Atom">'
+        f'<title>Synthetic feed {feed_id}</title>'
+        f'<id>urn:synthetic:{feed_id}</id>'
+        f'<updated>{BASE_DATE.strftime("%Y-%m-%dT%H:%M:%SZ")}</updated>'
+        + _hub_links(hub, self_url, '') + ''.join(items) +
+        '</feed>'
+    ).encode('utf-8')
+
+def make_feed(feed_id, num_entries=20, description_size=500, version=0, hub=None, self_url=None):
+    """Alternate between RSS and Atom by feed id"""
+    render = make_atom if feed_id % 2 else make_rss
+    return render(feed_id, num_entries, description_size, version, hub, self_url)
@@ -0,0 +1,201 @@
+"""Local stand-in WebSub hub that also publishes synthetic feeds.
+
+Feeds are served at /feeds/<id>.xml and advertise this server as their hub
+(rel="hub") and their own URL as topic (rel="self"). Subscriptions are
+verified with a challenge sent to the callback, and published content is
+pushed to subscribers signed with `X-Hub-Signature: sha256=...`.
+
+Endpoints:
+    POST /                 hub endpoint (hub.mode=subscribe/unsubscribe)
+    POST /_publish/<id>    add new items to a feed and push it to its subscribers
+    GET  /_subscriptions   active subscriptions as JSON
+
+Point the application at it with WEBSUB_CALLBACK_BASE set to a URL the hub
+can reach, and add feeds from http://127.0.0.1:<port>/feeds/<id>.xml.
+
+Usage: python tools/websub_hub.py --feeds 10 --port 8901
+"""
+import argparse
+import hashlib
+import hmac
+import json
+import secrets
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from synthetic_feeds import make_feed
+
+VERIFY_TIMEOUT = 10
+DEFAULT_LEASE_SECONDS = 24 * 3600
+
+class Hub:
+    def __init__(self, feeds, entries, new_items):
+        self.feeds = feeds
+        self.entries = entries
+        self.new_items = new_items
+        self.base_url = None
+        self.versions = [0] * feeds
+        # (topic, callback) -> {'secret', 'expires'}
+        self.subscriptions = {}
+        self.lock = threading.Lock()
+        self.stats = {'verified': 0, 'rejected': 0, 'pushed': 0, 'push_failures': 0}
+
+    def topic(self, feed_id):
+        return f'{self.base_url}/feeds/{feed_id}.xml'
+
+    def body(self, feed_id):
+        return make_feed(feed_id, self.entries, 200, self.versions[feed_id],
+                         hub=f'{self.base_url}/', self_url=self.topic(feed_id))
+
+    def verify(self, mode, topic, callback, secret, lease_seconds):
+        """Confirm the intent with the subscriber, then apply the (un)subscription"""
+        challenge = secrets.token_urlsafe(16)
+        query = {'hub.mode': mode, 'hub.topic': topic, 'hub.challenge': challenge}
+        if mode == 'subscribe':
+            query['hub.lease_seconds'] = lease_seconds
+        separator = '&' if '?' in callback else '?'
+        try:
+            with urllib.request.urlopen(f'{callback}{separator}{urllib.parse.urlencode(query)}',
+                                        timeout=VERIFY_TIMEOUT) as response:
+                confirmed = response.read().decode() == challenge
+        except (OSError, UnicodeDecodeError):
+            confirmed = False
+
+        with self.lock:
+            if not confirmed:
+                self.stats['rejected'] += 1
+            elif mode == 'subscribe':
+                self.subscriptions[(topic, callback)] = {'secret': secret, 'expires': time.time() + lease_seconds}
+                self.stats['verified'] += 1
+            else:
+                self.subscriptions.pop((topic, callback), None)
+                self.stats['verified'] += 1
+
+    def publish(self, feed_id):
+        """Add new items to a feed and push it to every live subscriber"""
+        with self.lock:
+            self.versions[feed_id] += self.new_items
+            body = self.body(feed_id)
+            now = time.time()
+            targets = [(callback, sub['secret']) for (topic, callback), sub in self.subscriptions.items()
+                       if topic == self.topic(feed_id) and sub['expires'] > now]
+
+        delivered = 0
+        for callback, secret in targets:
+            headers = {'Content-Type': 'application/xml; charset=utf-8',
+                       'Link': f'<{self.base_url}/>; rel="hub", <{self.topic(feed_id)}>; rel="self"'}
+            if secret:
+                signature = hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+                headers['X-Hub-Signature'] = f'sha256={signature}'
+            try:
+                with urllib.request.urlopen(urllib.request.Request(callback, data=body, headers=headers),
+                                            timeout=VERIFY_TIMEOUT) as response:
+                    response.read()
+                delivered += 1
+            except OSError:
+                with self.lock:
+                    self.stats['push_failures'] += 1
+        with self.lock:
+            self.stats['pushed'] += delivered
+        return delivered
+
+def make_handler(hub):
+    class HubHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _send(self, status, body=b'', content_type='text/plain'):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _feed_id(self, prefix, suffix=''):
+            try:
+                feed_id = int(self.path[len(prefix):len(self.path) - len(suffix)])
+            except ValueError:
+                return None
+            return feed_id if 0 <= feed_id < hub.feeds else None
+
+        def do_GET(self):
+            if self.path == '/_subscriptions':
+                with hub.lock:
+                    subscriptions = [{'topic': topic, 'callback': callback, 'expires': sub['expires']}
+                                     for (topic, callback), sub in hub.subscriptions.items()]
+                    body = json.dumps({'subscriptions': subscriptions, 'stats': hub.stats}).encode()
+                self._send(200, body, 'application/json')
+                return
+            feed_id = self._feed_id('/feeds/', '.xml') if self.path.startswith('/feeds/') else None
+            if feed_id is None:
+                self._send(404, b'not found')
+                return
+            with hub.lock:
+                body = hub.body(feed_id)
+            self._send(200, body, 'application/xml; charset=utf-8')
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            data = self.rfile.read(length)
+            if self.path.startswith('/_publish/'):
+                feed_id = self._feed_id('/_publish/')
+                if feed_id is None:
+                    self._send(404, b'not found')
+                    return
+                delivered = hub.publish(feed_id)
+                self._send(200, json.dumps({'delivered': delivered}).encode(), 'application/json')
+                return
+            if self.path != '/':
+                self._send(404, b'not found')
+                return
+
+            form = {key: values[0] for key, values in urllib.parse.parse_qs(data.decode()).items()}
+            mode = form.get('hub.mode')
+            topic = form.get('hub.topic')
+            callback = form.get('hub.callback')
+            if mode not in ('subscribe', 'unsubscribe') or not topic or not callback:
+                self._send(400, b'hub.mode, hub.topic and hub.callback are required')
+                return
+            try:
+                lease_seconds = int(form.get('hub.lease_seconds') or DEFAULT_LEASE_SECONDS)
+            except ValueError:
+                self._send(400, b'invalid hub.lease_seconds')
+                return
+            threading.Thread(target=hub.verify, args=(mode, topic, callback, form.get('hub.secret'), lease_seconds),
+                             daemon=True).start()
+            self._send(202)
+
+        def log_message(self, format, *args):
+            pass
+
+    return HubHandler
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--feeds', type=int, default=10, help='number of feeds published')
+    parser.add_argument('--entries', type=int, default=10, help='entries per feed')
+    parser.add_argument('--new-items', type=int, default=2, help='new items per publish')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8901, help='port to listen on (0 picks a free port)')
+    args = parser.parse_args()
+
+    hub = Hub(args.feeds, args.entries, args.new_items)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(hub))
+    server.daemon_threads = True
+    hub.base_url = f'http://{args.host}:{server.server_port}'
+    # The READY line lets scripts find the port
+    print(f"READY {server.server_port}", flush=True)
+    print(f"WebSub hub at {hub.base_url}/, feeds at {hub.base_url}/feeds/<id>.xml", file=sys.stderr, flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+import hashlib
+import hmac
+import logging
+import os
+import secrets
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timedelta
+from sqlalchemy import and_, or_, select
+from sqlalchemy.exc import SQLAlchemyError
+from models import RSSFeed, db
+from feed_fetcher import get_proxy_handlers
+from feed_import import MAX_URL_LENGTH
+
+# Public base URL of this application that hubs call back, for example
+# https://rss.example.com. WebSub is off unless it is set.
+CALLBACK_BASE = os.environ.get('WEBSUB_CALLBACK_BASE', '').rstrip('/')
+
+# Lease asked from hubs; subscriptions are renewed RENEW_MARGIN before it ends
+LEASE_SECONDS = int(os.environ.get('WEBSUB_LEASE_SECONDS', 7 * 24 * 3600))
+RENEW_MARGIN = timedelta(hours=int(os.environ.get('WEBSUB_RENEW_HOURS', 24)))
+
+# Scheduled scans still poll feeds with a live subscription this often, in case pushes are lost
+SAFETY_POLL_INTERVAL = timedelta(hours=float(os.environ.get('WEBSUB_POLL_HOURS', 24)))
+
+# How often subscriptions are checked, and how many requests a check sends at most
+MAINTENANCE_MINUTES = int(os.environ.get('WEBSUB_MAINTENANCE_MINUTES', 10))
+SUBSCRIBE_BATCH = 100
+
+# Requests not verified within PENDING_TIMEOUT are sent again; failed and
+# denied subscriptions are retried after RETRY_INTERVAL
+PENDING_TIMEOUT = timedelta(minutes=30)
+RETRY_INTERVAL = timedelta(hours=6)
+
+HUB_TIMEOUT = 10
+MAX_PUSH_BYTES = 10 * 1024 * 1024
+
+# X-Hub-Signature methods accepted on pushed content
+SIGNATURE_METHODS = ('sha1', 'sha256', 'sha384', 'sha512')
+
+def enabled():
+    return bool(CALLBACK_BASE)
+
+def callback_url(feed_id):
+    return f'{CALLBACK_BASE}/websub/{feed_id}'
+
+def note_hub(feed, parsed):
+    """Record the hub and topic a parsed feed advertises.
+
+    A new or changed hub starts the subscription over at the next
+    maintenance run; a feed that stops advertising one is polled again.
+    """
+    hub = urllib.parse.urljoin(feed.url, parsed.hub) if parsed.hub else None
+    topic = urllib.parse.urljoin(feed.url, parsed.self_url or feed.url) if hub else None
+    if hub and (len(hub) > MAX_URL_LENGTH or len(topic) > MAX_URL_LENGTH):
+        hub = topic = None
+    if hub == feed.websub_hub and topic == feed.websub_topic:
+        return
+    if hub:
+        logging.info(f"Feed {feed.url} advertises WebSub hub {hub} for {topic}")
+    feed.websub_hub = hub
+    feed.websub_topic = topic
+    feed.websub_state = None
+    feed.websub_lease_expires = None
+
+def polled_feeds_filter(now=None):
+    """Feeds scheduled scans fetch: those without a live push subscription,
+    and subscribed ones not polled for SAFETY_POLL_INTERVAL"""
+    now = now or datetime.utcnow()
+    return or_(
+        RSSFeed.websub_state.is_distinct_from('subscribed'),
+        RSSFeed.websub_lease_expires.is_(None),
+        RSSFeed.websub_lease_expires < now,
+        RSSFeed.last_scan_time.is_(None),
+        RSSFeed.last_scan_time < now - SAFETY_POLL_INTERVAL
+    )
+
+def _due_filter(now):
+    not_requested_lately = or_(RSSFeed.websub_requested_at.is_(None),
+                               RSSFeed.websub_requested_at < now - PENDING_TIMEOUT)
+    return and_(RSSFeed.websub_hub.isnot(None), RSSFeed.deleted_at.is_(None), or_(
+        RSSFeed.websub_state.is_(None),
+        and_(RSSFeed.websub_state == 'pending', not_requested_lately),
+        and_(RSSFeed.websub_state == 'subscribed', not_requested_lately,
+             or_(RSSFeed.websub_lease_expires.is_(None), RSSFeed.websub_lease_expires < now + RENEW_MARGIN)),
+        and_(RSSFeed.websub_state.in_(('failed', 'denied')),
+             or_(RSSFeed.websub_requested_at.is_(None), RSSFeed.websub_requested_at < now - RETRY_INTERVAL))
+    ))
+
+def subscribe(feed):
+    """Ask the feed's hub for a subscription or a renewal.
+
+    The hub confirms later through the callback. Returns whether the hub
+    accepted the request.
+    """
+    if not feed.websub_secret:
+        feed.websub_secret = secrets.token_hex(20)
+    if feed.websub_state != 'subscribed':
+        # Renewals keep the feed on the slow poll until the lease runs out
+        feed.websub_state = 'pending'
+    feed.websub_requested_at = datetime.utcnow()
+    # Committed first, the hub may verify before it answers
+    db.session.commit()
+
+    data = urllib.parse.urlencode({
+        'hub.mode': 'subscribe',
+        'hub.topic': feed.websub_topic,
+        'hub.callback': callback_url(feed.id),
+        'hub.secret': feed.websub_secret,
+        'hub.lease_seconds': LEASE_SECONDS
+    }).encode()
+    opener = urllib.request.build_opener(*get_proxy_handlers())
+    try:
+        with opener.open(urllib.request.Request(feed.websub_hub, data=data), timeout=HUB_TIMEOUT) as response:
+            status = response.status
+        error = None if status in (202, 204) else f"HTTP {status}"
+    except urllib.error.HTTPError as e:
+        error = f"HTTP {e.code}"
+    except OSError as e:
+        error = str(e)
+
+    if error is None:
+        logging.info(f"Requested WebSub subscription for {feed.websub_topic} at {feed.websub_hub}")
+        return True
+    logging.warning(f"WebSub hub {feed.websub_hub} refused subscription for {feed.websub_topic}: {error}")
+    if feed.websub_state == 'pending':
+        feed.websub_state = 'failed'
+    db.session.commit()
+    return False
+
+def maintain_subscriptions(keep=None):
+    """Subscribe feeds that advertise a hub and renew leases about to end.
+
+    `keep` filters feeds by id, so sharded nodes only handle their own.
+    Returns the number of requests sent.
+    """
+    if not enabled():
+        return 0
+    feed_ids = db.session.scalars(select(RSSFeed.id).where(_due_filter(datetime.utcnow())).order_by(RSSFeed.id))
+    feed_ids = [feed_id for feed_id in feed_ids if keep is None or keep(feed_id)][:SUBSCRIBE_BATCH]
+    sent = 0
+    for feed_id in feed_ids:
+        feed = db.session.get(RSSFeed, feed_id)
+        try:
+            subscribe(feed)
+            sent += 1
+        except SQLAlchemyError as e:
+            db.session.rollback()
+            logging.error(f"Error recording WebSub subscription of feed {feed_id}: {str(e)}")
+    return sent
+
+def verify_intent(feed_id, args):
+    """Answer a hub's verification of a (un)subscription; returns (body, status)"""
+    mode = args.get('hub.mode')
+    topic = args.get('hub.topic')
+    challenge = args.get('hub.challenge')
+    feed = db.session.get(RSSFeed, feed_id)
+    if feed is not None and feed.deleted_at is not None:
+        feed = None
+
+    if mode == 'denied':
+        if feed is not None and topic == feed.websub_topic:
+            feed.websub_state = 'denied'
+            db.session.commit()
+            logging.warning(f"WebSub hub denied subscription for {topic}: {args.get('hub.reason')}")
+        return '', 200
+    if not challenge:
+        return '', 400
+
+    if mode == 'subscribe' and feed is not None and topic == feed.websub_topic \
+            and feed.websub_state in ('pending', 'subscribed'):
+        lease_seconds = args.get('hub.lease_seconds', type=int) or LEASE_SECONDS
+        feed.websub_state = 'subscribed'
+        feed.websub_lease_expires = datetime.utcnow() + timedelta(seconds=lease_seconds)
+        db.session.commit()
+        logging.info(f"WebSub subscription for {topic} verified, lease {lease_seconds}s")
+        return challenge, 200
+    if mode == 'unsubscribe' and (feed is None or topic != feed.websub_topic
+                                  or feed.websub_state not in ('pending', 'subscribed')):
+        # Subscriptions we no longer want, such as those of deleted feeds
+        return challenge, 200
+    return '', 404
+
+def valid_signature(feed, body, header):
+    """Whether X-Hub-Signature `header` is the HMAC of `body` with the feed's secret"""
+    if not feed.websub_secret or not header:
+        return False
+    method, _, digest = header.partition('=')
+    if method not in SIGNATURE_METHODS:
+        return False
+    expected = hmac.new(feed.websub_secret.encode(), body, getattr(hashlib, method)).hexdigest()
+    return hmac.compare_digest(expected, digest.strip().lower())